@@ -0,0 +1,155 @@
+#!/usr/bin/env python3
+
+# Benchmarks the host-side receive pipeline against the simulated FT232H in fake_ftd2xx.py, so
+# host throughput can be measured (and checked for regressions) without a board.
+#
+# Each benchmark pushes the same number of bytes through a different part of the pipeline and
+# reports its throughput. Benchmarks that validate the data also report how many discontinuities
+# they found, which should match the number of drops the fake device injected. (The capture
+# benchmarks can show one or two more injected than detected: the capture thread reads a little past
+# the end of the benchmark, and drops there are never looked at.)
+#
+# With --rate inf (the default), the device hands out data as fast as it's asked for, so the
+# figures measure the host alone. Give a finite --rate to see how the pipeline copes with a link
+# of that speed.
+
+import json
+import os
+import sys
+import tempfile
+from time import monotonic
+
+import fake_ftd2xx
+from ft232h_reader import FT232HReader, RingBuffer
+from ft232h_capture import CaptureEngine
+from ft232h_validate import StreamValidator
+from ft232h_record import CaptureRecorder
+
+def bench_read_exactly(dev, total, chunk_size):
+    reader = FT232HReader(dev, chunk_size)
+    reader.read_exactly(total)
+    return None
+
+def bench_read_validate(dev, total, chunk_size):
+    reader = FT232HReader(dev, chunk_size)
+    v = StreamValidator()
+    reader.read_exactly(total, on_chunk=v.feed)
+    return v
+
+def bench_ring(dev, total, chunk_size):
+    reader = FT232HReader(dev, chunk_size)
+    ring = RingBuffer(8 * chunk_size)
+    v = StreamValidator()
+    done = 0
+    while (done < total):
+        ring.fill(reader)
+        for view in ring.peek(total - done):
+            v.feed(view)
+            ring.consume(len(view))
+            done += len(view)
+    return v
+
+def bench_capture(dev, total, chunk_size):
+    v = StreamValidator()
+    with CaptureEngine(dev, buffer_size=chunk_size, num_buffers=16) as engine:
+        while (v.bytes_checked < total):
+            b = engine.get(timeout=1.0)
+            if (b is None): continue
+            v.feed(b.data[:total - v.bytes_checked], b.offset)
+            b.release()
+    return v
+
+def bench_capture_record(dev, total, chunk_size):
+    v = StreamValidator()
+    with tempfile.TemporaryDirectory() as tmp:
+        with CaptureRecorder(os.path.join(tmp, "capture.bin"), capacity=total) as recorder:
+            with CaptureEngine(dev, buffer_size=chunk_size, num_buffers=16) as engine:
+                while (v.bytes_checked < total):
+                    b = engine.get(timeout=1.0)
+                    if (b is None): continue
+                    data = b.data[:total - v.bytes_checked]
+                    recorder.append(data)
+                    v.feed(data, b.offset)
+                    b.release()
+    return v
+
+BENCHMARKS = {
+    "read_exactly": bench_read_exactly,
+    "read_validate": bench_read_validate,
+    "ring": bench_ring,
+    "capture": bench_capture,
+    "capture_record": bench_capture_record,
+}
+
+# Runs one benchmark on a fresh fake device. Returns a dict of results.
+def run(name, total, chunk_size, **device_kwargs) -> dict:
+    dev = fake_ftd2xx.FakeFT232H(**device_kwargs)
+    dev.setTimeouts(100, 100)
+    start = monotonic()
+    v = BENCHMARKS[name](dev, total, chunk_size)
+    seconds = monotonic() - start
+    dev.close()
+
+    result = {
+        "benchmark": name,
+        "bytes": total,
+        "seconds": seconds,
+        "mib_per_s": total / seconds / (1024 * 1024),
+        "injected_drops": dev.injected_drops,
+        "overflow_dropped_bytes": dev.overflow_dropped_bytes,
+    }
+    if (v is not None):
+        result["detected_errors"] = v.errors
+    return result
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks the FT232H host pipeline against a "
+                                                 "simulated device.")
+    parser.add_argument("benchmarks", type=str, nargs="*", default=list(BENCHMARKS),
+                        help=f"benchmarks to run (default: all of {', '.join(BENCHMARKS)})")
+    parser.add_argument("--mib", type=float, default=256,
+                        help="MiB to push through each benchmark")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024,
+                        help="bytes per device read")
+    parser.add_argument("--rate", type=str, default="inf",
+                        help="device data rate in bytes/s, or 'inf' for unlimited")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds of latency added to every device read")
+    parser.add_argument("--drop-rate", type=float, default=0.0,
+                        help="chance of injecting a gap into each device read")
+    parser.add_argument("--json", type=str, default=None, metavar="FILE",
+                        help="also write the results to FILE as JSON")
+    parser.add_argument("--min-mibps", type=float, default=None,
+                        help="exit with an error if any benchmark is slower than this")
+    args = parser.parse_args()
+
+    for name in args.benchmarks:
+        if (name not in BENCHMARKS):
+            parser.error(f"unknown benchmark {name}")
+
+    device_kwargs = dict(rate=None if (args.rate == "inf") else float(args.rate),
+                         latency=args.latency, drop_rate=args.drop_rate)
+    total = int(args.mib * 1024 * 1024)
+
+    results = []
+    print(f"{'benchmark':16} {'MiB/s':>10} {'seconds':>9} {'injected':>9} {'detected':>9}")
+    for name in args.benchmarks:
+        r = run(name, total, args.chunk_size, **device_kwargs)
+        results.append(r)
+        detected = r.get("detected_errors", "-")
+        print(f"{name:16} {r['mib_per_s']:10.01f} {r['seconds']:9.03f} {r['injected_drops']:9d} "
+              f"{detected:>9}")
+
+    if (args.json is not None):
+        with open(args.json, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    failed = False
+    if (args.min_mibps is not None):
+        for r in results:
+            if (r["mib_per_s"] < args.min_mibps):
+                print(f"{r['benchmark']} ran at {r['mib_per_s']:.01f} MiB/s, below {args.min_mibps}")
+                failed = True
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+
+# A stand-in for the ftd2xx module, for running the host-side tools without a board.
+#
+# The fake device behaves like an FT232H wired to synth/lattice_ecp5-evn/top.sv: the FPGA pushes
+# an incrementing byte pattern into its FIFO at a fixed rate, and whatever doesn't fit in the FIFOs
+# between it and the host while the host isn't reading is lost (the producer in top.sv doesn't
+# look at whether the FIFO is full). The host sees that as a gap in the pattern.
+#
+# On top of that, every read can be given a fixed latency, and drops can be injected at random to
+# check that the tools downstream notice them.
+#
+# Use it either by importing it in place of ftd2xx, or by calling install() (or setting the
+# FT232H_FAKE environment variable, which ft232h_reader.open_device() looks at) so that
+# 'import ftd2xx' picks it up.
+
+import collections
+import random
+import sys
+import threading
+from time import monotonic, sleep
+from types import SimpleNamespace
+
+# The FPGA's FIFO (ft232h_driver.sv's FIFO_DEPTH) plus the FT232H's own 1 KiB receive buffer
+DEFAULT_FIFO_BYTES = 2048 + 1024
+
+# The D2XX driver keeps pulling data off the chip into host memory between reads. How much it
+# holds before the chip's buffers start filling up isn't documented; this is a guess.
+DEFAULT_DRIVER_BUFFER_BYTES = 1024 * 1024
+
+# top.sv's comment says its dummy producer makes about 6 MB/s
+DEFAULT_RATE = 6e6
+
+defines = SimpleNamespace(
+    FLOW_NONE=0x0000,
+    FLOW_RTS_CTS=0x0100,
+    FLOW_DTR_DSR=0x0200,
+    FLOW_XON_XOFF=0x0400,
+    PURGE_RX=1,
+    PURGE_TX=2,
+)
+
+class DeviceError(Exception):
+    pass
+
+# Keyword arguments for every FakeFT232H made by open() / openEx(). Change them with configure().
+_settings = dict(serial=b'fsplit00')
+
+def configure(**kwargs) -> None:
+    _settings.update(kwargs)
+
+# Makes 'import ftd2xx' return this module
+def install() -> None:
+    sys.modules["ftd2xx"] = sys.modules[__name__]
+
+def listDevices(flags=0):
+    return [_settings["serial"]]
+
+def open(dev=0):
+    if (dev != 0):
+        raise DeviceError("DEVICE_NOT_FOUND")
+    return FakeFT232H(**_settings)
+
+def openEx(serial, flags=0):
+    if (serial != _settings["serial"]):
+        raise DeviceError("DEVICE_NOT_FOUND")
+    return FakeFT232H(**_settings)
+
+class FakeFT232H:
+    # rate        bytes per second that the FPGA produces, or None for "as fast as it's read"
+    # latency     seconds added to every read
+    # drop_rate   chance that a read has a gap of 1 to 'max_drop' bytes injected into it
+    # fifo_bytes  how much the FIFOs between the FPGA and the host hold, including the driver's
+    #             buffer in host memory
+    def __init__(self, serial=b'fsplit00', rate=DEFAULT_RATE, latency=0.0, drop_rate=0.0,
+                 max_drop=64, fifo_bytes=DEFAULT_FIFO_BYTES + DEFAULT_DRIVER_BUFFER_BYTES, seed=0,
+                 start=0):
+        self.serial = serial
+        self.rate = rate
+        self.latency = latency
+        self.drop_rate = drop_rate
+        self.max_drop = max_drop
+        self.fifo_bytes = fifo_bytes
+        self.read_timeout = 0.01
+        self.write_timeout = 0.01
+        self.usb_parameters = (4096, 4096)
+        self.flow_control = defines.FLOW_NONE
+        self.closed = False
+
+        # bytes that have been written to the device, with the time they were written
+        self.written = []
+
+        # how much data was lost, and why
+        self.overflow_dropped_bytes = 0
+        self.injected_drops = 0
+        self.injected_dropped_bytes = 0
+
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self._tile = bytes(range(256))
+        self._reset(start)
+
+    def _reset(self, start=0):
+        self._t0 = monotonic()
+        self._produced = 0
+
+        # what's waiting in the FIFOs, as [first pattern index, length] runs. A new run starts
+        # wherever bytes were lost.
+        self._fifo = collections.deque()
+        self._backlog = 0
+        self._next_index = start
+
+    def _check_open(self):
+        if (self.closed):
+            raise DeviceError("DEVICE_NOT_OPENED")
+
+    # Moves whatever the FPGA has produced since last time into the FIFOs
+    def _produce(self) -> None:
+        if (self.rate is None): return
+
+        total = int((monotonic() - self._t0) * self.rate)
+        new = total - self._produced
+        self._produced = total
+        if (new <= 0): return
+
+        accepted = min(new, self.fifo_bytes - self._backlog)
+        if (accepted > 0):
+            if ((len(self._fifo) != 0) and
+                ((self._fifo[-1][0] + self._fifo[-1][1]) == self._next_index)):
+                self._fifo[-1][1] += accepted
+            else:
+                self._fifo.append([self._next_index, accepted])
+            self._backlog += accepted
+        self._next_index += new
+        self.overflow_dropped_bytes += new - max(accepted, 0)
+
+    def _available(self) -> int:
+        return self._backlog if (self.rate is not None) else sys.maxsize
+
+    def _tile_slice(self, index: int, n: int):
+        start = index % 256
+        while (len(self._tile) < (start + n)):
+            self._tile = self._tile * 2
+        return self._tile[start:start + n]
+
+    # Takes up to 'n' bytes out of the FIFOs and writes them into 'view'
+    def _drain_into(self, view, n: int) -> int:
+        if (self.rate is None):
+            view[:n] = self._tile_slice(self._next_index, n)
+            self._next_index += n
+            return n
+
+        pos = 0
+        while ((pos < n) and (len(self._fifo) != 0)):
+            run = self._fifo[0]
+            k = min(n - pos, run[1])
+            view[pos:pos + k] = self._tile_slice(run[0], k)
+            pos += k
+            run[0] += k
+            run[1] -= k
+            if (run[1] == 0):
+                self._fifo.popleft()
+        self._backlog -= pos
+        return pos
+
+    def _inject_drop(self) -> None:
+        if ((self.drop_rate <= 0) or (self._random.random() >= self.drop_rate)):
+            return
+        k = self._random.randint(1, self.max_drop)
+        self.injected_drops += 1
+        if (self.rate is None):
+            self._next_index += k
+            self.injected_dropped_bytes += k
+            return
+        while ((k > 0) and (len(self._fifo) != 0)):
+            run = self._fifo[0]
+            d = min(k, run[1])
+            run[0] += d
+            run[1] -= d
+            self._backlog -= d
+            self.injected_dropped_bytes += d
+            k -= d
+            if (run[1] == 0):
+                self._fifo.popleft()
+
+    # Like FT_Read: waits until 'len(view)' bytes are there or the read timeout runs out, then
+    # returns however many bytes it got.
+    def readinto(self, view) -> int:
+        self._check_open()
+        n = len(view)
+        if (self.latency > 0):
+            sleep(self.latency)
+
+        deadline = monotonic() + self.read_timeout
+        with self._lock:
+            self._produce()
+            while ((self._available() < n) and (monotonic() < deadline)):
+                wait = min(deadline - monotonic(), (n - self._available()) / self.rate)
+                self._lock.release()
+                try:
+                    sleep(max(wait, 0))
+                finally:
+                    self._lock.acquire()
+                self._produce()
+
+            self._inject_drop()
+            return self._drain_into(view, min(n, self._available()))
+
+    def read(self, nchars, raw=True):
+        buf = bytearray(nchars)
+        n = self.readinto(memoryview(buf))
+        return bytes(buf[:n])
+
+    def write(self, data) -> int:
+        self._check_open()
+        self.written.append((monotonic(), bytes(data)))
+        return len(data)
+
+    def getQueueStatus(self) -> int:
+        with self._lock:
+            self._produce()
+            return min(self._available(), 0xffffffff)
+
+    # Like D2XX, only the buffers named in 'mask' are purged, so mask 0 purges nothing. Writes go
+    # straight to 'written', so there's never anything for PURGE_TX to drop.
+    def purge(self, mask=0) -> None:
+        with self._lock:
+            if (mask & defines.PURGE_RX):
+                self._produce()
+                self._fifo.clear()
+                self._backlog = 0
+
+    def resetDevice(self) -> None:
+        self._check_open()
+        with self._lock:
+            self._reset(self._next_index)
+
+    def setBitMode(self, mask, enable) -> None:
+        self._check_open()
+
+    def setTimeouts(self, read, write) -> None:
+        self.read_timeout = read / 1000
+        self.write_timeout = write / 1000
+
+    def setUSBParameters(self, in_tx_size, out_tx_size=0) -> None:
+        self.usb_parameters = (in_tx_size, out_tx_size)
+
+    def setFlowControl(self, flow, xon=-1, xoff=-1) -> None:
+        self.flow_control = flow
+
+    def setLatencyTimer(self, latency) -> None:
+        pass
+
+    def close(self) -> None:
+        self.closed = True
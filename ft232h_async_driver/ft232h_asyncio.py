@@ -0,0 +1,207 @@
+#!/usr/bin/env python3
+
+# asyncio interface to the FT232H link.
+#
+# The ftd2xx calls block, so they run on executor threads: one thread that does nothing but read,
+# and another for writes, so commands go out while a read is waiting for data. Nothing polls; the
+# event loop just awaits the executor.
+#
+# Every chunk read is handed to every open stream() in its own queue, so several consumers (say a
+# capture task and a control task) can watch the same data. A consumer that falls behind only
+# affects itself: when its queue is full, chunks are dropped for it and counted in its 'dropped'
+# and 'dropped_bytes'. Streams opened with block=True make the reader wait for them instead, which
+# means nothing is lost on the host but the device stops being drained while they catch up.
+#
+#     async with FT232HLink(open_device()) as link:
+#         async for chunk in link.stream():
+#             ...
+#             await link.send(b'\x01')
+
+import asyncio
+import concurrent.futures
+from time import monotonic
+
+import numpy as np
+
+from ft232h_reader import FT232HReader
+
+# One read's worth of data. 'data' is a read-only memoryview that every stream shares.
+class LinkChunk:
+    def __init__(self, offset: int, timestamp: float, data):
+        self.offset = offset
+        self.timestamp = timestamp
+        self.data = data
+
+    @property
+    def array(self):
+        return np.frombuffer(self.data, dtype=np.uint8)
+
+# What stream() returns: an async iterator over LinkChunks that ends when the link is closed (or
+# when close() is called on it).
+class LinkStream:
+    def __init__(self, link, maxsize: int, block: bool):
+        self._link = link
+        self.maxsize = maxsize
+        self.block = block
+        self.dropped = 0
+        self.dropped_bytes = 0
+
+        # set by close(); nothing's taking chunks out of the queue any more, so none go in
+        self._closed = False
+
+        # The queue itself is unbounded so that the end of the stream can always be queued;
+        # 'maxsize' is enforced in _put(). '_space' is set whenever a chunk is taken out.
+        self._queue = asyncio.Queue()
+        self._space = asyncio.Event()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self) -> LinkChunk:
+        item = await self._queue.get()
+        self._space.set()
+        if (item is None):
+            raise StopAsyncIteration
+        if (isinstance(item, Exception)):
+            raise item
+        return item
+
+    async def _put(self, chunk: LinkChunk) -> None:
+        if (self._closed): return
+        if (self.block):
+            while ((self._queue.qsize() >= self.maxsize) and (not self._link._closing)):
+                self._space.clear()
+                await self._space.wait()
+                if (self._closed): return
+        elif (self._queue.qsize() >= self.maxsize):
+            self.dropped += 1
+            self.dropped_bytes += len(chunk.data)
+            return
+        self._queue.put_nowait(chunk)
+
+    # Ends the stream after whatever's already queued. 'item' is what the consumer gets at the
+    # end: None to stop iterating, or an exception to raise.
+    def _end(self, item=None) -> None:
+        self._queue.put_nowait(item)
+        self._space.set()
+
+    # Stops this stream. Closing the link closes every stream. The reader stops waiting on a full
+    # blocking stream as soon as it's closed.
+    def close(self) -> None:
+        self._closed = True
+        self._link._streams.discard(self)
+        self._end()
+
+class FT232HLink:
+    # 'chunk_size' is the most that's read at once. Each read gets a fresh buffer of that size, so
+    # chunks can be held onto for as long as you like.
+    def __init__(self, dev, chunk_size: int = 64 * 1024):
+        self.reader = dev if isinstance(dev, FT232HReader) else FT232HReader(dev, chunk_size)
+        self.chunk_size = chunk_size
+        self.offset = 0
+        self._streams = set()
+        self._read_executor = None
+        self._write_executor = None
+        self._task = None
+        self._closing = False
+
+    async def __aenter__(self):
+        self.start()
+        return self
+
+    async def __aexit__(self, *exc):
+        await self.close()
+
+    def start(self) -> None:
+        self._closing = False
+        self._read_executor = concurrent.futures.ThreadPoolExecutor(1, "ft232h-read")
+        self._write_executor = concurrent.futures.ThreadPoolExecutor(1, "ft232h-write")
+        self._task = asyncio.get_running_loop().create_task(self._pump())
+
+    # Stops reading and ends every stream. Waits for a read that's in progress to finish, which
+    # takes at most the device's read timeout.
+    async def close(self) -> None:
+        self._closing = True
+        for s in self._streams:
+            s._space.set()
+        if (self._task is not None):
+            await self._task
+            self._task = None
+        for s in list(self._streams):
+            s.close()
+        self._read_executor.shutdown()
+        self._write_executor.shutdown()
+
+    # Starts a new stream of everything read from now on. Up to 'maxsize' chunks wait in its queue.
+    def stream(self, maxsize: int = 64, block: bool = False) -> LinkStream:
+        s = LinkStream(self, maxsize, block)
+        self._streams.add(s)
+        return s
+
+    # Writes 'data' to the device. Sends happen one at a time, in the order they were awaited.
+    async def send(self, data) -> int:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._write_executor, self.reader.dev.write, bytes(data))
+
+    def _read_chunk(self):
+        buf = bytearray(self.chunk_size)
+        n = self.reader.readinto(memoryview(buf))
+        return buf, n
+
+    async def _pump(self) -> None:
+        loop = asyncio.get_running_loop()
+        try:
+            while (not self._closing):
+                buf, n = await loop.run_in_executor(self._read_executor, self._read_chunk)
+                if (n == 0): continue
+                chunk = LinkChunk(self.offset, monotonic(), memoryview(buf)[:n].toreadonly())
+                self.offset += n
+                for s in list(self._streams):
+                    await s._put(chunk)
+        except Exception as e:
+            for s in list(self._streams):
+                self._streams.discard(s)
+                s._end(e)
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Streams from the FT232H through the asyncio "
+                                                 "interface, checking the data in one task while "
+                                                 "another sends control bytes.")
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--chunk-size", type=int, default=64 * 1024)
+    args = parser.parse_args()
+
+    from ft232h_reader import open_device
+    from ft232h_validate import StreamValidator
+
+    async def check(link, validator):
+        s = link.stream(block=True)
+        async for chunk in s:
+            validator.feed(chunk.data, chunk.offset)
+
+    async def control(link):
+        s = link.stream()
+        count = 0
+        async for chunk in s:
+            await link.send(bytes([count & 0x7f]))
+            count += 1
+        return s
+
+    async def main():
+        ftdev = open_device()
+        validator = StreamValidator()
+        async with FT232HLink(ftdev, args.chunk_size) as link:
+            tasks = [asyncio.create_task(check(link, validator)),
+                     asyncio.create_task(control(link))]
+            await asyncio.sleep(args.seconds)
+        _, s = await asyncio.gather(*tasks)
+        ftdev.close()
+
+        mib = link.offset / (1024 * 1024)
+        print(f"read {mib:.02f} MiB in {args.seconds} s ({mib / args.seconds:.02f} MiB/s); control "
+              f"stream dropped {s.dropped} chunks")
+        print(validator.summary())
+
+    asyncio.run(main())
@@ -0,0 +1,285 @@
+#!/usr/bin/env python3
+
+# Continuous capture from the FT232H.
+#
+# A dedicated thread does nothing but read from the device into a pool of preallocated buffers,
+# and hands each filled buffer to consumers through a bounded queue. Consumers can take their time
+# (print, validate, write to disk, send control bytes) without the host ever stopping draining the
+# FT232H's FIFO, as long as they keep up on average.
+#
+# If consumers fall behind, the pool runs out of free buffers. What happens then depends on the
+# overflow policy:
+#   "block" - the reader thread waits for a buffer to be released. Nothing is lost on the host,
+#             but the FT232H's FIFO (and the FPGA's FIFO behind it) stops being drained.
+#   "drop"  - the reader thread keeps draining the device into a scratch buffer and throws that
+#             data away, counting how much.
+# Either way, the stats say how often it happened.
+
+import queue
+import threading
+from time import monotonic
+
+import numpy as np
+
+from ft232h_reader import FT232HReader
+
+# One filled buffer. Call release() when done with it so the reader thread can reuse it.
+class CaptureBuffer:
+    def __init__(self, engine, index: int, buf: bytearray):
+        self._engine = engine
+        self.index = index
+        self.buf = buf
+        self.length = 0
+
+        # set while the buffer is in the free pool
+        self._released = True
+
+        # position of the first byte in the whole capture, and when the buffer was handed over
+        self.offset = 0
+        self.timestamp = 0.0
+
+    # memoryview of the valid data
+    @property
+    def data(self):
+        return memoryview(self.buf)[:self.length]
+
+    # numpy view of the valid data; shares memory with the buffer
+    @property
+    def array(self):
+        return np.frombuffer(self.buf, dtype=np.uint8, count=self.length)
+
+    # Releasing a buffer that's already been released does nothing. Putting it in the free pool
+    # twice would have two reads fill the same memory.
+    def release(self) -> None:
+        if (self._released): return
+        self._released = True
+        self._engine._free.put(self)
+
+class CaptureStats:
+    def __init__(self):
+        self.bytes_read = 0
+        self.reads = 0
+        self.empty_reads = 0
+        self.buffers_delivered = 0
+
+        # how many times the reader found no free buffer, and how long it waited for one in total
+        # ("block" policy)
+        self.backpressure_events = 0
+        self.backpressure_seconds = 0.0
+
+        # data thrown away because no buffer was free ("drop" policy)
+        self.overflows = 0
+        self.dropped_bytes = 0
+
+        # most buffers that were ever waiting in the queue at once
+        self.queue_high_water = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+class CaptureEngine:
+    # 'buffer_size' bytes go in each buffer; 'num_buffers' of them are allocated up front. A buffer
+    # is handed over when it's full, or when a read comes back short so that the data doesn't sit
+    # around while the link is idle.
+    def __init__(self, dev, buffer_size=1024 * 1024, num_buffers=16, policy="block",
+                 chunk_size=None):
+        if (policy not in ("block", "drop")):
+            raise ValueError(f"unknown overflow policy {policy}")
+
+        self.reader = dev if isinstance(dev, FT232HReader) else FT232HReader(dev)
+        if (chunk_size is not None):
+            self.reader.chunk_size = chunk_size
+        self.policy = policy
+        self.buffer_size = buffer_size
+        self.stats = CaptureStats()
+
+        self._buffers = [CaptureBuffer(self, i, bytearray(buffer_size)) for i in range(num_buffers)]
+        self._free = queue.Queue()
+        for b in self._buffers:
+            self._free.put(b)
+        self._filled = queue.Queue(maxsize=num_buffers)
+        self._scratch = memoryview(bytearray(min(buffer_size, self.reader.chunk_size)))
+
+        self._stop = threading.Event()
+        self._thread = None
+        self._write_lock = threading.Lock()
+        self._error = None
+        self._offset = 0
+
+    def start(self) -> None:
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="ft232h-capture", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if (self._thread is not None):
+            self._thread.join()
+            self._thread = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    @property
+    def running(self) -> bool:
+        return (self._thread is not None) and self._thread.is_alive()
+
+    # Returns the next filled buffer, or None if none arrives within 'timeout' seconds. Raises
+    # whatever the reader thread died with, if it did.
+    def get(self, timeout=None):
+        try:
+            return self._filled.get(timeout=timeout)
+        except queue.Empty:
+            if (self._error is not None):
+                raise self._error
+            return None
+
+    # Sends bytes to the device, e.g. control bytes for the FPGA. Safe to call from any thread.
+    def write(self, data) -> int:
+        with self._write_lock:
+            return self.reader.dev.write(bytes(data))
+
+    # Takes a free buffer, waiting for one under the "block" policy. Returns None if there isn't
+    # one under the "drop" policy, or if the engine is stopping.
+    def _take_buffer(self):
+        try:
+            return self._free.get_nowait()
+        except queue.Empty:
+            pass
+
+        self.stats.backpressure_events += 1
+        if (self.policy == "drop"):
+            return None
+
+        t = monotonic()
+        while (not self._stop.is_set()):
+            try:
+                b = self._free.get(timeout=0.01)
+                self.stats.backpressure_seconds += monotonic() - t
+                return b
+            except queue.Empty:
+                pass
+        self.stats.backpressure_seconds += monotonic() - t
+        return None
+
+    def _deliver(self, b) -> None:
+        b.offset = self._offset
+        b.timestamp = monotonic()
+        self._offset += b.length
+        self.stats.buffers_delivered += 1
+        self._filled.put(b)
+        self.stats.queue_high_water = max(self.stats.queue_high_water, self._filled.qsize())
+
+    def _read(self, view) -> int:
+        n = self.reader.readinto(view)
+        self.stats.reads += 1
+        self.stats.bytes_read += n
+        if (n == 0):
+            self.stats.empty_reads += 1
+        return n
+
+    def _run(self) -> None:
+        try:
+            while (not self._stop.is_set()):
+                b = self._take_buffer()
+                if (b is None):
+                    if (self._stop.is_set()): break
+
+                    # no room: keep draining the device and count what's lost
+                    n = self._read(self._scratch)
+                    if (n != 0):
+                        self.stats.overflows += 1
+                        self.stats.dropped_bytes += n
+                        self._offset += n
+                    continue
+
+                b._released = False
+                view = memoryview(b.buf)
+                b.length = 0
+                while ((b.length < self.buffer_size) and (not self._stop.is_set())):
+                    want = min(self.reader.chunk_size, self.buffer_size - b.length)
+                    n = self._read(view[b.length:b.length + want])
+                    b.length += n
+                    if (n < want): break
+
+                if (b.length == 0):
+                    b.release()
+                else:
+                    self._deliver(b)
+        except Exception as e:
+            self._error = e
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Continuously captures from the FT232H and "
+                                                 "reports throughput and backpressure.")
+    parser.add_argument("--seconds", type=float, default=None,
+                        help="stop after this long (default: run until ctrl-c)")
+    parser.add_argument("--buffer-size", type=int, default=1024 * 1024)
+    parser.add_argument("--num-buffers", type=int, default=16)
+    parser.add_argument("--policy", type=str, default="block", choices=("block", "drop"))
+    parser.add_argument("--validate", action="store_true",
+                        help="check that the data is the test designs' incrementing pattern")
+    parser.add_argument("--record", type=str, default=None, metavar="FILE",
+                        help="record the capture to FILE (see ft232h_record.py)")
+    parser.add_argument("--stats", type=str, default=None, metavar="FILE",
+                        help="time every read and write and save the results to FILE (.json for "
+                             "a summary, .csv for a per-read log)")
+    args = parser.parse_args()
+
+    from ft232h_reader import open_device
+    from ft232h_validate import StreamValidator
+    ftdev = open_device()
+    if (args.stats is not None):
+        from ft232h_stats import InstrumentedDevice
+        ftdev = InstrumentedDevice(ftdev)
+    validator = StreamValidator() if args.validate else None
+
+    recorder = None
+    if (args.record is not None):
+        from ft232h_record import CaptureRecorder
+        recorder = CaptureRecorder(args.record)
+    engine = CaptureEngine(ftdev, args.buffer_size, args.num_buffers, args.policy)
+
+    start = monotonic()
+    last_report = start
+    last_bytes = 0
+    try:
+        with engine:
+            while ((args.seconds is None) or ((monotonic() - start) < args.seconds)):
+                b = engine.get(timeout=0.1)
+                if (b is not None):
+                    if (validator is not None):
+                        validator.feed(b.data, b.offset)
+                    if (recorder is not None):
+                        recorder.append(b.data)
+                    b.release()
+
+                now = monotonic()
+                if ((now - last_report) >= 1.0):
+                    s = engine.stats
+                    rate = (s.bytes_read - last_bytes) / (now - last_report) / (1024 * 1024)
+                    print(f"{rate:8.02f} MiB/s  {s.bytes_read / (1024 * 1024):10.01f} MiB total  "
+                          f"backpressure {s.backpressure_events} ({s.backpressure_seconds:.3f} s)  "
+                          f"overflows {s.overflows} ({s.dropped_bytes} bytes)  "
+                          f"queue high water {s.queue_high_water}" +
+                          ("" if (validator is None) else f"  errors {validator.errors}"))
+                    last_report = now
+                    last_bytes = s.bytes_read
+    except KeyboardInterrupt:
+        pass
+    finally:
+        ftdev.close()
+        if (recorder is not None):
+            recorder.close()
+
+    if (args.stats is not None):
+        print(ftdev.summary())
+        ftdev.save(args.stats)
+    if (validator is not None):
+        print(validator.summary())
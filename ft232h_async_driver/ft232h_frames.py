@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+
+# Framed packets over the FT232H byte stream.
+#
+# The link itself carries bare bytes. Designs that want to send tagged records (e.g. i2c_controller's
+# read_tag_o / read_data_o) wrap each one in a frame:
+#
+#     0xa5 0x5a  tag  length  payload (length bytes)  checksum
+#
+# where the checksum is the low 8 bits of the sum of tag, length and the payload bytes.
+#
+# FrameDecoder works on whole chunks with numpy: it finds every sync word in the chunk, checks
+# every candidate frame's checksum at once from a prefix sum, and then picks frames the way a
+# byte-at-a-time decoder would (the first good frame, then the first good frame at or after where
+# that one ends, and so on) by pointer doubling, so the Python work per chunk is logarithmic in
+# the number of frames rather than linear in the number of bytes. Anything between accepted frames
+# is counted as skipped; that's how corruption shows up, and decoding picks up again at the next
+# good frame. A frame cut off at the end of a chunk is carried over to the next one.
+
+from time import monotonic
+
+import numpy as np
+
+SYNC = b"\xa5\x5a"
+HEADER_BYTES = 4
+OVERHEAD_BYTES = HEADER_BYTES + 1
+MAX_PAYLOAD = 255
+
+# Builds the bytes of one frame
+def encode_frame(tag: int, payload: bytes) -> bytes:
+    if (len(payload) > MAX_PAYLOAD):
+        raise ValueError(f"payload is {len(payload)} bytes; frames hold at most {MAX_PAYLOAD}")
+    checksum = (tag + len(payload) + sum(payload)) & 0xff
+    return SYNC + bytes([tag, len(payload)]) + bytes(payload) + bytes([checksum])
+
+# The frames decoded from one chunk. Frame i has tag tags[i], starts at stream offset offsets[i]
+# and its payload is payload[payload_starts[i]:payload_starts[i + 1]].
+class FrameBatch:
+    def __init__(self, offsets, tags, lengths, payload):
+        self.offsets = offsets
+        self.tags = tags
+        self.lengths = lengths
+        self.payload = payload
+        self.payload_starts = np.concatenate(([0], np.cumsum(lengths)))
+
+    def __len__(self):
+        return len(self.tags)
+
+    def payload_of(self, i: int):
+        return self.payload[self.payload_starts[i]:self.payload_starts[i + 1]]
+
+    # Returns a FrameBatch of just the frames with tag 'tag'
+    def select(self, tag: int):
+        keep = (self.tags == tag)
+        return FrameBatch(self.offsets[keep], self.tags[keep], self.lengths[keep],
+                          self.payload[np.repeat(keep, self.lengths)])
+
+class FrameDecoder:
+    def __init__(self):
+        self._carry = np.zeros(0, dtype=np.uint8)
+        self._base = 0
+        self._start_time = None
+        self._last_time = None
+
+        self.bytes_in = 0
+        self.frames = 0
+
+        # bytes that weren't part of any good frame, the number of stretches of them, and how many
+        # of the sync words in them started a frame with a bad checksum
+        self.skipped_bytes = 0
+        self.resyncs = 0
+        self.bad_checksums = 0
+
+        # frames and payload bytes seen for each tag
+        self.frames_per_tag = np.zeros(256, dtype=np.int64)
+        self.bytes_per_tag = np.zeros(256, dtype=np.int64)
+
+    # Decodes one chunk (anything with the buffer protocol). Returns a FrameBatch of every frame
+    # that was completed by it. 'final' says that no more data is coming, so frames that are cut
+    # off are given up on rather than carried over.
+    def feed(self, chunk, final: bool = False) -> FrameBatch:
+        now = monotonic()
+        if (self._start_time is None): self._start_time = now
+        self._last_time = now
+
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        self.bytes_in += len(data)
+        buf = np.concatenate((self._carry, data)) if (len(self._carry) != 0) else data
+        n = len(buf)
+
+        # every sync word, and whether the frame it starts fits in the buffer
+        pos = np.flatnonzero((buf[:-1] == SYNC[0]) & (buf[1:] == SYNC[1]))
+        has_header = (pos + HEADER_BYTES) <= n
+        lengths = np.zeros(len(pos), dtype=np.int64)
+        lengths[has_header] = buf[pos[has_header] + 3]
+        ends = pos + OVERHEAD_BYTES + lengths
+        complete = has_header & (ends <= n)
+
+        # Only frames before the first one that doesn't fit can be decided now; everything from
+        # there on waits for more data.
+        incomplete = np.flatnonzero(~complete)
+        cutoff = int(pos[incomplete[0]]) if ((len(incomplete) != 0) and (not final)) else n
+        decidable = complete & (pos < cutoff)
+        pos, lengths, ends = pos[decidable], lengths[decidable], ends[decidable]
+
+        # checksums of every candidate at once
+        prefix = np.concatenate(([0], np.cumsum(buf, dtype=np.int64)))
+        sums = prefix[ends - 1] - prefix[pos + 2]
+        good = (sums & 0xff) == buf[ends - 1]
+
+        accepted = self._chain(pos[good], ends[good])
+        f_pos, f_len, f_end = pos[good][accepted], lengths[good][accepted], ends[good][accepted]
+
+        # where to pick up next time
+        last_end = int(f_end[-1]) if (len(f_end) != 0) else 0
+        if (final):
+            keep_from = n
+        elif (cutoff < n):
+            keep_from = max(cutoff, last_end)
+        else:
+            keep_from = max(last_end, n - 1) if ((n != 0) and (buf[-1] == SYNC[0])) else n
+            keep_from = max(keep_from, last_end)
+
+        self._count_skipped(f_pos, f_end, keep_from, pos[~good])
+
+        # gather the payloads: payload bytes of frame i are buf[f_pos[i] + 4 : f_end[i] - 1]
+        total = int(f_len.sum())
+        starts = np.cumsum(f_len) - f_len
+        index = np.repeat(f_pos + HEADER_BYTES - starts, f_len) + np.arange(total)
+        tags = buf[f_pos + 2]
+        batch = FrameBatch(self._base + f_pos, tags, f_len, buf[index])
+
+        self.frames += len(f_pos)
+        self.frames_per_tag += np.bincount(tags, minlength=256)
+        self.bytes_per_tag += np.bincount(tags, weights=f_len, minlength=256).astype(np.int64)
+
+        self._carry = buf[keep_from:].copy()
+        self._base += keep_from
+        return batch
+
+    # Decodes whatever is still waiting at the end of the stream
+    def flush(self) -> FrameBatch:
+        return self.feed(b"", final=True)
+
+    # Given the good frames' starts and ends in order, returns the indices of the ones a
+    # sequential decoder would take: frame 0, then the first frame starting at or after its end,
+    # and so on. jump[i] starts out as frame i's successor and is squared every step, so the whole
+    # chain from frame 0 is marked in log2(frames) numpy steps.
+    @staticmethod
+    def _chain(starts, ends):
+        count = len(starts)
+        if (count == 0):
+            return np.zeros(0, dtype=np.int64)
+        jump = np.append(np.searchsorted(starts, ends, side="left"), count)
+        on = np.zeros(count + 1, dtype=bool)
+        on[0] = True
+        while True:
+            reached = jump[on]
+            if (np.all(reached == count)): break
+            on[reached] = True
+            jump = jump[jump]
+        return np.flatnonzero(on[:count])
+
+    def _count_skipped(self, f_pos, f_end, keep_from, bad_pos) -> None:
+        # gaps before, between and after the accepted frames
+        gap_starts = np.concatenate(([0], f_end))
+        gap_ends = np.concatenate((f_pos, [keep_from]))
+        gaps = gap_ends - gap_starts
+        gaps = gaps[gaps > 0]
+        self.skipped_bytes += int(gaps.sum())
+        self.resyncs += len(gaps)
+
+        # bad frames that aren't just sync-lookalikes inside a good frame's payload
+        i = np.searchsorted(f_pos, bad_pos, side="right") - 1
+        inside = (i >= 0) & (bad_pos < f_end[np.maximum(i, 0)]) if (len(f_pos) != 0) else False
+        self.bad_checksums += int(np.count_nonzero(~inside & (bad_pos < keep_from)))
+
+    @property
+    def seconds(self) -> float:
+        return (self._last_time - self._start_time) if (self._start_time is not None) else 0.0
+
+    def as_dict(self) -> dict:
+        seconds = self.seconds
+        per_tag = {}
+        for t in np.flatnonzero(self.frames_per_tag):
+            per_tag[int(t)] = {
+                "frames": int(self.frames_per_tag[t]),
+                "payload_bytes": int(self.bytes_per_tag[t]),
+                "payload_bytes_per_s": (self.bytes_per_tag[t] / seconds) if (seconds > 0) else 0.0,
+            }
+        return {
+            "bytes_in": self.bytes_in,
+            "frames": self.frames,
+            "skipped_bytes": self.skipped_bytes,
+            "resyncs": self.resyncs,
+            "bad_checksums": self.bad_checksums,
+            "seconds": seconds,
+            "tags": per_tag,
+        }
+
+    def summary(self) -> str:
+        seconds = self.seconds
+        lines = [f"{self.frames} frames in {self.bytes_in} bytes; {self.skipped_bytes} bytes "
+                 f"skipped in {self.resyncs} places, {self.bad_checksums} bad checksums"]
+        for t in np.flatnonzero(self.frames_per_tag):
+            rate = (self.bytes_per_tag[t] / seconds / 1024) if (seconds > 0) else 0.0
+            lines.append(f"   tag {t:3d}: {self.frames_per_tag[t]:10d} frames, "
+                         f"{self.bytes_per_tag[t]:12d} payload bytes ({rate:.01f} KiB/s)")
+        return "\n".join(lines)
+
+# Makes a test stream of 'count' frames with random tags (below 'tags') and payloads, then
+# corrupts bytes at random with probability 'corrupt_rate'
+def synthetic_stream(count: int, tags: int = 8, max_payload: int = 16, corrupt_rate: float = 0.0,
+                     seed: int = 0) -> bytes:
+    rng = np.random.default_rng(seed)
+    lengths = rng.integers(0, max_payload + 1, count)
+    frame_tags = rng.integers(0, tags, count)
+    body = rng.integers(0, 256, int(lengths.sum()), dtype=np.uint8).tobytes()
+    out = bytearray()
+    pos = 0
+    for t, l in zip(frame_tags.tolist(), lengths.tolist()):
+        out += encode_frame(t, body[pos:pos + l])
+        pos += l
+
+    if (corrupt_rate > 0):
+        data = np.frombuffer(out, dtype=np.uint8).copy()
+        hit = rng.random(len(data)) < corrupt_rate
+        data[hit] = rng.integers(0, 256, int(hit.sum()), dtype=np.uint8)
+        return data.tobytes()
+    return bytes(out)
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decodes framed packets from a recorded FT232H "
+                                                 "capture (see ft232h_record.py), or from a "
+                                                 "synthetic stream to measure the decoder.")
+    parser.add_argument("recording", type=str, nargs="?", default=None)
+    parser.add_argument("--synthetic", type=int, default=None, metavar="FRAMES",
+                        help="decode this many randomly generated frames instead of a recording")
+    parser.add_argument("--corrupt-rate", type=float, default=0.0,
+                        help="chance of corrupting each byte of the synthetic stream")
+    parser.add_argument("--chunk-size", type=int, default=1024 * 1024,
+                        help="bytes per chunk for the synthetic stream")
+    args = parser.parse_args()
+
+    decoder = FrameDecoder()
+    start = monotonic()
+    if (args.synthetic is not None):
+        stream = synthetic_stream(args.synthetic, corrupt_rate=args.corrupt_rate)
+        start = monotonic()
+        for i in range(0, len(stream), args.chunk_size):
+            decoder.feed(stream[i:i + args.chunk_size])
+        decoder.flush()
+    elif (args.recording is not None):
+        from ft232h_record import CaptureReplay
+        with CaptureReplay(args.recording) as r:
+            for offset, timestamp, view in r.iter_chunks():
+                decoder.feed(view)
+        decoder.flush()
+    else:
+        parser.error("give a recording or --synthetic")
+    elapsed = monotonic() - start
+
+    print(decoder.summary())
+    print(f"decoded {decoder.bytes_in / (1024 * 1024):.02f} MiB in {elapsed:.3f} s "
+          f"({decoder.bytes_in / elapsed / (1024 * 1024):.01f} MiB/s)")
@@ -0,0 +1,198 @@
+#!/usr/bin/env python3
+
+# Reusable receive path for the FT232H in async FIFO mode.
+#
+# Data read off the device goes straight into preallocated buffers through memoryviews, so a
+# capture never turns into a list of chunks or a Python int per byte. Where the ftd2xx wrapper
+# allows it, FT_Read writes directly into the destination buffer; otherwise each read is copied in
+# once.
+#
+# The buffers are plain bytearrays. numpy.frombuffer() wraps them without copying, which is how
+# the rest of the tools look at captured data.
+
+import ctypes
+import os
+import sys
+
+import numpy as np
+
+DEFAULT_DEVICE_NAME = b'fsplit00'
+
+# ftd2xx flow control settings, by the names the tools take on the command line
+FLOW_CONTROL = {
+    "none": "FLOW_NONE",
+    "rts_cts": "FLOW_RTS_CTS",
+    "dtr_dsr": "FLOW_DTR_DSR",
+    "xon_xoff": "FLOW_XON_XOFF",
+}
+
+# The ftd2xx module, or fake_ftd2xx.py if the FT232H_FAKE environment variable is set
+def ftd2xx_module():
+    if (os.environ.get("FT232H_FAKE")):
+        import fake_ftd2xx as ft
+    else:
+        import ftd2xx as ft
+    return ft
+
+# Opens the FT232H named 'name' and sets it up for async FIFO reads, the same way for every tool.
+# If the FT232H_FAKE environment variable is set, a simulated device from fake_ftd2xx.py is opened
+# instead.
+def open_device(name=DEFAULT_DEVICE_NAME, rx_buffer=64 * 1024, tx_buffer=64 * 1024,
+                read_timeout_ms=10, write_timeout_ms=10, flow_control="rts_cts", verbose=True):
+    ft = ftd2xx_module()
+
+    devlist = ft.listDevices()
+    if (verbose): print(devlist)
+    try:
+        ftdev_id = devlist.index(name)
+    except (ValueError, AttributeError):
+        raise Exception("No board found!")
+    if (verbose): print(f"ftdev id is {ftdev_id}")
+
+    if (verbose): print("opening device")
+    ftdev = ft.open(ftdev_id)
+    if (verbose): print("resetting device")
+    ftdev.resetDevice()
+
+    if (verbose): print("setting modes")
+    ftdev.setBitMode(0xff, 0x00)
+    ftdev.setTimeouts(read_timeout_ms, write_timeout_ms)
+    ftdev.setUSBParameters(rx_buffer, tx_buffer)
+    ftdev.setFlowControl(getattr(ft.defines, FLOW_CONTROL[flow_control]), 0, 0)
+    return ftdev
+
+# Finds the fastest way to read from 'dev' into a buffer. Returns a function that takes a writable
+# memoryview and returns how many bytes it read into it.
+def pick_readinto(dev):
+    if (hasattr(dev, "readinto")):
+        return dev.readinto
+
+    # ftd2xx's read() makes a ctypes buffer and then copies it into a bytes object. Calling
+    # FT_Read ourselves lets it fill our buffer directly.
+    module = sys.modules.get(type(dev).__module__)
+    ft = getattr(module, "_ft", None)
+    if ((ft is not None) and hasattr(ft, "FT_Read") and hasattr(dev, "handle")):
+        def readinto(view):
+            n = ctypes.c_ulong()
+            buf = (ctypes.c_char * len(view)).from_buffer(view)
+            status = ft.FT_Read(dev.handle, buf, len(view), ctypes.byref(n))
+            if (status != 0):
+                raise IOError(f"FT_Read failed with status {status}")
+            return n.value
+        return readinto
+
+    def readinto(view):
+        chunk = dev.read(len(view))
+        view[:len(chunk)] = chunk
+        return len(chunk)
+    return readinto
+
+# Wraps an opened device and reads from it into caller-provided buffers.
+#
+# The device can be an ftd2xx device, or anything with a read(n) method that returns bytes. If it
+# has a readinto(view) method, that's used instead.
+class FT232HReader:
+    def __init__(self, dev, chunk_size=1024 * 1024):
+        self.dev = dev
+        self.chunk_size = chunk_size
+        self.bytes_read = 0
+        self.reads = 0
+        self._readinto = pick_readinto(dev)
+
+    # Does one read from the device into 'view', which must be a writable memoryview of bytes.
+    # At most chunk_size bytes are read. Returns the number of bytes read, which can be 0 if the
+    # read timed out.
+    def readinto(self, view) -> int:
+        if (len(view) > self.chunk_size):
+            view = view[:self.chunk_size]
+        n = self._readinto(view)
+        self.bytes_read += n
+        self.reads += 1
+        return n
+
+    # Reads exactly 'n' bytes into a new buffer, or into 'out' if it's given. 'on_chunk' is called
+    # with each chunk's memoryview after it's read.
+    # Returns the buffer as a numpy uint8 array that shares memory with it.
+    def read_exactly(self, n: int, out=None, on_chunk=None):
+        buf = bytearray(n) if (out is None) else out
+        view = memoryview(buf).cast("B")
+        if (len(view) < n):
+            raise ValueError(f"buffer holds {len(view)} bytes but {n} were asked for")
+
+        pos = 0
+        while (pos < n):
+            got = self.readinto(view[pos:n])
+            if ((on_chunk is not None) and (got != 0)):
+                on_chunk(view[pos:pos + got])
+            pos += got
+        return np.frombuffer(buf, dtype=np.uint8, count=n)
+
+# A fixed-size ring of bytes. The device writes into the free space and consumers look at the
+# unread data through memoryviews, so nothing is copied or allocated once it's set up.
+#
+# 'head' and 'tail' count bytes written and consumed since the ring was made; they're never
+# wrapped, so head - tail is always how many bytes are waiting.
+class RingBuffer:
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.buf = bytearray(capacity)
+        self.view = memoryview(self.buf)
+        self.array = np.frombuffer(self.buf, dtype=np.uint8)
+        self.head = 0
+        self.tail = 0
+
+    @property
+    def readable(self) -> int:
+        return self.head - self.tail
+
+    @property
+    def writable(self) -> int:
+        return self.capacity - self.readable
+
+    # Returns the largest contiguous stretch of free space as a memoryview
+    def free_view(self):
+        start = self.head % self.capacity
+        n = min(self.writable, self.capacity - start)
+        return self.view[start:start + n]
+
+    # Marks 'n' bytes of the free space as written
+    def commit(self, n: int) -> None:
+        if (n > self.writable):
+            raise ValueError(f"can't commit {n} bytes, only {self.writable} are free")
+        self.head += n
+
+    # Does one device read into the free space. Returns the number of bytes read; 0 if the ring
+    # is full.
+    def fill(self, reader: FT232HReader) -> int:
+        view = self.free_view()
+        if (len(view) == 0): return 0
+        n = reader.readinto(view)
+        self.commit(n)
+        return n
+
+    # Returns the unread data as a list of up to two memoryviews (two if it wraps around the end
+    # of the ring). 'n' limits how many bytes are returned.
+    def peek(self, n: int = None) -> list:
+        n = self.readable if (n is None) else min(n, self.readable)
+        start = self.tail % self.capacity
+        first = min(n, self.capacity - start)
+        views = [self.view[start:start + first]]
+        if (first < n):
+            views.append(self.view[0:n - first])
+        return [v for v in views if (len(v) != 0)]
+
+    # Marks 'n' bytes of unread data as consumed
+    def consume(self, n: int) -> None:
+        if (n > self.readable):
+            raise ValueError(f"can't consume {n} bytes, only {self.readable} are waiting")
+        self.tail += n
+
+    # Copies up to len(out) unread bytes into 'out' and consumes them. Returns how many were copied.
+    def read_into(self, out) -> int:
+        out = memoryview(out).cast("B")
+        pos = 0
+        for v in self.peek(len(out)):
+            out[pos:pos + len(v)] = v
+            pos += len(v)
+        self.consume(pos)
+        return pos
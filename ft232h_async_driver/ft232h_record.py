@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+
+# Recording FT232H captures to disk, and replaying them.
+#
+# A recording is two files:
+#   <name>       the raw bytes, exactly as they came off the device
+#   <name>.idx   one INDEX_DTYPE record per chunk: where the chunk starts in the data file, how
+#                long it is and the host time (seconds since the epoch) when it arrived
+#
+# The data file is preallocated and memory-mapped, so chunks are read (or copied) straight into
+# the page cache and the kernel writes them out in the background. It grows in 'capacity' steps if
+# the capture runs longer than expected and is trimmed to the bytes actually recorded on close().
+#
+# CaptureReplay maps a recording back in read-only. Views it returns are numpy arrays over the
+# mapping, so only the pages that are looked at ever get read from disk.
+
+import mmap
+import os
+from time import time
+
+import numpy as np
+
+INDEX_DTYPE = np.dtype([("offset", "<u8"), ("length", "<u8"), ("timestamp", "<f8")])
+
+def index_path(path: str) -> str:
+    return path + ".idx"
+
+class CaptureRecorder:
+    def __init__(self, path: str, capacity: int = 1024 * 1024 * 1024):
+        self.path = path
+        self.capacity = capacity
+        self.size = 0
+        self.chunks = 0
+
+        self._file = open(path, "w+b")
+        self._file.truncate(capacity)
+        self._map = mmap.mmap(self._file.fileno(), capacity)
+        self._index = open(index_path(path), "wb")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Makes the data file bigger by another 'capacity' bytes
+    def _grow(self) -> None:
+        new_size = len(self._map) + self.capacity
+        self._map.flush()
+        self._map.close()
+        self._file.truncate(new_size)
+        self._map = mmap.mmap(self._file.fileno(), new_size)
+
+    def _add_index(self, offset: int, length: int, timestamp: float) -> None:
+        entry = np.array([(offset, length, time() if (timestamp is None) else timestamp)],
+                         dtype=INDEX_DTYPE)
+        self._index.write(entry.tobytes())
+        self.chunks += 1
+
+    # Copies one chunk (anything with the buffer protocol) onto the end of the recording.
+    def append(self, data, timestamp: float = None) -> None:
+        data = memoryview(data).cast("B")
+        while ((self.size + len(data)) > len(self._map)):
+            self._grow()
+        self._map[self.size:self.size + len(data)] = data
+        self._add_index(self.size, len(data), timestamp)
+        self.size += len(data)
+
+    # Does one device read straight into the mapped file. Returns the number of bytes read.
+    def record_from(self, reader, n: int = None) -> int:
+        n = reader.chunk_size if (n is None) else n
+        if ((self.size + n) > len(self._map)):
+            self._grow()
+
+        view = memoryview(self._map)[self.size:self.size + n]
+        try:
+            got = reader.readinto(view)
+        finally:
+            view.release()
+
+        if (got != 0):
+            self._add_index(self.size, got, None)
+            self.size += got
+        return got
+
+    def close(self) -> None:
+        if (self._map is None): return
+        self._map.flush()
+        self._map.close()
+        self._map = None
+        self._file.truncate(self.size)
+        self._file.close()
+        self._index.close()
+
+class CaptureReplay:
+    def __init__(self, path: str):
+        self.path = path
+        self.index = np.fromfile(index_path(path), dtype=INDEX_DTYPE)
+        self.size = os.path.getsize(path)
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if (self.size != 0) else None
+        self.data = (np.frombuffer(self._map, dtype=np.uint8) if (self._map is not None)
+                     else np.zeros(0, dtype=np.uint8))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # Views handed out earlier keep the mapping alive, so if there are any left it's closed when
+    # the last of them goes away instead.
+    def close(self) -> None:
+        self.data = None
+        if (self._map is not None):
+            try:
+                self._map.close()
+            except BufferError as e:
+                pass
+            self._map = None
+        self._file.close()
+
+    @property
+    def start_time(self) -> float:
+        return float(self.index["timestamp"][0]) if (len(self.index) != 0) else 0.0
+
+    @property
+    def end_time(self) -> float:
+        return float(self.index["timestamp"][-1]) if (len(self.index) != 0) else 0.0
+
+    @property
+    def duration(self) -> float:
+        return self.end_time - self.start_time
+
+    # Returns the bytes of chunk 'i' as a numpy view
+    def chunk(self, i: int):
+        e = self.index[i]
+        return self.data[int(e["offset"]):int(e["offset"] + e["length"])]
+
+    # Returns a numpy view of the bytes in [start, end)
+    def byte_range(self, start: int, end: int):
+        return self.data[start:end]
+
+    # Returns (first chunk, last chunk + 1) for the chunks that arrived in [t0, t1). Times are
+    # seconds since the epoch, or seconds since the start of the recording if 'relative' is set.
+    def chunks_between(self, t0: float, t1: float, relative: bool = False):
+        if (relative):
+            t0 += self.start_time
+            t1 += self.start_time
+        ts = self.index["timestamp"]
+        return (int(np.searchsorted(ts, t0, side="left")), int(np.searchsorted(ts, t1, side="left")))
+
+    # Returns a numpy view of every byte in the chunks that arrived in [t0, t1)
+    def time_range(self, t0: float, t1: float, relative: bool = False):
+        first, last = self.chunks_between(t0, t1, relative)
+        if (first >= last):
+            return self.data[0:0]
+        start = int(self.index["offset"][first])
+        end = int(self.index["offset"][last - 1] + self.index["length"][last - 1])
+        return self.data[start:end]
+
+    # Yields (offset, timestamp, view) for every chunk
+    def iter_chunks(self, first: int = 0, last: int = None):
+        last = len(self.index) if (last is None) else last
+        for i in range(first, last):
+            e = self.index[i]
+            yield (int(e["offset"]), float(e["timestamp"]), self.chunk(i))
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Summarizes (and optionally checks) a recorded "
+                                                 "FT232H capture.")
+    parser.add_argument("recording", type=str)
+    parser.add_argument("--start", type=float, default=None,
+                        help="seconds from the start of the recording to look from")
+    parser.add_argument("--end", type=float, default=None,
+                        help="seconds from the start of the recording to look up to")
+    parser.add_argument("--validate", action="store_true",
+                        help="check the incrementing test pattern in the selected range")
+    args = parser.parse_args()
+
+    with CaptureReplay(args.recording) as r:
+        rate = (r.size / r.duration / (1024 * 1024)) if (r.duration > 0) else 0
+        print(f"{r.size} bytes in {len(r.index)} chunks over {r.duration:.3f} s ({rate:.02f} MiB/s)")
+
+        if (args.validate):
+            from ft232h_validate import StreamValidator
+            start = 0.0 if (args.start is None) else args.start
+            end = (r.duration + 1) if (args.end is None) else args.end
+            first, last = r.chunks_between(start, end, relative=True)
+            v = StreamValidator()
+            for offset, timestamp, view in r.iter_chunks(first, last):
+                v.feed(view, offset)
+            print(v.summary())
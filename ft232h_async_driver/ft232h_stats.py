@@ -0,0 +1,244 @@
+#!/usr/bin/env python3
+
+# Instrumentation for the FT232H host pipeline.
+#
+# InstrumentedDevice wraps an opened device and times every read and write that goes through it.
+# It can be handed to anything that takes a device (FT232HReader, CaptureEngine, ...), and
+# everything it doesn't instrument is passed straight through to the real device, so the setup
+# calls still work on it.
+#
+# For each read it keeps the size that was asked for, the size that came back and how long it
+# took; for each write, the size and how long it took. Those go in numpy logs (the first
+# 'max_records' of each) for export to CSV, and into histograms that cover the whole run. The logs
+# start small and double as they fill, so a short run doesn't pay for a long one's worth of records.
+#
+# The control-byte round trip is measured from the start of a write to the end of the first read
+# that started after the write returned and brought back data. That read is the earliest one whose
+# data could show the FPGA's response. The test designs don't echo control bytes back, so this is
+# the round trip as the host sees it, not a measurement of when the FPGA acted on the byte.
+
+import csv
+import json
+import threading
+from time import monotonic
+
+import numpy as np
+
+from ft232h_reader import pick_readinto
+
+READ_DTYPE = np.dtype([("timestamp", "<f8"), ("requested", "<u8"), ("got", "<u8"),
+                       ("seconds", "<f8")])
+WRITE_DTYPE = np.dtype([("timestamp", "<f8"), ("bytes", "<u8"), ("seconds", "<f8"),
+                        ("round_trip", "<f8")])
+
+INITIAL_RECORDS = 4096
+
+# Histogram of durations with power-of-two buckets: bucket 0 counts anything under 1 us and
+# bucket k counts [2^(k-1), 2^k) us. The last bucket also takes everything longer.
+class LatencyHistogram:
+    BUCKETS = 32
+
+    def __init__(self):
+        self.counts = np.zeros(self.BUCKETS, dtype=np.int64)
+        self.count = 0
+        self.total = 0.0
+        self.min = None
+        self.max = None
+
+    def add(self, seconds: float) -> None:
+        self.counts[min(int(seconds * 1e6).bit_length(), self.BUCKETS - 1)] += 1
+        self.count += 1
+        self.total += seconds
+        if ((self.min is None) or (seconds < self.min)): self.min = seconds
+        if ((self.max is None) or (seconds > self.max)): self.max = seconds
+
+    @property
+    def mean(self) -> float:
+        return (self.total / self.count) if (self.count != 0) else 0.0
+
+    # Upper edge, in seconds, of the bucket that the p-th percentile (0 - 100) falls in
+    def percentile(self, p: float) -> float:
+        if (self.count == 0): return 0.0
+        k = int(np.searchsorted(np.cumsum(self.counts), self.count * p / 100))
+        return min((1 << k) * 1e-6, self.max)
+
+    # buckets are keyed by their lower edge
+    def as_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "mean": self.mean,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.percentile(50),
+            "p99": self.percentile(99),
+            "buckets_us": {((1 << k) >> 1): int(v) for k, v in enumerate(self.counts) if (v != 0)},
+        }
+
+class InstrumentedDevice:
+    def __init__(self, dev, max_records: int = 1024 * 1024):
+        self.dev = dev
+        self._readinto = pick_readinto(dev)
+        self._lock = threading.Lock()
+        self._t0 = monotonic()
+
+        self.reads = 0
+        self.bytes_read = 0
+        self.writes = 0
+        self.bytes_written = 0
+
+        # reads that came back with less than was asked for but not nothing, and reads that timed
+        # out with nothing
+        self.short_reads = 0
+        self.timeouts = 0
+
+        # read_sizes[k] counts reads that returned [2^(k-1), 2^k) bytes; read_sizes[0] counts
+        # empty ones
+        self.read_sizes = np.zeros(64, dtype=np.int64)
+
+        self.read_latency = LatencyHistogram()
+        self.write_latency = LatencyHistogram()
+        self.round_trip = LatencyHistogram()
+
+        # Only the first self.reads / self.writes records are valid. Each write's round_trip is
+        # NaN until it's resolved.
+        self.max_records = max_records
+        self.read_log = np.zeros(min(max_records, INITIAL_RECORDS), dtype=READ_DTYPE)
+        self.write_log = np.zeros(min(max_records, INITIAL_RECORDS), dtype=WRITE_DTYPE)
+
+        # (write number, start time, end time) for writes still waiting for their round trip
+        self._pending = []
+
+    # everything that isn't instrumented goes to the real device
+    def __getattr__(self, name):
+        return getattr(self.dev, name)
+
+    # Returns 'log' with room for record i, doubling it if needed, or None once i is past
+    # max_records
+    def _room(self, log, i: int):
+        if (i < len(log)): return log
+        if (i >= self.max_records): return None
+        grown = np.zeros(min(self.max_records, max(2 * len(log), i + 1)), dtype=log.dtype)
+        grown[:len(log)] = log
+        return grown
+
+    def readinto(self, view) -> int:
+        start = monotonic()
+        n = self._readinto(view)
+        end = monotonic()
+
+        i = self.reads
+        log = self._room(self.read_log, i)
+        if (log is not None):
+            self.read_log = log
+            self.read_log[i] = (start - self._t0, len(view), n, end - start)
+        self.reads += 1
+        self.bytes_read += n
+        self.read_sizes[n.bit_length()] += 1
+        self.read_latency.add(end - start)
+        if (n == 0):
+            self.timeouts += 1
+        elif (n < len(view)):
+            self.short_reads += 1
+
+        if ((n != 0) and (len(self._pending) != 0)):
+            self._resolve_round_trips(start, end)
+        return n
+
+    def _resolve_round_trips(self, read_start: float, read_end: float) -> None:
+        with self._lock:
+            waiting = []
+            for w, write_start, write_end in self._pending:
+                if (write_end > read_start):
+                    waiting.append((w, write_start, write_end))
+                    continue
+                self.round_trip.add(read_end - write_start)
+                if (w < len(self.write_log)):
+                    self.write_log["round_trip"][w] = read_end - write_start
+            self._pending = waiting
+
+    def read(self, nchars, raw=True):
+        buf = bytearray(nchars)
+        n = self.readinto(memoryview(buf))
+        return bytes(buf[:n])
+
+    def write(self, data) -> int:
+        start = monotonic()
+        n = self.dev.write(data)
+        end = monotonic()
+
+        with self._lock:
+            w = self.writes
+            log = self._room(self.write_log, w)
+            if (log is not None):
+                self.write_log = log
+                self.write_log[w] = (start - self._t0, len(data), end - start, np.nan)
+            self.writes += 1
+            self.bytes_written += len(data)
+            self.write_latency.add(end - start)
+            self._pending.append((w, start, end))
+        return n
+
+    # The logged reads and writes, as numpy structured arrays
+    @property
+    def read_records(self):
+        return self.read_log[:min(self.reads, len(self.read_log))]
+
+    @property
+    def write_records(self):
+        return self.write_log[:min(self.writes, len(self.write_log))]
+
+    def as_dict(self) -> dict:
+        elapsed = monotonic() - self._t0
+        return {
+            "seconds": elapsed,
+            "reads": self.reads,
+            "bytes_read": self.bytes_read,
+            "mib_per_s": self.bytes_read / elapsed / (1024 * 1024) if (elapsed > 0) else 0.0,
+            "short_reads": self.short_reads,
+            "timeouts": self.timeouts,
+            "writes": self.writes,
+            "bytes_written": self.bytes_written,
+            "read_sizes": {((1 << k) >> 1): int(v) for k, v in enumerate(self.read_sizes) if (v != 0)},
+            "read_latency": self.read_latency.as_dict(),
+            "write_latency": self.write_latency.as_dict(),
+            "round_trip": self.round_trip.as_dict(),
+        }
+
+    def to_json(self, f) -> None:
+        json.dump(self.as_dict(), f, indent=2)
+
+    # Writes one CSV row per logged read, or per logged write if 'writes' is set
+    def to_csv(self, f, writes: bool = False) -> None:
+        records = self.write_records if (writes) else self.read_records
+        w = csv.writer(f)
+        w.writerow(records.dtype.names)
+        w.writerows(records.tolist())
+
+    # Saves the statistics to 'path': the summary as JSON for .json files, or the read log as CSV
+    # for anything else. For CSV, the write log goes next to it in <name>.writes.csv.
+    def save(self, path: str) -> None:
+        if (path.endswith(".json")):
+            with open(path, 'w') as f:
+                self.to_json(f)
+            return
+
+        with open(path, 'w', newline='') as f:
+            self.to_csv(f)
+        stem = path[:-4] if (path.endswith(".csv")) else path
+        with open(stem + ".writes.csv", 'w', newline='') as f:
+            self.to_csv(f, writes=True)
+
+    def summary(self) -> str:
+        r = self.read_latency
+        lines = [f"{self.reads} reads, {self.bytes_read} bytes: {self.short_reads} short, "
+                 f"{self.timeouts} timed out with nothing",
+                 f"   read latency  mean {r.mean * 1e3:.3f} ms  p50 <= {r.percentile(50) * 1e3:.3f} ms  "
+                 f"p99 <= {r.percentile(99) * 1e3:.3f} ms  max {(r.max or 0) * 1e3:.3f} ms"]
+        if (self.writes != 0):
+            w = self.write_latency
+            rt = self.round_trip
+            lines.append(f"   {self.writes} writes: latency mean {w.mean * 1e3:.3f} ms  "
+                         f"max {(w.max or 0) * 1e3:.3f} ms")
+            lines.append(f"   control round trip ({rt.count} measured)  mean {rt.mean * 1e3:.3f} ms  "
+                         f"p99 <= {rt.percentile(99) * 1e3:.3f} ms  max {(rt.max or 0) * 1e3:.3f} ms")
+        return "\n".join(lines)
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+
+# Sweeps the FT232H's USB transfer settings to find the ones that read fastest.
+#
+# Every combination of read chunk size, setUSBParameters buffer size, read timeout and flow control
+# gets a fresh device, a short warmup to get past whatever was already sitting in the FIFOs, and
+# then a fixed-length read test through an InstrumentedDevice. The results are ranked by throughput
+# (then by 99th-percentile read latency) and the best are printed; --output saves all of them.
+#
+# --fake runs the sweep against fake_ftd2xx.py instead of a board. The fake device doesn't model
+# the USB settings, so only the chunk size and timeout make a difference there, but it's enough to
+# check the tool itself.
+
+import csv
+import itertools
+import json
+import os
+from time import monotonic
+
+from ft232h_reader import open_device, ftd2xx_module, FT232HReader, FLOW_CONTROL
+from ft232h_stats import InstrumentedDevice
+from ft232h_validate import StreamValidator
+
+class SweepPoint:
+    def __init__(self, chunk_size: int, usb_buffer: int, read_timeout_ms: int, flow_control: str):
+        self.chunk_size = chunk_size
+        self.usb_buffer = usb_buffer
+        self.read_timeout_ms = read_timeout_ms
+        self.flow_control = flow_control
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+    def __str__(self):
+        return (f"chunk {self.chunk_size}, usb buffer {self.usb_buffer}, "
+                f"timeout {self.read_timeout_ms} ms, flow {self.flow_control}")
+
+def sweep_points(chunk_sizes, usb_buffers, read_timeouts, flow_controls):
+    for c, u, t, f in itertools.product(chunk_sizes, usb_buffers, read_timeouts, flow_controls):
+        yield SweepPoint(c, u, t, f)
+
+# Reads for 'seconds' (after 'warmup' seconds of reads that aren't counted) with the settings in
+# 'point'. Returns a dict of the settings and what was measured.
+def measure(point: SweepPoint, seconds: float, warmup: float = 0.2, validate: bool = False) -> dict:
+    ftdev = open_device(rx_buffer=point.usb_buffer, tx_buffer=point.usb_buffer,
+                        read_timeout_ms=point.read_timeout_ms, flow_control=point.flow_control,
+                        verbose=False)
+    try:
+        # D2XX purges only the buffers named in the mask, so purge() on its own does nothing
+        ft = ftd2xx_module()
+        ftdev.purge(ft.defines.PURGE_RX | ft.defines.PURGE_TX)
+        buf = memoryview(bytearray(point.chunk_size))
+        warm = FT232HReader(ftdev, point.chunk_size)
+        end = monotonic() + warmup
+        while (monotonic() < end):
+            warm.readinto(buf)
+
+        dev = InstrumentedDevice(ftdev)
+        reader = FT232HReader(dev, point.chunk_size)
+        validator = StreamValidator() if (validate) else None
+        end = monotonic() + seconds
+        while (monotonic() < end):
+            n = reader.readinto(buf)
+            if ((validator is not None) and (n != 0)):
+                validator.feed(buf[:n])
+    finally:
+        ftdev.close()
+
+    stats = dev.as_dict()
+    result = point.as_dict()
+    result.update({
+        "mib_per_s": stats["mib_per_s"],
+        "reads": stats["reads"],
+        "short_reads": stats["short_reads"],
+        "timeouts": stats["timeouts"],
+        "read_p50_ms": stats["read_latency"]["p50"] * 1e3,
+        "read_p99_ms": stats["read_latency"]["p99"] * 1e3,
+        "read_max_ms": (stats["read_latency"]["max"] or 0) * 1e3,
+    })
+    if (validator is not None):
+        result["errors"] = validator.errors
+    return result
+
+# best first: fastest, then lowest tail latency
+def rank(results: list) -> list:
+    return sorted(results, key=lambda r: (-r["mib_per_s"], r["read_p99_ms"]))
+
+def save(results: list, path: str) -> None:
+    with open(path, 'w', newline='') as f:
+        if (path.endswith(".json")):
+            json.dump(results, f, indent=2)
+        else:
+            w = csv.DictWriter(f, fieldnames=list(results[0]))
+            w.writeheader()
+            w.writerows(results)
+
+def int_list(s: str) -> list:
+    return [int(x, 0) for x in s.split(",")]
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sweeps FT232H transfer settings and ranks them by "
+                                                 "throughput and read latency.")
+    parser.add_argument("--chunk-sizes", type=int_list, default=[16384, 65536, 262144, 1048576],
+                        help="comma-separated read sizes in bytes")
+    parser.add_argument("--usb-buffers", type=int_list, default=[4096, 16384, 65536],
+                        help="comma-separated setUSBParameters sizes in bytes")
+    parser.add_argument("--read-timeouts", type=int_list, default=[2, 10, 50],
+                        help="comma-separated read timeouts in ms")
+    parser.add_argument("--flow-control", type=lambda s: s.split(","), default=["rts_cts"],
+                        help=f"comma-separated flow control settings ({', '.join(FLOW_CONTROL)})")
+    parser.add_argument("--seconds", type=float, default=2.0,
+                        help="how long to measure each combination for")
+    parser.add_argument("--warmup", type=float, default=0.2,
+                        help="how long to read before measuring each combination")
+    parser.add_argument("--validate", action="store_true",
+                        help="also check the test pattern and count errors")
+    parser.add_argument("--top", type=int, default=10, help="how many of the best to print")
+    parser.add_argument("-o", "--output", type=str, default=None,
+                        help="save every result to a .csv or .json file")
+    parser.add_argument("--fake", action="store_true",
+                        help="sweep against the simulated device in fake_ftd2xx.py")
+    args = parser.parse_args()
+
+    for f in args.flow_control:
+        if (f not in FLOW_CONTROL):
+            parser.error(f"unknown flow control {f}")
+    if (args.fake):
+        os.environ["FT232H_FAKE"] = "1"
+
+    points = list(sweep_points(args.chunk_sizes, args.usb_buffers, args.read_timeouts,
+                               args.flow_control))
+    results = []
+    for i, point in enumerate(points):
+        r = measure(point, args.seconds, args.warmup, args.validate)
+        print(f"[{i + 1}/{len(points)}] {point}: {r['mib_per_s']:.02f} MiB/s, "
+              f"p99 read {r['read_p99_ms']:.3f} ms")
+        results.append(r)
+
+    results = rank(results)
+    print()
+    print(f"{'chunk':>9} {'usb buf':>8} {'timeout':>8} {'flow':>9} {'MiB/s':>8} {'p50 ms':>8} "
+          f"{'p99 ms':>8} {'short':>6} {'empty':>6}" + ("" if (not args.validate) else f" {'errors':>6}"))
+    for r in results[:args.top]:
+        print(f"{r['chunk_size']:9d} {r['usb_buffer']:8d} {r['read_timeout_ms']:8d} "
+              f"{r['flow_control']:>9} {r['mib_per_s']:8.02f} {r['read_p50_ms']:8.3f} "
+              f"{r['read_p99_ms']:8.3f} {r['short_reads']:6d} {r['timeouts']:6d}" +
+              ("" if (not args.validate) else f" {r['errors']:6d}"))
+
+    if (args.output is not None):
+        save(results, args.output)
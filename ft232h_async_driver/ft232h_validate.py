@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+# Streaming integrity checker for the incrementing byte pattern that the test designs send.
+#
+# Each chunk is checked as it arrives, through a numpy view of the chunk's own memory, and then
+# forgotten; only the last byte is kept so that the step across a chunk boundary is checked too.
+# That means a link can be qualified for as long as you like without keeping the data around.
+#
+# Every place where the next byte isn't the previous byte + 1 (mod 256) is a discontinuity. The
+# size of the jump says how many bytes went missing, modulo 256. Discontinuities that are close
+# together are grouped into bursts, since a single bad event usually corrupts a few bytes at once.
+
+import json
+
+import numpy as np
+
+# A run of discontinuities that are no more than 'burst_gap' bytes apart
+class ErrorBurst:
+    def __init__(self, start: int):
+        self.start = start
+        self.end = start
+        self.errors = 0
+        self.dropped_bytes = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+class StreamValidator:
+    def __init__(self, burst_gap: int = 64, max_bursts: int = 1000):
+        self.burst_gap = burst_gap
+        self.max_bursts = max_bursts
+
+        self.bytes_checked = 0
+        self.chunks = 0
+        self.errors = 0
+
+        # estimated bytes lost, from the size of each jump (mod 256)
+        self.dropped_bytes = 0
+
+        # gap_histogram[k] counts discontinuities where k bytes (mod 256) went missing. A repeated
+        # byte looks like 255 missing bytes.
+        self.gap_histogram = np.zeros(256, dtype=np.int64)
+
+        # the first 'max_bursts' bursts, and how many there were in total
+        self.bursts = []
+        self.burst_count = 0
+
+        self._last = None
+        self._open_burst = None
+
+    @property
+    def ok(self) -> bool:
+        return self.errors == 0
+
+    # Checks one chunk. 'chunk' can be anything with the buffer protocol (bytes, bytearray,
+    # memoryview, numpy uint8 array). 'offset' is the chunk's position in the stream; by default
+    # it's assumed to follow straight on from the last chunk.
+    def feed(self, chunk, offset: int = None) -> int:
+        data = np.frombuffer(chunk, dtype=np.uint8)
+        if (offset is None):
+            offset = self.bytes_checked
+        self.chunks += 1
+        if (len(data) == 0): return 0
+
+        # uint8 arithmetic wraps, so the step from 255 to 0 is a difference of 1 too
+        steps = data[1:] - data[:-1]
+        bad = np.flatnonzero(steps != 1) + 1
+        jumps = steps[bad - 1]
+
+        # the step from the last chunk's final byte
+        if (self._last is not None):
+            step = (int(data[0]) - self._last) & 0xff
+            if (step != 1):
+                bad = np.concatenate(([0], bad))
+                jumps = np.concatenate((np.array([step], dtype=np.uint8), jumps))
+
+        self._last = int(data[-1])
+        self.bytes_checked += len(data)
+        if (len(bad) == 0): return 0
+
+        missing = (jumps.astype(np.int64) - 1) & 0xff
+        self.errors += len(bad)
+        self.dropped_bytes += int(missing.sum())
+        self.gap_histogram += np.bincount(missing, minlength=256)
+        self._collect_bursts(bad + offset, missing)
+        return len(bad)
+
+    def _collect_bursts(self, positions, missing) -> None:
+        # split wherever two discontinuities are further apart than burst_gap
+        splits = np.flatnonzero(np.diff(positions) > self.burst_gap) + 1
+        for group, lost in zip(np.split(positions, splits), np.split(missing, splits)):
+            b = self._open_burst
+            if ((b is None) or ((int(group[0]) - b.end) > self.burst_gap)):
+                b = ErrorBurst(int(group[0]))
+                self.burst_count += 1
+                if (len(self.bursts) < self.max_bursts):
+                    self.bursts.append(b)
+                self._open_burst = b
+            b.end = int(group[-1])
+            b.errors += len(group)
+            b.dropped_bytes += int(lost.sum())
+
+    def as_dict(self) -> dict:
+        return {
+            "bytes_checked": self.bytes_checked,
+            "chunks": self.chunks,
+            "errors": self.errors,
+            "dropped_bytes": self.dropped_bytes,
+            "burst_count": self.burst_count,
+            "bursts": [b.as_dict() for b in self.bursts],
+            "gap_histogram": {int(k): int(v) for k, v in enumerate(self.gap_histogram) if (v != 0)},
+        }
+
+    def to_json(self, f) -> None:
+        json.dump(self.as_dict(), f, indent=2)
+
+    def summary(self, max_bursts_shown: int = 10) -> str:
+        if (self.ok):
+            return f"checked {self.bytes_checked} bytes in {self.chunks} chunks: no errors"
+
+        lines = [f"checked {self.bytes_checked} bytes in {self.chunks} chunks: {self.errors} "
+                 f"discontinuities in {self.burst_count} bursts, about {self.dropped_bytes} bytes "
+                 f"dropped"]
+        for b in self.bursts[:max_bursts_shown]:
+            lines.append(f"   burst @ {b.start}..{b.end}: {b.errors} errors, {b.dropped_bytes} "
+                         "bytes dropped")
+        if (self.burst_count > max_bursts_shown):
+            lines.append(f"   ... and {self.burst_count - max_bursts_shown} more")
+        return "\n".join(lines)
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+
+# Checks FT232HLink against the fake device: closing a blocking stream while its queue is full
+# mustn't stall the link for the other streams, or stop the link from closing.
+
+import asyncio
+import sys
+
+import fake_ftd2xx
+from ft232h_asyncio import FT232HLink
+
+def test_close_full_blocking_stream():
+    async def main():
+        link = FT232HLink(fake_ftd2xx.open(), chunk_size=4096)
+        link.start()
+        stuck = link.stream(maxsize=2, block=True)
+        other = link.stream(maxsize=1024)
+
+        # nothing reads 'stuck', so the reader ends up waiting on it
+        while (stuck._queue.qsize() < stuck.maxsize):
+            await asyncio.sleep(0.01)
+        await asyncio.sleep(0.05)
+        stuck.close()
+
+        offset = link.offset
+        await asyncio.sleep(0.2)
+        assert link.offset > offset, "the link stopped reading after a full stream was closed"
+        assert other._queue.qsize() != 0, "the other stream stopped getting data"
+
+        await asyncio.wait_for(link.close(), timeout=5)
+        link.reader.dev.close()
+
+    asyncio.run(main())
+
+if __name__ == "__main__":
+    test_close_full_blocking_stream()
+    print("closing a full blocking stream doesn't stall the link")
+    sys.exit(0)
@@ -0,0 +1,29 @@
+#!/usr/bin/env python3
+
+# Checks that the fake device's purge() takes the same mask as D2XX's: only the buffers named in
+# it are purged, so a bare purge() leaves the data alone.
+
+import sys
+from time import sleep
+
+import fake_ftd2xx
+
+def test_purge_mask():
+    dev = fake_ftd2xx.open()
+    sleep(0.05)
+    queued = dev.getQueueStatus()
+    assert queued != 0, "the fake device didn't produce anything"
+
+    dev.purge()
+    assert dev.getQueueStatus() >= queued, "purge() with mask 0 dropped data"
+    dev.purge(fake_ftd2xx.defines.PURGE_TX)
+    assert dev.getQueueStatus() >= queued, "PURGE_TX dropped read data"
+
+    dev.purge(fake_ftd2xx.defines.PURGE_RX | fake_ftd2xx.defines.PURGE_TX)
+    assert dev.getQueueStatus() < queued, "PURGE_RX didn't drop read data"
+    dev.close()
+
+if __name__ == "__main__":
+    test_purge_mask()
+    print("purge() only purges the buffers in its mask")
+    sys.exit(0)
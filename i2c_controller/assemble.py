@@ -46,6 +46,10 @@ Check the readme for valid assembly syntax.
 #     so not all values will be possible. If an unrepresentable value is requested, then we round
 #     up to the closest value.
 #
+# delay_exact <cycles> [tolerance]
+#     Keeps the controller busy for exactly <cycles> cycles (counting each word's own overhead),
+#     or to within [tolerance] cycles, using as few delay words as possible. See delay_planner.py.
+#
 # wait_trigger llllll hhhhhh
 #     Waits until the trigger bits match the bitmask.
 #     Check the README for more details
@@ -84,15 +88,22 @@ Check the readme for valid assembly syntax.
 #     write_trigger 0b00_0001
 #     jmp _done
 
+import glob
+import io
 import re
 import sys
 import os
 sys.path.append(os.path.dirname(__file__) + "/../tools/simpleasmparser/")
 from simpleasmparser import *
 import math
+import delay_planner
+import machine_code as mc
 
 LJUSTLEN = 40
 
+# Bump this whenever a change here changes the assembler's output for the same source.
+ASSEMBLER_VERSION = "1.4"
+
 def justify_comments(s):
     r = []
     for l in s.split("\n"):
@@ -105,6 +116,11 @@ def justify_comments(s):
 
 def convert_literal_bounded(line_number, arg, minimum, maximum, base=0):
     retval = None
+
+    # a '0x', '0o' or '0b' prefix says what base a literal is in, whatever the default is. None of
+    # them can start a bare binary literal, the only other default used.
+    if (re.match(r"[+-]?0[xXoObB]", arg)):
+        base = 0
     try:
         retval = int(arg, base)
     except ValueError as e:
@@ -117,6 +133,13 @@ def convert_literal_bounded(line_number, arg, minimum, maximum, base=0):
 
     return retval
 
+# Packs bytes into 16-bit big-endian words, padding the last word with 0 if needed
+def pack_bytes(b) -> list:
+    b = list(b)
+    if ((len(b) % 2) != 0):
+        b.append(0)
+    return [(hi << 8) | lo for hi, lo in zip(b[0::2], b[1::2])]
+
 class I2CWriteInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "i2c_write"
 
@@ -161,6 +184,10 @@ class I2CWriteInstruction(SimpleAsmInstruction):
 
         return justify_comments(retval)
 
+    def emit_words(self, parent: SimpleAsmParser) -> list:
+        w = [self.dev_addr << 1] + self.write_bytes
+        return [0x0200 | len(w)] + pack_bytes(w)
+
 class I2CWriteRawInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "i2c_write_raw"
 
@@ -212,6 +239,10 @@ class I2CWriteRawInstruction(SimpleAsmInstruction):
 
         return justify_comments(retval)
 
+    def emit_words(self, parent: SimpleAsmParser) -> list:
+        stopcond = {"none": 0, "repeated_start": 1, "stop": 2}[self.end_condition]
+        return [(stopcond << 8) | len(self.write_bytes)] + pack_bytes(self.write_bytes)
+
 class I2CWriteReadInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "i2c_writeread"
 
@@ -271,6 +302,12 @@ class I2CWriteReadInstruction(SimpleAsmInstruction):
 
         return justify_comments(retval)
 
+    def emit_words(self, parent: SimpleAsmParser) -> list:
+        w = [self.dev_addr << 1] + self.write_bytes
+        dev_read_addr = (self.dev_addr << 1) | 1
+        return ([0x0100 | len(w)] + pack_bytes(w) +
+                [0x0001, dev_read_addr << 8, 0x0e00 | self.read_length])
+
 class I2CReadInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "i2c_read"
 
@@ -280,10 +317,10 @@ class I2CReadInstruction(SimpleAsmInstruction):
         args = self.argtext.split()
 
         l = args[0].lower()
-        if (not (l.endswith("bytes") or l.endswidth("byte") or l.endswith("b"))):
+        if (not (l.endswith("bytes") or l.endswith("byte") or l.endswith("b"))):
             raise ValueError(f"line {self.line_number}: For clarity, {self.MNEMONIC} read length {args[0]} " \
                              "must end with \'b\' or \'bytes\'.")
-        l = l.replace("bytes", "").replace("b", "")
+        l = l.replace("bytes", "").replace("byte", "").replace("b", "")
         self.read_length = convert_literal_bounded(self.line_number, l, 0, 255)
 
         # dev_addr should be in [0, 127]
@@ -302,6 +339,10 @@ class I2CReadInstruction(SimpleAsmInstruction):
 
         return justify_comments(retval)
 
+    def emit_words(self, parent: SimpleAsmParser) -> list:
+        dev_read_addr = (self.dev_addr << 1) | 1
+        return [0x0001, dev_read_addr << 8, 0x0e00 | self.read_length]
+
 class I2CReadRawInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "i2c_read_raw"
 
@@ -311,10 +352,10 @@ class I2CReadRawInstruction(SimpleAsmInstruction):
         self.end_condition = "none"
 
         l = args[0].lower()
-        if (not (l.endswith("bytes") or l.endswidth("byte") or l.endswith("b"))):
+        if (not (l.endswith("bytes") or l.endswith("byte") or l.endswith("b"))):
             raise ValueError(f"line {self.line_number}: For clarity, {self.MNEMONIC} read length {args[0]} " \
                              "must end with \'b\' or \'bytes\'.")
-        l = l.replace("bytes", "").replace("b", "")
+        l = l.replace("bytes", "").replace("byte", "").replace("b", "")
         self.read_length = convert_literal_bounded(self.line_number, l, 0, 255)
 
         # parse other arguments
@@ -336,6 +377,10 @@ class I2CReadRawInstruction(SimpleAsmInstruction):
         retval += f"{self.read_length:02x}          // i2c raw_read ({self.size_words} words)\n\n"
         return justify_comments(retval)
 
+    def emit_words(self, parent: SimpleAsmParser) -> list:
+        opcode = {"none": 0x0c, "repeated_start": 0x0d, "stop": 0x0e}[self.end_condition]
+        return [(opcode << 8) | self.read_length]
+
 
 class SetReadTagInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "set_read_tag"
@@ -354,6 +399,9 @@ class SetReadTagInstruction(SimpleAsmInstruction):
         retval += f"1_{self.tag:03x}             // set read tag ({self.size_words} words)\n\n"
         return justify_comments(retval)
 
+    def emit_words(self, parent: SimpleAsmParser) -> list:
+        return [0x1000 | self.tag]
+
 class DelayInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "delay"
 
@@ -364,25 +412,98 @@ class DelayInstruction(SimpleAsmInstruction):
         if (len(args) != 1):
             raise ValueError("line {self.line_number}: {MNEMONIC} expected 1 argument, got {len(args)}")
         self.arg = int(args[0], 0)
+        if (self.arg > delay_planner.ENCODABLE[-1]):
+            raise ValueError(f"line {self.line_number}: delay {self.arg} is longer than one delay "
+                             f"word can wait ({delay_planner.ENCODABLE[-1]}); use delay_exact")
         self.size_words = 1
 
-    def emit(self, parent):
-        exponent = max(0, math.ceil(math.log2(self.arg)) - 8)
-        mantissa = int(((self.arg + (2**exponent) - 1) / (2**exponent)))    # ceiling integer division
-        max_delay = (0x100 << 0xf)
-        if (self.arg > max_delay):
-            print(f"Line {self.line_number}: Warning: specified delay {self.arg} "
-                  f"exceeds max delay {max_delay}")
+    # Returns the (exponent, mantissa) pair that a delay of 'cycles' is encoded as
+    @staticmethod
+    def encode(cycles: int):
+        exponent = max(0, math.ceil(math.log2(cycles)) - 8)
+        mantissa = int(((cycles + (2**exponent) - 1) / (2**exponent)))    # ceiling integer division
+
+        # the mantissa is only 8 bits, so 0x100 << e has to be written as 0x80 << (e + 1)
+        if (mantissa > 0xff):
+            mantissa >>= 1
+            exponent += 1
+        return (exponent, mantissa)
+
+    # Returns how many cycles a requested delay of 'cycles' actually turns into
+    @staticmethod
+    def actual_delay(cycles: int) -> int:
+        exponent, mantissa = DelayInstruction.encode(cycles)
+        return (mantissa << exponent)
 
+    def emit(self, parent):
+        exponent, mantissa = self.encode(self.arg)
         actual_delay = (mantissa << exponent)
         if (self.arg != actual_delay):
             print(f"Line {self.line_number}: Warning: specified delay {self.arg} not "
-                  f"exactly representable. Using delay {actual_delay}")
+                  f"exactly representable. Using delay {actual_delay} "
+                  f"(delay_exact can hit it exactly)")
 
         retval = f"// {self.MNEMONIC:16} (instruction takes {self.size_words} words at addr {self.offset})\n"
         retval += f"4_{exponent:01x}_{mantissa:02x}     // const delay {self.arg} clock cycles ({self.size_words} words)\n\n"
         return justify_comments(retval)
 
+    def emit_words(self, parent) -> list:
+        exponent, mantissa = self.encode(self.arg)
+        return [0x4000 | ((exponent & 0xf) << 8) | (mantissa & 0xff)]
+
+# Whether the controller's arg register is 0 when 'instr' starts: True or False, or None if it
+# can't be told because a label or the start of the program comes before whatever last set it
+def _arg_zero_before(instr):
+    prev = instr.previous
+    while (prev is not None):
+        if (isinstance(prev, JmpMaskUnsatisfiedInstruction)):
+            return ((prev.lowmask << 8) | prev.highmask) == 0
+        arg = mc.arg_after(prev.emit_words(None))
+        if (arg is not None): return (arg == 0)
+        prev = prev.previous
+    return None
+
+# Expands to the shortest run of delay words that takes exactly the requested number of cycles
+class DelayExactInstruction(SimpleAsmInstruction):
+    MNEMONIC: str = "delay_exact"
+
+    def parse(self):
+        args = self.argtext.split()
+        if (len(args) not in (1, 2)):
+            raise ValueError(f"line {self.line_number}: {self.MNEMONIC} expected 1 or 2 arguments, got {len(args)}")
+        self.cycles = int(args[0], 0)
+        self.tolerance = int(args[1], 0) if (len(args) == 2) else 0
+
+        # a delay word that starts with arg at 0 is swallowed, so the plan depends on what ran before
+        self.arg_zero = _arg_zero_before(self)
+        try:
+            self.plan = delay_planner.plan_delay_after(self.cycles, self.tolerance, self.arg_zero)
+        except ValueError as e:
+            raise ValueError(f"line {self.line_number}: {e}")
+        self.size_words = len(self.plan)
+
+    # How many cycles the plan takes, given what's in arg when it starts
+    def actual_cycles(self, arg_zero: bool) -> int:
+        if (not arg_zero): return delay_planner.plan_cycles(self.plan)
+        return mc.SWALLOWED_WAIT_CYCLES + delay_planner.plan_cycles(self.plan[1:])
+
+    def emit(self, parent: SimpleAsmParser) -> str:
+        actual = self.actual_cycles(self.arg_zero)
+        if ((self.arg_zero is None) and
+            (abs(self.actual_cycles(True) - self.cycles) > self.tolerance)):
+            print(f"Line {self.line_number}: Warning: {self.MNEMONIC} {self.cycles} comes after a "
+                  f"label or at the start, where arg might be 0, and then it takes "
+                  f"{self.actual_cycles(True)} cycles (a tolerance of 1 allows for that)")
+
+        retval = f"// {self.MNEMONIC:16} (instruction takes {self.size_words} words at addr {self.offset})\n"
+        for v, w in zip(self.plan, self.emit_words(parent)):
+            retval += f"4_{(w >> 8) & 0xf:01x}_{w & 0xff:02x}     // const delay {v} clock cycles\n"
+        retval += f"// {actual} clock cycles in total ({self.cycles} requested)\n\n"
+        return justify_comments(retval)
+
+    def emit_words(self, parent: SimpleAsmParser) -> list:
+        return [delay_planner.encode(v) for v in self.plan]
+
 class WaitTriggerInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "wait_trigger"
 
@@ -400,6 +521,9 @@ class WaitTriggerInstruction(SimpleAsmInstruction):
         retval += f"5_{arg:03x}        // wait til trigger bits {self.arglow:06b} is low or {self.arghigh:06b} is high\n\n"
         return justify_comments(retval)
 
+    def emit_words(self, parent) -> list:
+        return [0x5000 | (self.arglow << 6) | self.arghigh]
+
 class WriteTriggerInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "write_trigger"
 
@@ -415,8 +539,12 @@ class WriteTriggerInstruction(SimpleAsmInstruction):
         retval += f"6_{self.arg:03x}             // write trigger \n\n"
         return justify_comments(retval)
 
+    def emit_words(self, parent) -> list:
+        return [0x6000 | self.arg]
+
 class JmpInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "jmp"
+    falls_through: bool = False
 
     def parse(self):
         args = self.argtext.split()
@@ -425,6 +553,9 @@ class JmpInstruction(SimpleAsmInstruction):
         self.jump_target = args[0]
         self.size_words = 1
 
+    def label_references(self) -> list:
+        return [(0, self.jump_target, 0xfff)]
+
     def emit(self, parent):
         # resolve label
         try:
@@ -437,6 +568,13 @@ class JmpInstruction(SimpleAsmInstruction):
         retval += f"8_{target.address:03x} \n\n"
         return justify_comments(retval)
 
+    def emit_words(self, parent) -> list:
+        try:
+            target = parent.label_positions[self.jump_target]
+        except KeyError as e:
+            raise ValueError(f"line {self.line_number}: unknown label {self.jump_target}")
+        return [0x8000 | target.address]
+
 class JmpMaskUnsatisfiedInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "jmp_mask_unsatisfied"
 
@@ -449,6 +587,9 @@ class JmpMaskUnsatisfiedInstruction(SimpleAsmInstruction):
         self.highmask = convert_literal_bounded(self.line_number, args[2], 0, 255)
         self.size_words = 2
 
+    def label_references(self) -> list:
+        return [(0, self.jump_target, 0xfff)]
+
     def emit(self, parent):
         # resolve label
         try:
@@ -460,18 +601,22 @@ class JmpMaskUnsatisfiedInstruction(SimpleAsmInstruction):
         retval += f"a_{target.address:03x} {self.lowmask:02x}_{self.highmask:02x}\n\n"
         return justify_comments(retval)
 
-import argparse
-
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description=helpstr)
-    parser.add_argument("-i", "--input-file", type=str,
-                        help="assembly-style file to parse")
-    parser.add_argument("-o", "--output-file", type=str,
-                        help="output .hex file to write to")
-    args = parser.parse_args()
+    def emit_words(self, parent) -> list:
+        try:
+            target = parent.label_positions[self.jump_target]
+        except KeyError as e:
+            raise ValueError(f"line {self.line_number}: unknown label {self.jump_target}")
+        return [0xa000 | target.address, (self.lowmask << 8) | self.highmask]
 
-    # Make new parser and register our assembly instructions with it
+# Makes a new parser with all of the i2c controller's assembly instructions registered with it
+def make_parser() -> SimpleAsmParser:
     p = SimpleAsmParser()
+    p.version = ASSEMBLER_VERSION
+
+    # -O output comes from optimize.py and delay_exact's from delay_planner.py, so cached output
+    # has to be thrown away when either of them changes too
+    here = os.path.dirname(os.path.abspath(__file__))
+    p.cache_sources = [os.path.join(here, "optimize.py"), os.path.join(here, "delay_planner.py")]
     p.register_instruction(I2CWriteInstruction.MNEMONIC, I2CWriteInstruction)
     p.register_instruction(I2CReadInstruction.MNEMONIC, I2CReadInstruction)
     p.register_instruction(I2CReadRawInstruction.MNEMONIC, I2CReadRawInstruction)
@@ -479,13 +624,203 @@ if __name__ == "__main__":
     p.register_instruction(I2CWriteReadInstruction.MNEMONIC, I2CWriteReadInstruction)
     p.register_instruction(SetReadTagInstruction.MNEMONIC, SetReadTagInstruction)
     p.register_instruction(DelayInstruction.MNEMONIC, DelayInstruction)
+    p.register_instruction(DelayExactInstruction.MNEMONIC, DelayExactInstruction)
     p.register_instruction(WaitTriggerInstruction.MNEMONIC, WaitTriggerInstruction)
     p.register_instruction(WriteTriggerInstruction.MNEMONIC, WriteTriggerInstruction)
     p.register_instruction(JmpInstruction.MNEMONIC, JmpInstruction)
     p.register_instruction(JmpMaskUnsatisfiedInstruction.MNEMONIC, JmpMaskUnsatisfiedInstruction)
+    return p
+
+# Picks an output format from the output filename's extension
+FORMAT_FOR_EXTENSION = {
+    ".hex": "hex",
+    ".mem": "hex_compact",
+    ".bin": "bin_le",
+    ".coe": "coe",
+    ".obj": "obj",
+}
+
+def guess_output_format(filename: str) -> str:
+    return FORMAT_FOR_EXTENSION.get(os.path.splitext(filename)[1].lower(), "hex")
+
+def extension_for_format(fmt: str) -> str:
+    for ext, f in FORMAT_FOR_EXTENSION.items():
+        if (f == fmt):
+            return ext
+    return ".bin" if fmt.startswith("bin") else ".hex"
+
+# Assembles 'input_file' into 'output_file'. If 'cache' (a SimpleAsmCache) is given and the source
+# hasn't changed since it was last assembled with the same options, the cached output is written
+# without parsing anything.
+# Returns the number of words the optimizer saved, or None if the output came from the cache.
+def assemble_file(input_file: str, output_file: str, fmt: str = None, optimize: bool = False,
+                  cache: SimpleAsmCache = None, verbosity: int = 0):
+    fmt = guess_output_format(output_file) if (fmt is None) else fmt
+    if (optimize and (fmt == "obj")):
+        raise ValueError("object modules can't be optimized: the optimizer drops anything it can't "
+                         "reach from address 0, which is most of a module that's entered from "
+                         "another one")
+
+    p = make_parser()
+    p.verbosity = verbosity
+    with open(input_file, 'r') as infile:
+        source = infile.read()
+
+    if (cache is not None):
+        # included files are found relative to the source, so the same source in another
+        # directory can assemble differently. Their contents are checked by the cache itself.
+        where = os.path.dirname(os.path.abspath(input_file)) if (".include" in source) else ""
+        key = p.cache_key(source, fmt, optimize, where)
+        data = cache.get(key)
+        if (data is not None):
+            with open(output_file, 'wb') as outfile:
+                outfile.write(data)
+            return None
+
+    p.parse_file(io.StringIO(source), input_file)
+
+    saved = 0
+    if (optimize):
+        from optimize import optimize as run_optimizer
+        saved = run_optimizer(p)
+
+    buf = io.BytesIO() if p.output_format_is_binary(fmt) else io.StringIO()
+    p.emit_format(fmt, buf)
+    data = buf.getvalue()
+    if (isinstance(data, str)):
+        data = data.encode()
+
+    with open(output_file, 'wb') as outfile:
+        outfile.write(data)
+    if (cache is not None):
+        cache.put(key, data, p.included_files)
+    return saved
+
+# Reads a batch manifest. Each line names an input file and, optionally, the output file to write
+# it to. Relative paths are relative to the manifest. '#' starts a comment.
+# Returns a list of (input, output) pairs; output is None where it wasn't given.
+def read_manifest(filename: str) -> list:
+    base = os.path.dirname(filename)
+    jobs = []
+    with open(filename, 'r') as f:
+        for line_number, line in enumerate(f, start=1):
+            fields = line.split("#", maxsplit=1)[0].split()
+            if (len(fields) == 0): continue
+            if (len(fields) > 2):
+                raise ValueError(f"{filename} line {line_number}: expected 'input [output]'")
+            paths = [os.path.join(base, p) for p in fields]
+            jobs.append((paths[0], paths[1] if (len(paths) == 2) else None))
+    return jobs
+
+# Runs one job of a batch. This has to be a top-level function so that the process pool can
+# pickle it. Returns (input file, words saved or None, error string or None)
+def _batch_job(job):
+    input_file, output_file, fmt, optimize, cache_dir, cache_size = job
+    try:
+        cache = None if (cache_dir is None) else SimpleAsmCache(cache_dir, cache_size)
+        saved = assemble_file(input_file, output_file, fmt, optimize, cache)
+        return (input_file, saved, None)
+    except Exception as e:
+        return (input_file, None, f"{type(e).__name__}: {e}")
+
+# Assembles many files in parallel over a pool of worker processes.
+# 'jobs' is a list of (input, output) pairs. Where output is None, it's written next to the input
+# (or into 'output_dir') with the extension of the output format. Raises ValueError before
+# assembling anything if two jobs would write the same output file.
+# Returns a list of (input file, words saved or None, error string or None), one per job.
+def assemble_batch(jobs, fmt: str = None, optimize: bool = False, cache_dir: str = None,
+                   cache_size: int = 1024, output_dir: str = None, workers: int = None) -> list:
+    work = []
+    for input_file, output_file in jobs:
+        if (output_file is None):
+            stem = os.path.splitext(input_file)[0]
+            if (output_dir is not None):
+                stem = os.path.join(output_dir, os.path.basename(stem))
+            output_file = stem + extension_for_format("hex" if (fmt is None) else fmt)
+        work.append((input_file, output_file, fmt, optimize, cache_dir, cache_size))
+
+    # two jobs writing the same file would race, and whichever finished last would win
+    writers = {}
+    for job in work:
+        key = os.path.normcase(os.path.abspath(job[1]))
+        if (key in writers):
+            raise ValueError(f"{writers[key]} and {job[0]} would both be written to {job[1]}")
+        writers[key] = job[0]
+
+    if (output_dir is not None):
+        os.makedirs(output_dir, exist_ok=True)
+
+    if ((workers == 1) or (len(work) <= 1)):
+        return [_batch_job(job) for job in work]
+
+    # hand out work in chunks so that lots of small files don't cost a round trip each
+    from concurrent.futures import ProcessPoolExecutor
+    workers = (os.cpu_count() or 1) if (workers is None) else workers
+    chunksize = max(1, len(work) // (4 * workers))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_batch_job, work, chunksize=chunksize))
 
-    with open(args.input_file, 'r') as infile:
-        p.parse_file(infile)
+import argparse
 
-    with open(args.output_file, 'w') as outfile:
-        outfile.write(p.emit())
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=helpstr)
+    parser.add_argument("-i", "--input-file", type=str,
+                        help="assembly-style file to parse")
+    parser.add_argument("-o", "--output-file", type=str,
+                        help="output .hex file to write to")
+    parser.add_argument("-v", "--verbose", action="count", default=0,
+                        help="log each instruction as it's emitted")
+    parser.add_argument("-O", "--optimize", action="store_true",
+                        help="run the peephole optimizer to make the program smaller")
+    parser.add_argument("-f", "--format", type=str, default=None,
+                        help="output format: hex, hex_compact, bin_le, bin_be, coe or obj (a relocatable "
+                             "module for link.py). "
+                             "By default it's picked from the output file's extension.")
+    parser.add_argument("--cache-dir", type=str, default=None,
+                        help="reuse output for unchanged sources from this cache directory")
+    parser.add_argument("--cache-size", type=int, default=1024,
+                        help="max number of entries to keep in the cache")
+    parser.add_argument("--batch", type=str, nargs="+", default=[], metavar="GLOB",
+                        help="assemble every file matching these globs")
+    parser.add_argument("--manifest", type=str, default=None,
+                        help="assemble every file listed in this manifest")
+    parser.add_argument("--output-dir", type=str, default=None,
+                        help="in batch mode, write outputs here instead of next to the inputs")
+    parser.add_argument("-j", "--jobs", type=int, default=None,
+                        help="in batch mode, number of worker processes (default: one per core)")
+    args = parser.parse_args()
+
+    if ((len(args.batch) != 0) or (args.manifest is not None)):
+        jobs = []
+        for pattern in args.batch:
+            matches = sorted(glob.glob(pattern, recursive=True))
+            if (len(matches) == 0):
+                print(f"warning: {pattern} didn't match any files")
+            jobs.extend((m, None) for m in matches)
+        if (args.manifest is not None):
+            jobs.extend(read_manifest(args.manifest))
+
+        try:
+            results = assemble_batch(jobs, args.format, args.optimize, args.cache_dir,
+                                     args.cache_size, args.output_dir, args.jobs)
+        except ValueError as e:
+            sys.exit(f"error: {e}")
+        failed = [(f, err) for (f, saved, err) in results if (err is not None)]
+        cached = sum(1 for (f, saved, err) in results if ((err is None) and (saved is None)))
+        print(f"assembled {len(results) - len(failed)} of {len(results)} files "
+              f"({cached} from cache)")
+        for f, err in failed:
+            print(f"  {f}: {err}")
+        sys.exit(1 if (len(failed) != 0) else 0)
+
+    if ((args.input_file is None) or (args.output_file is None)):
+        parser.error("either -i and -o, or --batch/--manifest, are required")
+
+    cache = None
+    if (args.cache_dir is not None):
+        cache = SimpleAsmCache(args.cache_dir, args.cache_size)
+
+    saved = assemble_file(args.input_file, args.output_file, args.format, args.optimize, cache,
+                          args.verbose)
+    if (args.optimize and (saved is not None)):
+        print(f"optimizer saved {saved} words")
@@ -0,0 +1,168 @@
+#!/usr/bin/python3
+
+# Copyright 2026 John Mamish
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+helpstr = \
+""" Finds the shortest run of 'const delay' words that keeps the i2c controller busy for an exact
+number of clock cycles (or as close as a given tolerance allows).
+"""
+
+# A single 'const delay' word can only encode m << e (8-bit m, 4-bit e), and it keeps the controller
+# busy for WAIT_OVERHEAD_CYCLES more than that, so most cycle counts can't be had from one word.
+# They can from a few: plan_delay() searches for the fewest words whose total time hits the
+# request exactly, or failing that within 'tolerance', and among equally short plans picks the
+# most accurate one.
+#
+#   - one word is a lookup of the nearest encodable value
+#   - for more words, the longest word is tried at the few largest mantissas that fit at each
+#     exponent, and the rest is planned the same way with one word fewer
+#
+# That's a heuristic, but leftovers are almost always small enough to be encodable, and it finds
+# the fewest words possible for every cycle count we've checked it against an exhaustive search for.
+#
+# Anything longer than a few of the longest words is padded with MAX_WAIT_CYCLES words first and
+# the rest is planned as above. The controller has no counter register, so there's no way to loop a
+# fixed number of times; a run of maximum-length words is the cheapest way to get there and costs
+# one word per ~8.4 million cycles.
+#
+# Results are memoized, since programs tend to ask for the same handful of delays over and over.
+#
+# The times assume the controller's arg register isn't 0 when the first word starts. The RTL
+# compares against the previous arg on a delay's first cycle, so a delay right after something that
+# left arg at 0 finishes after a single cycle (see simulate.py). None of the words planned here
+# encode 0, so only the first word of a plan is affected.
+
+import bisect
+import functools
+
+import machine_code as mc
+
+# every value a single word can encode, and how many cycles each word takes
+ENCODABLE = sorted({m << e for m in range(1, 0x100) for e in range(0x10)})
+COSTS = [v + mc.WAIT_OVERHEAD_CYCLES for v in ENCODABLE]
+
+MIN_CYCLES = COSTS[0]
+MAX_WORD_CYCLES = COSTS[-1]
+
+# how many of the largest mantissas at each exponent are tried for a plan's longest word, and the
+# most words planned after padding
+SEARCH_WIDTH = 4
+MAX_PLAN_WORDS = 5
+
+# The 'const delay' word for an encodable value
+def encode(value: int) -> int:
+    exponent = max(0, value.bit_length() - 8)
+    mantissa = value >> exponent
+    if ((mantissa << exponent) != value):
+        raise ValueError(f"{value} can't be encoded in a single delay word")
+    return (mc.OPCODE_WAIT << 12) | (exponent << 8) | mantissa
+
+# Total cycles taken by a plan
+def plan_cycles(plan) -> int:
+    return sum(v + mc.WAIT_OVERHEAD_CYCLES for v in plan)
+
+# The index in COSTS of the cost nearest to 'cycles'
+def _nearest(cycles: int) -> int:
+    i = bisect.bisect_left(COSTS, cycles)
+    if (i == len(COSTS)): return i - 1
+    if ((i > 0) and ((cycles - COSTS[i - 1]) <= (COSTS[i] - cycles))): return i - 1
+    return i
+
+# The most accurate plan of exactly 'words' words for 'cycles' cycles, or None if none is within
+# 'tolerance'. Plans are tuples of encodable values, longest first.
+@functools.lru_cache(maxsize=4096)
+def _best(cycles: int, tolerance: int, words: int):
+    if (words == 1):
+        i = _nearest(cycles)
+        return (ENCODABLE[i],) if (abs(COSTS[i] - cycles) <= tolerance) else None
+
+    # the longest word is at least 1/words of the total; try the few largest values under the
+    # most it could be at each exponent
+    best, best_err = None, tolerance + 1
+    most = cycles + tolerance - (words - 1) * MIN_CYCLES - mc.WAIT_OVERHEAD_CYCLES
+    for e in range(0x10):
+        top = min(0xff, most >> e) if (most > 0) else 0
+        for m in range(top, max(0, top - SEARCH_WIDTH), -1):
+            c = (m << e) + mc.WAIT_OVERHEAD_CYCLES
+            if ((words * c) < (cycles - tolerance)): break
+            rest = _best(cycles - c, tolerance, words - 1)
+            if ((rest is None) or (rest[0] > (m << e))): continue
+            err = abs(c + plan_cycles(rest) - cycles)
+            if (err < best_err):
+                best, best_err = ((m << e),) + rest, err
+        if (best_err == 0): break
+    return best
+
+# Returns the shortest plan (a tuple of encodable delay values, one per word) that takes 'cycles'
+# cycles to within 'tolerance'. Raises ValueError if there isn't one.
+@functools.lru_cache(maxsize=4096)
+def plan_delay(cycles: int, tolerance: int = 0) -> tuple:
+    if (tolerance < 0):
+        raise ValueError(f"tolerance can't be negative ({tolerance})")
+    if ((cycles + tolerance) < MIN_CYCLES):
+        raise ValueError(f"{cycles} cycles is shorter than the shortest delay word "
+                         f"({MIN_CYCLES} cycles)")
+
+    # pad with the longest words until what's left is between one and two of them
+    fill = max(0, -(-(cycles - tolerance) // MAX_WORD_CYCLES) - 3)
+    while (fill >= 0):
+        rest = cycles - fill * MAX_WORD_CYCLES
+        for words in range(1, MAX_PLAN_WORDS + 1):
+            plan = _best(rest, tolerance, words)
+            if (plan is not None):
+                return (ENCODABLE[-1],) * fill + plan
+        fill -= 1
+    raise ValueError(f"no plan of delay words takes {cycles} cycles to within {tolerance}")
+
+# Like plan_delay(), for a delay that starts while the arg register is 0 ('arg_zero' is True) or
+# might be (None). A word that starts that way is swallowed in SWALLOWED_WAIT_CYCLES, so a 1-cycle
+# word goes first and the rest is planned around it; after that arg isn't 0 any more. When it isn't
+# known, the plan is exact for a non-zero arg and a cycle short for a zero one, and one cycle of
+# 'tolerance' goes to covering both. Delays too short for that are planned as if arg isn't 0.
+def plan_delay_after(cycles: int, tolerance: int = 0, arg_zero: bool = False) -> tuple:
+    if (arg_zero is False):
+        return plan_delay(cycles, tolerance)
+
+    first = mc.SWALLOWED_WAIT_CYCLES if (arg_zero) else plan_cycles((1,))
+    rest_tolerance = tolerance if (arg_zero) else max(0, tolerance - 1)
+    if (abs(cycles - first) <= rest_tolerance):
+        return (1,)
+    if ((cycles - first + rest_tolerance) >= MIN_CYCLES):
+        return (1,) + plan_delay(cycles - first, rest_tolerance)
+    if (arg_zero is None):
+        return plan_delay(cycles, tolerance)
+    raise ValueError(f"{cycles} cycles is too short for a delay that starts with arg at 0: the "
+                     f"first word takes {first} cycles and the shortest one after it {MIN_CYCLES}")
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=helpstr)
+    parser.add_argument("cycles", type=lambda s: int(s, 0), nargs="+",
+                        help="total cycles to delay for")
+    parser.add_argument("-t", "--tolerance", type=int, default=0,
+                        help="how many cycles the plan may be off by")
+    args = parser.parse_args()
+
+    for cycles in args.cycles:
+        plan = plan_delay(cycles, args.tolerance)
+        words = " ".join(f"4_{(encode(v) >> 8) & 0xf:01x}_{encode(v) & 0xff:02x}" for v in plan)
+        print(f"{cycles}: {len(plan)} words, {plan_cycles(plan)} cycles: {words}")
@@ -0,0 +1,293 @@
+#!/usr/bin/python3
+
+# Copyright 2026 John Mamish
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+helpstr = \
+""" Turns i2c controller machine code (.hex or .bin) back into assembly.
+
+Every address that's jumped to gets a label. With --verify, the assembly is assembled again and
+checked against the original image word for word; the exit status is nonzero if any image doesn't
+round-trip.
+"""
+
+# Multi-word sequences that assemble.py emits for one instruction are folded back into that
+# instruction (e.g. a write with a repeated start, a device address write and a read become one
+# 'i2c_writeread'), unless something jumps into the middle of them. XFERs that don't fit any of the
+# compound instructions come out as 'i2c_write_raw' / 'i2c_read_raw'.
+#
+# Some words have no assembly that produces them - relative jumps, reads that don't NAK their last
+# byte, and so on. They're written out as comments, so the output won't assemble to the same image
+# and --verify reports it. All-zero words after the last instruction (unused memory) are dropped.
+
+import os
+import sys
+
+import machine_code as mc
+from assemble import make_parser, DelayInstruction
+
+END_CONDITION_NAMES = {
+    mc.END_CONDITION_NONE: "none",
+    mc.END_CONDITION_REPEATED_START: "repeated_start",
+    mc.END_CONDITION_STOP: "stop",
+}
+
+# One line of disassembly. 'text' is None for words that can't be written as assembly.
+class DisassembledInstruction:
+    def __init__(self, address: int, size: int, text: str, note: str = None):
+        self.address = address
+        self.size = size
+        self.text = text
+        self.note = note
+
+def label_name(address: int) -> str:
+    return f"_addr_{address:03x}"
+
+def _unpack_bytes(words, n) -> list:
+    b = []
+    for w in words:
+        b += [(w >> 8) & 0xff, w & 0xff]
+    return b[:n]
+
+def _hex(values) -> str:
+    return " ".join(f"0x{v:02x}" for v in values)
+
+# Decodes the XFER at words[a]. Returns (size in words, text, note)
+def _decode_xfer(words, a, targets):
+    w = words[a]
+    nak_last, is_read, end, n = mc.xfer_fields(w)
+    end_name = END_CONDITION_NAMES.get(end)
+
+    if (is_read):
+        if ((not nak_last) or (end_name is None)):
+            return (1, None, "read that the assembler can't encode")
+        return (1, f"i2c_read_raw {n}b end_condition={end_name}", None)
+
+    size = 1 + ((n + 1) // 2)
+    if ((a + size) > len(words)):
+        return (1, None, "xfer runs off the end of the image")
+    if (nak_last or (end_name is None)):
+        return (1, None, "write that the assembler can't encode")
+    data = _unpack_bytes(words[a + 1:a + size], n)
+    note = None
+    if (((n % 2) != 0) and ((words[a + size - 1] & 0xff) != 0)):
+        note = f"padding byte 0x{words[a + size - 1] & 0xff:02x} isn't reproduced"
+
+    # the 3-word read that i2c_read and i2c_writeread end with. Only the first word of the whole
+    # instruction can be jumped to.
+    def read_tail(t, addr_byte):
+        if (any((x in targets) for x in range(t, t + 3) if (x != a)) or ((t + 3) > len(words))):
+            return None
+        if ((words[t] != 0x0001) or ((words[t + 2] & 0xff00) != 0x0e00)):
+            return None
+        if ((addr_byte is None) and (((words[t + 1] >> 8) & 1) == 1) and ((words[t + 1] & 0xff) == 0)):
+            return words[t + 2] & 0xff
+        if ((addr_byte is not None) and (words[t + 1] == ((addr_byte | 1) << 8))):
+            return words[t + 2] & 0xff
+        return None
+
+    if (read_tail(a, None) is not None):
+        return (3, f"i2c_read {words[a + 2] & 0xff}b 0x{words[a + 1] >> 9:02x}", None)
+
+    if ((n >= 1) and ((data[0] & 1) == 0)):
+        dev = data[0] >> 1
+        if (end == mc.END_CONDITION_STOP):
+            return (size, f"i2c_write 0x{dev:02x} {_hex(data[1:])}".rstrip(), note)
+        if (end == mc.END_CONDITION_REPEATED_START):
+            read_length = read_tail(a + size, data[0])
+            if (read_length is not None):
+                return (size + 3, f"i2c_writeread {read_length}b 0x{dev:02x} {_hex(data[1:])}".rstrip(),
+                        note)
+
+    if (n > 254):
+        return (size, None, "write is too long for i2c_write_raw")
+    return (size, f"i2c_write_raw {_hex(data)} end_condition={end_name}".lstrip(), note)
+
+# Decodes the instruction at words[a]. Returns (size in words, text, note)
+def _decode_one(words, a, targets):
+    w = words[a]
+    op = mc.opcode(w)
+    arg = w & 0xfff
+
+    if (op == mc.OPCODE_XFER):
+        return _decode_xfer(words, a, targets)
+    if (op == mc.OPCODE_SET_READ_TAG):
+        return (1, f"set_read_tag 0x{arg:03x}", None)
+    if (op == mc.OPCODE_WAIT):
+        cycles = mc.wait_cycles(w)
+        if (cycles == 0):
+            return (1, None, "zero-length delay")
+        note = None
+        if (DelayInstruction.encode(cycles) != (((w >> 8) & 0xf), (w & 0xff))):
+            note = "re-encodes as a different word with the same delay"
+        return (1, f"delay {cycles}", note)
+    if (op == mc.OPCODE_TRIG):
+        return (1, f"wait_trigger {(arg >> 6) & 0x3f:06b} {arg & 0x3f:06b}", None)
+    if (op == mc.OPCODE_OUTPUT_TRIG):
+        if (arg > 0x3f):
+            return (1, None, "output trigger value is wider than 6 bits")
+        return (1, f"write_trigger {arg:06b}", None)
+    if (op == mc.OPCODE_JMP):
+        return (1, f"jmp {label_name(arg)}", None)
+    if (op == mc.OPCODE_JMP_COND):
+        if ((a + 1) >= len(words)):
+            return (1, None, "jmp_mask_unsatisfied runs off the end of the image")
+        mask = words[a + 1]
+        return (2, f"jmp_mask_unsatisfied {label_name(arg)} 0x{mask >> 8:02x} 0x{mask & 0xff:02x}", None)
+    if (op == mc.OPCODE_JMP_RELATIVE):
+        return (1, None, "relative jump")
+    return (1, None, f"unknown opcode {op:x}")
+
+# Returns every address that a jmp or jmp_mask_unsatisfied can go to. Jumps are always single
+# words in the same place no matter how XFERs get grouped, so a plain scan finds all of them.
+def jump_targets(words) -> set:
+    targets = set()
+    a = 0
+    while (a < len(words)):
+        size, text, note = _decode_one(words, a, frozenset())
+        if (mc.opcode(words[a]) in (mc.OPCODE_JMP, mc.OPCODE_JMP_COND)):
+            targets.add(words[a] & 0xfff)
+        a += size
+    return targets
+
+# Drops unused memory from the end of an image: trailing zero words and words the image doesn't
+# give. The image is decoded first, so zero data words that belong to an instruction (e.g. the
+# last word of 'i2c_write 0x10 0x00 0x00') are kept; only lone zero words after the last
+# instruction go. Memory that's jumped to is kept.
+def trim(words) -> list:
+    words = [0 if (w is None) else w for w in words]
+    instrs, targets = decode(words)
+    end = 0
+    for instr in instrs:
+        if ((instr.size != 1) or (words[instr.address] != 0)):
+            end = instr.address + instr.size
+    keep = max([end] + [t + 1 for t in targets if (t < len(words))])
+    return words[:keep]
+
+# Decodes a whole image. Returns (list of DisassembledInstruction, jump targets)
+def decode(words):
+    targets = jump_targets(words)
+    instrs = []
+    a = 0
+    while (a < len(words)):
+        size, text, note = _decode_one(words, a, targets)
+        instrs.append(DisassembledInstruction(a, size, text, note))
+        a += size
+    return instrs, targets
+
+# Returns the image as assembly source
+def disassemble(words, source_name: str = None) -> str:
+    instrs, targets = decode(words)
+    starts = {i.address for i in instrs}
+    lines = []
+    if (source_name is not None):
+        lines.append(f"# disassembled from {source_name}")
+
+    for t in sorted(targets):
+        if ((t not in starts) and (t < len(words))):
+            lines.append(f"# warning: jump target {t:03x} is in the middle of an instruction")
+        if (t > len(words)):
+            lines.append(f"# warning: jump target {t:03x} is past the end of the image")
+
+    for instr in instrs:
+        if (instr.address in targets):
+            lines.append(f"{label_name(instr.address)}:")
+        comment = f"# {instr.address:03x}"
+        if (instr.note is not None):
+            comment += f": {instr.note}"
+        if (instr.text is None):
+            raw = " ".join(f"{w:04x}" for w in words[instr.address:instr.address + instr.size])
+            lines.append(f"    {'# ' + raw:40} {comment}")
+        else:
+            lines.append(f"    {instr.text:40} {comment}")
+
+    if (len(words) in targets):
+        lines.append(f"{label_name(len(words))}:")
+    return "\n".join(lines) + "\n"
+
+# Assembles 'source' and compares it with 'words'. Returns a list of mismatched addresses, which is
+# empty if the image round-trips. Raises ValueError if 'source' doesn't assemble at all, e.g.
+# because a label would have to be in the middle of an instruction.
+def verify(words, source: str) -> list:
+    import io
+    import contextlib
+
+    p = make_parser()
+    with contextlib.redirect_stdout(io.StringIO()):
+        p.parse_file(io.StringIO(source))
+        out = list(p.emit_words())
+    n = max(len(out), len(words))
+    out += [None] * (n - len(out))
+    words = list(words) + [None] * (n - len(words))
+    return [a for a in range(n) if (out[a] != words[a])]
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=helpstr)
+    parser.add_argument("input_files", type=str, nargs="+",
+                        help=".hex or .bin images to disassemble")
+    parser.add_argument("-o", "--output-file", type=str, default=None,
+                        help="file to write the assembly to when there's one input (default stdout)")
+    parser.add_argument("--output-dir", type=str, default=None,
+                        help="write one .i2casm file per input into this directory")
+    parser.add_argument("--byteorder", type=str, default="little", choices=("little", "big"),
+                        help="byte order of .bin images")
+    parser.add_argument("--verify", action="store_true",
+                        help="check that each image round-trips through the assembler")
+    args = parser.parse_args()
+
+    if ((args.output_file is not None) and (len(args.input_files) != 1)):
+        parser.error("-o only works with one input file; use --output-dir")
+    if (args.output_dir is not None):
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    failed = 0
+    for filename in args.input_files:
+        words = trim(mc.read_image(filename, args.byteorder))
+        source = disassemble(words, os.path.basename(filename))
+
+        if (args.output_dir is not None):
+            stem = os.path.splitext(os.path.basename(filename))[0]
+            with open(os.path.join(args.output_dir, stem + ".i2casm"), 'w') as outfile:
+                outfile.write(source)
+        elif (args.output_file is not None):
+            with open(args.output_file, 'w') as outfile:
+                outfile.write(source)
+        elif (not args.verify):
+            sys.stdout.write(source)
+
+        if (args.verify):
+            try:
+                mismatches = verify(words, source)
+            except ValueError as e:
+                failed += 1
+                print(f"{filename}: doesn't reassemble: {e}")
+                continue
+
+            if (len(mismatches) != 0):
+                failed += 1
+                shown = " ".join(f"{a:03x}" for a in mismatches[:8])
+                more = " ..." if (len(mismatches) > 8) else ""
+                print(f"{filename}: doesn't round-trip, {len(mismatches)} word(s) differ at {shown}{more}")
+            else:
+                print(f"{filename}: ok ({len(words)} words)")
+
+    sys.exit(1 if (failed != 0) else 0)
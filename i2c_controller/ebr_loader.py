@@ -0,0 +1,177 @@
+#!/usr/bin/python3
+
+# Copyright 2026 John Mamish
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+helpstr = \
+""" Generates an i2c controller program that loads a memory image into an EBR through
+hdl/i2c_memory_writer_peripheral.v.
+
+Given an old image as well, only the bytes that changed are written.
+"""
+
+# Each message to the peripheral is
+#     <start>  device address  memory address  data ...  <stop>
+# with no read/write bit: the peripheral compares the whole first byte against its
+# 'device_address' parameter (8'hfe by default). It shifts bits in LSB first, though, while i2c
+# sends them MSB first, so every byte arrives bit-reversed. The program sends each byte reversed
+# so that the peripheral ends up with the intended value. That also means the first byte can't be
+# sent with i2c_write, which always puts a 0 in the bit that ends up as the MSB, so messages are
+# sent with i2c_write_raw.
+#
+# As written, the peripheral doesn't step its memory address from one data byte to the next: every
+# data byte in a message is written to the same address. So by default every byte gets a message
+# of its own. --auto-increment is for a peripheral that does step the address, where one message
+# can carry a run of up to 252 bytes (what fits in one i2c_write_raw after the two address bytes).
+#
+# Which bytes go in which message is chosen to send the fewest bytes on the bus. Every message
+# costs two bytes of addressing (and a start and stop condition), so two changed ranges a couple of
+# bytes apart are cheaper to send as one message that rewrites the unchanged bytes in between. A
+# dynamic program over the image finds the best split exactly; when two splits send the same
+# number of bytes, the one with fewer messages wins.
+
+import io
+import os
+
+import machine_code as mc
+from assemble import make_parser, I2CWriteRawInstruction, FORMAT_FOR_EXTENSION
+from import_regs import to_asm, cost, MAX_WRITE_BYTES
+
+DEVICE_ADDRESS = 0xfe
+MEMORY_BYTES = 256
+MESSAGE_OVERHEAD_BYTES = 2
+MAX_MESSAGE_DATA = MAX_WRITE_BYTES - MESSAGE_OVERHEAD_BYTES
+
+_REVERSED = bytes(int(f"{b:08b}"[::-1], 2) for b in range(256))
+
+# The byte to send on the bus for the peripheral to receive 'b'
+def bit_reverse(b: int) -> int:
+    return _REVERSED[b]
+
+# Returns which addresses need writing: all of 'new', or the ones where it differs from 'old'
+def changed_addresses(new: bytes, old: bytes = None) -> list:
+    if (old is None):
+        return list(range(len(new)))
+    if (len(old) != len(new)):
+        raise ValueError(f"the old image is {len(old)} bytes but the new one is {len(new)}")
+    return [a for a in range(len(new)) if (new[a] != old[a])]
+
+# Splits the addresses in 'changed' (sorted) into messages. Returns a list of (first address,
+# length) that covers every changed address with the fewest bytes on the bus and then the fewest
+# messages. Bytes in between that didn't change are sent again if that's cheaper.
+def plan_messages(changed: list, max_data: int = MAX_MESSAGE_DATA) -> list:
+    n = len(changed)
+    if (n == 0):
+        return []
+
+    # best[i] is (bus bytes, messages) to send changed[:i], and start[i] is where the last of those
+    # messages starts in 'changed'
+    best = [(0, 0)] + [None] * n
+    start = [0] * (n + 1)
+    for i in range(1, n + 1):
+        last = changed[i - 1]
+        j = i - 1
+        while ((j >= 0) and ((last - changed[j]) < max_data)):
+            b, m = best[j]
+            c = (b + MESSAGE_OVERHEAD_BYTES + (last - changed[j] + 1), m + 1)
+            if ((best[i] is None) or (c < best[i])):
+                best[i], start[i] = c, j
+            j -= 1
+
+    messages = []
+    i = n
+    while (i > 0):
+        j = start[i]
+        messages.append((changed[j], changed[i - 1] - changed[j] + 1))
+        i = j
+    return messages[::-1]
+
+# Turns messages into i2c_write_raw instructions that write 'image' (indexed from 'base')
+def build_instructions(image: bytes, messages: list, base: int = 0,
+                       device_address: int = DEVICE_ADDRESS) -> list:
+    instrs = []
+    for address, length in messages:
+        payload = [device_address, base + address] + list(image[address:address + length])
+        args = [f"0x{bit_reverse(b):02x}" for b in payload]
+        instr = I2CWriteRawInstruction(" ".join(args), 0, 0)
+        instr.parse()
+        instrs.append(instr)
+    return instrs
+
+# Plans and builds the program that loads 'new', or that turns 'old' into 'new'
+def loader_instructions(new: bytes, old: bytes = None, base: int = 0,
+                        device_address: int = DEVICE_ADDRESS, auto_increment: bool = False) -> list:
+    if ((base + len(new)) > MEMORY_BYTES):
+        raise ValueError(f"the image is {len(new)} bytes at {base}, but the peripheral only "
+                         f"addresses {MEMORY_BYTES} bytes")
+    max_data = MAX_MESSAGE_DATA if (auto_increment) else 1
+    messages = plan_messages(changed_addresses(new, old), max_data)
+    return build_instructions(new, messages, base, device_address)
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=helpstr)
+    parser.add_argument("image", type=str, help="binary image to load")
+    parser.add_argument("-o", "--output-file", type=str, required=True,
+                        help="output file; assembly unless it has a machine-code extension "
+                             "(.hex, .mem, .bin, .coe), in which case it's assembled")
+    parser.add_argument("--old", type=str, default=None,
+                        help="image that's already loaded; only the bytes that differ are written")
+    parser.add_argument("--base", type=lambda s: int(s, 0), default=0,
+                        help="memory address that the image starts at")
+    parser.add_argument("--device-address", type=lambda s: int(s, 0), default=DEVICE_ADDRESS,
+                        help="device_address parameter of the peripheral")
+    parser.add_argument("--auto-increment", action="store_true",
+                        help="the peripheral steps its memory address after every data byte, so "
+                             "messages can carry runs of bytes")
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        new = f.read()
+    old = None
+    if (args.old is not None):
+        with open(args.old, 'rb') as f:
+            old = f.read()
+
+    instrs = loader_instructions(new, old, args.base, args.device_address, args.auto_increment)
+    source = to_asm(instrs)
+
+    ext = os.path.splitext(args.output_file)[1].lower()
+    if (ext in FORMAT_FOR_EXTENSION):
+        p = make_parser()
+        p.parse_file(io.StringIO(source))
+        fmt = FORMAT_FOR_EXTENSION[ext]
+        with open(args.output_file, 'wb' if p.output_format_is_binary(fmt) else 'w') as outfile:
+            p.emit_format(fmt, outfile)
+    else:
+        with open(args.output_file, 'w') as outfile:
+            outfile.write(f"# generated by ebr_loader.py from {os.path.basename(args.image)}\n")
+            outfile.write(source)
+
+    full_words, full_bytes = cost(loader_instructions(new, None, args.base, args.device_address,
+                                                      args.auto_increment))
+    words, bus_bytes = cost(instrs)
+    changed = len(changed_addresses(new, old))
+    print(f"{changed} of {len(new)} bytes to write -> {len(instrs)} messages, {words} words, "
+          f"{bus_bytes} bytes on the bus (a full load is {full_bytes} bytes, {full_words} words)")
+    if (words > mc.MEM_NUM_WORDS):
+        print(f"warning: that's more than the {mc.MEM_NUM_WORDS} words of program memory an i2c "
+              f"controller has by default")
@@ -0,0 +1,214 @@
+#!/usr/bin/python3
+
+# Copyright 2026 John Mamish
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+helpstr = \
+""" Estimates how long an i2c controller program takes to run.
+
+The program is split into segments at every label and each segment's straight-line execution time
+is reported, along with the time for the whole program (or up to a given label). Time spent waiting
+on input triggers and extra trips around polling loops can't be known ahead of time; segments that
+contain them are flagged.
+"""
+
+# Every i2c frame has to line up with the free-running scl divider, so how long a segment takes
+# depends on the divider's phase when the segment starts. Each segment is timed once for every
+# possible starting phase using the same edge model as simulate.py: 'worst' is the slowest of
+# these and 'nominal' is their mean. The whole-program figure is timed exactly from reset, taking
+# the straight-line path through every segment.
+
+import machine_code as mc
+from simulate import I2CControllerSimulator, _Stop
+
+# Timing for one label-to-label stretch of a program
+class SegmentEstimate:
+    def __init__(self, name: str, start: int, end: int):
+        self.name = name
+
+        # address range [start, end) covered by the segment in words
+        self.start = start
+        self.end = end
+
+        self.instructions: int = 0
+        self.bus_bytes: int = 0
+        self.nominal_cycles: float = 0
+        self.worst_cycles: int = 0
+
+        # things that can make the segment take longer than estimated
+        self.trigger_waits: int = 0
+        self.polls: int = 0
+
+# Times straight-line runs of instructions. Trigger waits finish immediately and conditional jumps
+# fall through, with both counted so they can be reported.
+class _StraightLineTimer(I2CControllerSimulator):
+    def __init__(self, words, scl_div):
+        super().__init__(words, scl_div=scl_div, mem_num_words=max(len(words), 1))
+        self.trigger_waits = 0
+
+    def _wait_trigger(self, e, low, high):
+        self.trigger_waits += 1
+        return e
+
+    def reset(self, t):
+        self.result = None
+        self.arg = None
+        self.read_tag = None
+        self.read_data = None
+        self.trigger_o = 0
+        self.tx_ready_at = t
+        self.start_cond_needed = True
+        self.bus_device = None
+        self.bus_reading = False
+        self.trigger_waits = 0
+
+    def _event(self, cycle, kind, **data):
+        pass
+
+    # Runs the given instructions in order starting at edge t and returns the edge where the last
+    # one has finished and the i2c bus has gone idle.
+    def time(self, instrs, t):
+        for instr in instrs:
+            self.pc = (instr.offset + 1) & 0xfff
+            try:
+                t = self._execute(self.mem[instr.offset], instr.offset, t + 1)
+            except _Stop:
+                # a jmp to itself still takes its 2 cycles
+                t = t + 2
+        return max(t, self.tx_ready_at)
+
+# Collects the parser's instructions into label-to-label segments.
+# Returns a list of (name, start address, end address, [instructions]).
+def split_segments(parser) -> list:
+    starts = {0: "<start>"}
+    for label in parser.label_positions.values():
+        starts[label.address] = label.name
+
+    addrs = sorted(starts)
+    end = sum(i.get_size_words() for i in parser.firstpass)
+    segments = []
+    for i, a in enumerate(addrs):
+        b = addrs[i + 1] if ((i + 1) < len(addrs)) else end
+        instrs = [instr for instr in parser.firstpass if (a <= instr.offset < b)]
+        if ((len(instrs) == 0) and (a == 0) and (len(addrs) > 1)):
+            continue
+        segments.append((starts[a], a, b, instrs))
+    return segments
+
+# Counts every byte put on the bus, including addresses. One instruction can hold several XFER
+# words (i2c_writeread, i2c_read), each followed by its write data packed 2 bytes to a word.
+def _bus_bytes(words, instrs) -> int:
+    n = 0
+    for instr in instrs:
+        pos = instr.offset
+        end = instr.offset + instr.get_size_words()
+        while (pos < end):
+            w = words[pos]
+            pos += 1
+            if (mc.opcode(w) == mc.OPCODE_XFER):
+                nak_last, is_read, end_condition, length = mc.xfer_fields(w)
+                n += length
+                if (not is_read):
+                    pos += (length + 1) // 2
+    return n
+
+def _is_poll(words, instr) -> bool:
+    return mc.opcode(words[instr.offset]) == mc.OPCODE_JMP_COND
+
+# Estimates the run time of every segment of a parsed program.
+# 'until' optionally names a label where the whole-program total stops.
+# Returns (list of SegmentEstimate, total nominal cycles, total worst-case cycles)
+def estimate(parser, scl_div: int, until: str = None):
+    words = list(parser.emit_words())
+    timer = _StraightLineTimer(words, scl_div)
+
+    estimates = []
+    for name, start, end, instrs in split_segments(parser):
+        seg = SegmentEstimate(name, start, end)
+        seg.instructions = len(instrs)
+        seg.bus_bytes = _bus_bytes(words, instrs)
+        seg.polls = sum(1 for instr in instrs if _is_poll(words, instr))
+
+        total = 0
+        for phase in range(scl_div):
+            timer.reset(phase)
+            cycles = timer.time(instrs, phase) - phase
+            total += cycles
+            seg.worst_cycles = max(seg.worst_cycles, cycles)
+        seg.trigger_waits = timer.trigger_waits
+        seg.nominal_cycles = total / scl_div
+        estimates.append(seg)
+
+    # time the whole program from reset, where the divider phase is known
+    whole = []
+    for seg, (name, start, end, instrs) in zip(estimates, split_segments(parser)):
+        if ((until is not None) and (name == until)): break
+        whole.append((seg, instrs))
+    else:
+        if (until is not None):
+            raise ValueError(f"unknown label {until}")
+
+    timer.reset(0)
+    total_nominal = timer.time([i for (seg, instrs) in whole for i in instrs], 0)
+    total_worst = sum(seg.worst_cycles for (seg, instrs) in whole)
+    return estimates, total_nominal, total_worst
+
+def format_time(seconds: float) -> str:
+    if (seconds >= 1): return f"{seconds:.3f} s"
+    if (seconds >= 1e-3): return f"{seconds * 1e3:.3f} ms"
+    return f"{seconds * 1e6:.3f} us"
+
+def format_report(estimates, total_nominal, total_worst, clock_hz: float) -> str:
+    lines = []
+    lines.append(f"{'segment':24} {'addr':>9} {'bytes':>6} {'nominal':>12} {'worst':>12}  notes")
+    for seg in estimates:
+        notes = []
+        if (seg.trigger_waits): notes.append(f"+{seg.trigger_waits} trigger wait(s)")
+        if (seg.polls): notes.append(f"+{seg.polls} poll loop(s)")
+        lines.append(f"{seg.name:24} {seg.start:4d}-{seg.end:<4d} {seg.bus_bytes:6d} "
+                     f"{format_time(seg.nominal_cycles / clock_hz):>12} "
+                     f"{format_time(seg.worst_cycles / clock_hz):>12}  {', '.join(notes)}")
+    lines.append("")
+    lines.append(f"whole program: {format_time(total_nominal / clock_hz)} nominal "
+                 f"({total_nominal} cycles from reset), "
+                 f"{format_time(total_worst / clock_hz)} worst case ({total_worst} cycles)")
+    return "\n".join(lines)
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=helpstr)
+    parser.add_argument("-i", "--input-file", type=str, required=True,
+                        help="assembly-style file to analyze")
+    parser.add_argument("--scl-div", type=int, required=True,
+                        help="SCL_DIV parameter of the i2c controller")
+    parser.add_argument("--clock-hz", type=float, required=True,
+                        help="frequency of the clock driving the i2c controller")
+    parser.add_argument("--until", type=str, default=None,
+                        help="only count the whole-program time up to this label")
+    args = parser.parse_args()
+
+    from assemble import make_parser
+    p = make_parser()
+    with open(args.input_file, 'r') as infile:
+        p.parse_file(infile)
+
+    estimates, total_nominal, total_worst = estimate(p, args.scl_div, args.until)
+    print(format_report(estimates, total_nominal, total_worst, args.clock_hz))
@@ -0,0 +1,250 @@
+#!/usr/bin/python3
+
+# Copyright 2026 John Mamish
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+helpstr = \
+""" Converts a vendor register init table into an i2c controller program.
+
+The table is a list of (register, value) writes in CSV or JSON. Writes to consecutive registers are
+coalesced into auto-incrementing bursts, so each burst only pays for one start condition, device
+address, register address and stop condition.
+
+The output is i2c controller assembly that can be '.include'd into another program, unless the
+output file has a machine-code extension (.hex, .mem, .bin, .coe), in which case it's assembled.
+"""
+
+# CSV tables have one write per row: 'register,value'. A header row and extra columns are ignored.
+# A row of the form 'delay,<cycles>' inserts a delay, which also ends any burst in progress.
+#
+# JSON tables are either a list of writes or an object with a "registers" list of them, which may
+# also give "device" and "reg_bytes". Each write is a [register, value] pair, a
+# {"register": ..., "value": ...} object or a {"delay": cycles} object.
+#
+# Numbers can be given as JSON numbers or as strings in any base that python's int(x, 0) accepts.
+#
+# Bursts are at most 255 bytes on the bus (the most an 'i2c_write' can send): the device address,
+# the register address and up to 253 (or 252 with 16-bit register addresses) values. With --chain,
+# longer runs stay in one transaction: the rest of the run is sent with 'i2c_write_raw' frames that
+# don't end in a stop condition, since the controller only sends a start condition after a stop or
+# repeated start.
+
+import csv
+import io
+import json
+import os
+
+import machine_code as mc
+from assemble import (make_parser, I2CWriteInstruction, I2CWriteRawInstruction, DelayInstruction,
+                      FORMAT_FOR_EXTENSION)
+
+# Most data bytes that one i2c_write or i2c_write_raw instruction accepts
+MAX_WRITE_BYTES = 254
+
+class RegisterWrite:
+    def __init__(self, register: int, value: int, line_number: int):
+        self.register = register
+        self.value = value
+        self.line_number = line_number
+
+class RegisterDelay:
+    def __init__(self, cycles: int, line_number: int):
+        self.cycles = cycles
+        self.line_number = line_number
+
+def _number(x, line_number, what, maximum):
+    try:
+        n = x if isinstance(x, int) else int(str(x).strip(), 0)
+    except ValueError as e:
+        raise ValueError(f"line {line_number}: couldn't parse {what} {x!r}")
+    if ((n < 0) or (n > maximum)):
+        raise ValueError(f"line {line_number}: {what} {x!r} must be in range 0 - {maximum}")
+    return n
+
+def _entry(reg, value, line_number, reg_bytes):
+    if (str(reg).strip().lower() == "delay"):
+        return RegisterDelay(_number(value, line_number, "delay", mc.MAX_WAIT_CYCLES), line_number)
+    return RegisterWrite(_number(reg, line_number, "register", (1 << (8 * reg_bytes)) - 1),
+                         _number(value, line_number, "value", 0xff), line_number)
+
+# Reads a CSV table. Returns a list of RegisterWrite and RegisterDelay.
+def read_csv_table(f, reg_bytes: int = 1) -> list:
+    entries = []
+    for line_number, row in enumerate(csv.reader(f), start=1):
+        row = [c.split("#", maxsplit=1)[0].strip() for c in row]
+        if ((len(row) < 2) or (row[0] == "")): continue
+        try:
+            entries.append(_entry(row[0], row[1], line_number, reg_bytes))
+        except ValueError as e:
+            # the first row is allowed to be a header
+            if ((line_number == 1) and (len(entries) == 0)): continue
+            raise
+    return entries
+
+# Reads a JSON table. Returns (entries, settings) where settings holds any "device" and
+# "reg_bytes" that the table gives.
+def read_json_table(f, reg_bytes: int = 1):
+    doc = json.load(f)
+    settings = {}
+    if (isinstance(doc, dict)):
+        for k in ("device", "reg_bytes"):
+            if (k in doc):
+                settings[k] = _number(doc[k], 0, k, 0x7f if (k == "device") else 2)
+        reg_bytes = settings.get("reg_bytes", reg_bytes)
+        doc = doc.get("registers", [])
+
+    entries = []
+    for i, e in enumerate(doc, start=1):
+        if (isinstance(e, dict) and ("delay" in e)):
+            entries.append(_entry("delay", e["delay"], i, reg_bytes))
+        elif (isinstance(e, dict)):
+            entries.append(_entry(e.get("register", e.get("reg")), e.get("value", e.get("val")),
+                                  i, reg_bytes))
+        elif (isinstance(e, (list, tuple)) and (len(e) == 2)):
+            entries.append(_entry(e[0], e[1], i, reg_bytes))
+        else:
+            raise ValueError(f"line {i}: expected [register, value], got {e!r}")
+    return entries, settings
+
+# Groups writes to consecutive registers. Returns a list whose items are either a RegisterDelay or
+# a (first register, [values]) run. With 'burst' False, every write gets a run of its own.
+def coalesce(entries, burst: bool = True) -> list:
+    runs = []
+    for e in entries:
+        if (isinstance(e, RegisterDelay)):
+            runs.append(e)
+        elif (burst and (len(runs) != 0) and isinstance(runs[-1], tuple) and
+              ((runs[-1][0] + len(runs[-1][1])) == e.register)):
+            runs[-1][1].append(e.value)
+        else:
+            runs.append((e.register, [e.value]))
+    return runs
+
+def _instruction(cls, args, line_number):
+    instr = cls(" ".join(args), line_number, 0)
+    instr.parse()
+    return instr
+
+def _hex(values) -> list:
+    return [f"0x{v:02x}" for v in values]
+
+# Turns a register table into i2c_write / i2c_write_raw / delay instructions for device 'dev_addr'.
+def build_instructions(entries, dev_addr: int, reg_bytes: int = 1, chain: bool = False,
+                       burst: bool = True) -> list:
+    instrs = []
+    for run in coalesce(entries, burst):
+        if (isinstance(run, RegisterDelay)):
+            instrs.append(_instruction(DelayInstruction, [str(run.cycles)], run.line_number))
+            continue
+
+        register, values = run
+        reg = _hex((register >> (8 * i)) & 0xff for i in reversed(range(reg_bytes)))
+        if ((not chain) or (len(values) <= (MAX_WRITE_BYTES - reg_bytes))):
+            # one i2c_write per burst, each starting with the address of its first register
+            while (len(values) != 0):
+                head = values[:MAX_WRITE_BYTES - reg_bytes]
+                values = values[len(head):]
+                reg = _hex((register >> (8 * i)) & 0xff for i in reversed(range(reg_bytes)))
+                instrs.append(_instruction(I2CWriteInstruction,
+                                           [f"0x{dev_addr:02x}"] + reg + _hex(head), 0))
+                register += len(head)
+        else:
+            # i2c_write_raw doesn't add the device address, so the first frame has to carry it
+            head = values[:MAX_WRITE_BYTES - 1 - reg_bytes]
+            values = values[len(head):]
+            instrs.append(_instruction(I2CWriteRawInstruction,
+                                       [f"0x{dev_addr << 1:02x}"] + reg + _hex(head) +
+                                       ["end_condition=none"], 0))
+            while (len(values) != 0):
+                body = values[:MAX_WRITE_BYTES]
+                values = values[len(body):]
+                end = "stop" if (len(values) == 0) else "none"
+                instrs.append(_instruction(I2CWriteRawInstruction,
+                                           _hex(body) + [f"end_condition={end}"], 0))
+    return instrs
+
+# Renders instructions as assembly source
+def to_asm(instrs) -> str:
+    lines = []
+    for instr in instrs:
+        lines.append(f"    {instr.MNEMONIC} {instr.argtext}")
+    return "\n".join(lines) + "\n"
+
+# Returns (program words, bytes on the bus) for a list of instructions
+def cost(instrs):
+    words = 0
+    bus_bytes = 0
+    for instr in instrs:
+        words += instr.get_size_words()
+        if (instr.MNEMONIC == "i2c_write"):
+            bus_bytes += len(instr.write_bytes) + 1
+        elif (instr.MNEMONIC == "i2c_write_raw"):
+            bus_bytes += len(instr.write_bytes)
+    return (words, bus_bytes)
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=helpstr)
+    parser.add_argument("-i", "--input-file", type=str, required=True,
+                        help=".csv or .json register table")
+    parser.add_argument("-o", "--output-file", type=str, required=True,
+                        help="assembly (.i2casm) or machine code file to write")
+    parser.add_argument("-d", "--device", type=lambda x: int(x, 0), default=None,
+                        help="7-bit i2c address of the device")
+    parser.add_argument("--reg-bytes", type=int, default=None, choices=(1, 2),
+                        help="width of the device's register addresses in bytes (default 1)")
+    parser.add_argument("--chain", action="store_true",
+                        help="keep runs longer than one burst in a single i2c transaction")
+    args = parser.parse_args()
+
+    settings = {}
+    reg_bytes = 1 if (args.reg_bytes is None) else args.reg_bytes
+    with open(args.input_file, 'r', newline='') as f:
+        if (args.input_file.lower().endswith(".json")):
+            entries, settings = read_json_table(f, reg_bytes)
+        else:
+            entries = read_csv_table(f, reg_bytes)
+
+    if (args.reg_bytes is None):
+        reg_bytes = settings.get("reg_bytes", reg_bytes)
+    device = settings.get("device") if (args.device is None) else args.device
+    if (device is None):
+        parser.error("the table doesn't name a device, so --device is required")
+
+    instrs = build_instructions(entries, device, reg_bytes, args.chain)
+    source = to_asm(instrs)
+
+    ext = os.path.splitext(args.output_file)[1].lower()
+    if (ext in FORMAT_FOR_EXTENSION):
+        p = make_parser()
+        p.parse_file(io.StringIO(source))
+        fmt = FORMAT_FOR_EXTENSION[ext]
+        with open(args.output_file, 'wb' if p.output_format_is_binary(fmt) else 'w') as outfile:
+            p.emit_format(fmt, outfile)
+    else:
+        with open(args.output_file, 'w') as outfile:
+            outfile.write(f"# generated by import_regs.py from {os.path.basename(args.input_file)}\n")
+            outfile.write(source)
+
+    naive_words, naive_bytes = cost(build_instructions(entries, device, reg_bytes, burst=False))
+    words, bus_bytes = cost(instrs)
+    print(f"{len(entries)} table entries -> {len(instrs)} instructions, "
+          f"{words} words (vs {naive_words}), {bus_bytes} bytes on the bus (vs {naive_bytes})")
@@ -0,0 +1,115 @@
+#!/usr/bin/python3
+
+# Copyright 2026 John Mamish
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+helpstr = \
+""" Links i2c controller modules into one program memory image.
+
+Modules are .i2casm sources or relocatable .obj files from 'assemble.py -f obj'. The first module
+is placed at address 0 and the others follow it. Jumps to labels that a module doesn't define are
+resolved against the other modules, and blocks of code that more than one module has are only
+stored once.
+"""
+
+# A module can jump to a label in any other module, as long as exactly one module defines it. That's
+# how bring-up sequences for different devices get chained together: each one ends with a jump to
+# a label that the next one (or the main program) defines.
+#
+# There's no call and return in the controller, so only code that doesn't care how it was reached
+# can be shared: a block that nothing falls through into and that ends in an unconditional jump.
+# The common case is an identical sequence that ends by jumping to the same place in every module
+# that has it, or an idle loop like '_done: jmp _done'. See SimpleAsmLinker in simpleasmparser.py.
+
+import os
+import sys
+
+import machine_code as mc
+from assemble import make_parser, guess_output_format
+from simpleasmparser import SimpleAsmObject, SimpleAsmLinker
+
+# Reads a module from a .obj file, or assembles it from source
+def load_module(filename: str) -> SimpleAsmObject:
+    name = os.path.splitext(os.path.basename(filename))[0]
+    if (filename.lower().endswith(".obj")):
+        with open(filename, 'r') as f:
+            return SimpleAsmObject.load(f, name)
+
+    p = make_parser()
+    with open(filename, 'r') as f:
+        p.parse_file(f)
+    return p.emit_object(name)
+
+# Links the modules in 'filenames'. Returns (linker, parser holding the linked program).
+def link_files(filenames: list, dedup: bool = True):
+    linker = SimpleAsmLinker()
+    for filename in filenames:
+        linker.add(load_module(filename))
+    return linker, linker.link(dedup)
+
+def format_report(linker, p, mem_words: int = mc.MEM_NUM_WORDS) -> str:
+    kept = {}
+    for instr in p.firstpass:
+        kept[instr.source] = kept.get(instr.source, 0) + instr.get_size_words()
+
+    lines = [f"{'module':24} {'words':>6} {'linked':>7}"]
+    for m in linker.modules:
+        lines.append(f"{m.name:24} {m.size_words():6d} {kept.get(m.name, 0):7d}")
+    lines.append("")
+
+    used = p.size_words()
+    lines.append(f"{used} words linked from {linker.words_before} "
+                 f"({linker.words_before - used} saved by sharing {linker.shared_blocks} blocks)")
+    lines.append(f"{used} of {mem_words} words of program memory used ({100 * used / mem_words:.01f}%), "
+                 f"{mem_words - used} free")
+    return "\n".join(lines)
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=helpstr)
+    parser.add_argument("modules", type=str, nargs="+",
+                        help=".i2casm or .obj modules; the first one holds the entry point")
+    parser.add_argument("-o", "--output-file", type=str, default=None,
+                        help="output file to write the linked program to")
+    parser.add_argument("-f", "--format", type=str, default=None,
+                        help="output format: hex, hex_compact, bin_le, bin_be or coe. "
+                             "By default it's picked from the output file's extension.")
+    parser.add_argument("--no-dedup", action="store_true",
+                        help="don't share identical blocks between modules")
+    parser.add_argument("--mem-words", type=int, default=mc.MEM_NUM_WORDS,
+                        help="MEM_NUM_WORDS parameter of the i2c controller")
+    args = parser.parse_args()
+
+    try:
+        linker, p = link_files(args.modules, not args.no_dedup)
+    except ValueError as e:
+        print(f"error: {e}", file=sys.stderr)
+        sys.exit(1)
+
+    print(format_report(linker, p, args.mem_words))
+    if (p.size_words() > args.mem_words):
+        print(f"error: the linked program doesn't fit in {args.mem_words} words", file=sys.stderr)
+        sys.exit(1)
+
+    if (args.output_file is not None):
+        fmt = guess_output_format(args.output_file) if (args.format is None) else args.format
+        with open(args.output_file, 'wb' if p.output_format_is_binary(fmt) else 'w') as outfile:
+            p.emit_format(fmt, outfile)
@@ -0,0 +1,130 @@
+# Copyright 2026 John Mamish
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Definitions shared by the tools that work on i2c controller machine code (as opposed to assembly
+# source). The opcodes and field layouts here mirror the localparams and the instruction encoding
+# comment on 'i2c_transmitter_controller' in i2c_controller.sv - keep them in sync.
+
+# opcodes, taken from ir[15:12]
+OPCODE_XFER = 0b0000
+OPCODE_SET_READ_TAG = 0b0001
+
+OPCODE_WAIT = 0b0100
+OPCODE_TRIG = 0b0101
+OPCODE_OUTPUT_TRIG = 0b0110
+
+OPCODE_JMP = 0b1000
+OPCODE_JMP_RELATIVE = 0b1001
+OPCODE_JMP_COND = 0b1010
+
+# XFER end conditions, taken from ir[9:8]
+END_CONDITION_NONE = 0b00
+END_CONDITION_REPEATED_START = 0b01
+END_CONDITION_STOP = 0b10
+
+# Default size of the controller's program memory
+MEM_NUM_WORDS = 512
+
+# A 'const delay' word that asks for N cycles keeps the controller busy for N + 2 cycles: one for
+# FETCH and N + 1 in DECODE.
+WAIT_OVERHEAD_CYCLES = 2
+
+# A 'const delay' word that starts while the arg register is 0 takes this long, whatever it asks
+# for: its first DECODE cycle compares against the arg that was there before and finishes at once.
+SWALLOWED_WAIT_CYCLES = 2
+
+# Longest delay that a single 'const delay' word can encode
+MAX_WAIT_CYCLES = 0xff << 0xf
+
+def opcode(word: int) -> int:
+    return (word >> 12) & 0xf
+
+# Decodes the fields of the first word of an XFER instruction.
+# Returns (nak_last, is_read, end_condition, length)
+def xfer_fields(word: int):
+    return (((word >> 11) & 1), ((word >> 10) & 1), ((word >> 8) & 0b11), (word & 0xff))
+
+# Returns the number of cycles that a 'const delay' word asks for: ARG1 << ARG2
+def wait_cycles(word: int) -> int:
+    return (word & 0xff) << ((word >> 8) & 0xf)
+
+# What the arg register holds after running 'words' straight through, or None if they don't
+# touch it. Write XFERs leave their last data word there, delays their delay and conditional jumps
+# their mask word.
+def arg_after(words):
+    arg = None
+    pos = 0
+    while (pos < len(words)):
+        w = words[pos]
+        pos += 1
+        op = opcode(w)
+        if (op == OPCODE_XFER):
+            nak_last, is_read, end_condition, length = xfer_fields(w)
+            if (not is_read):
+                pos += (length + 1) // 2
+                arg = words[pos - 1]
+        elif (op == OPCODE_WAIT):
+            arg = wait_cycles(w)
+        elif (op == OPCODE_JMP_COND):
+            arg = words[pos]
+            pos += 1
+    return arg
+
+# Reads a verilog hex file of the sort that $readmemh accepts (and that assemble.py emits) and
+# returns a list of 16-bit words. '//' comments, '_' digit separators and '@addr' directives are
+# understood; words that aren't given by the file are returned as None.
+def read_hex_words(f) -> list:
+    words = []
+    address = 0
+    for line_number, line in enumerate(f, start=1):
+        line = line.split("//", maxsplit=1)[0]
+        for tok in line.split():
+            if (tok.startswith("@")):
+                address = int(tok[1:], 16)
+                continue
+
+            try:
+                word = int(tok.replace("_", ""), 16)
+            except ValueError as e:
+                raise ValueError(f"line {line_number}: couldn't parse {tok} as a hex word")
+            if (word > 0xffff):
+                raise ValueError(f"line {line_number}: {tok} doesn't fit in a 16-bit word")
+
+            if (address >= len(words)):
+                words.extend([None] * (address + 1 - len(words)))
+            words[address] = word
+            address += 1
+    return words
+
+# Reads a raw binary image of 16-bit words, as written by assemble.py's bin_le and bin_be formats
+def read_bin_words(f, byteorder: str = "little") -> list:
+    data = f.read()
+    if ((len(data) % 2) != 0):
+        raise ValueError(f"binary image is {len(data)} bytes long, which isn't a whole number of words")
+    return [int.from_bytes(data[i:i + 2], byteorder) for i in range(0, len(data), 2)]
+
+# Reads a program image from a file. Files ending in .bin are raw binary images, anything else is
+# treated as a hex file.
+def read_image(filename: str, byteorder: str = "little") -> list:
+    if (filename.lower().endswith(".bin")):
+        with open(filename, 'rb') as f:
+            return read_bin_words(f, byteorder)
+    with open(filename, 'r') as f:
+        return read_hex_words(f)
@@ -0,0 +1,190 @@
+# Copyright 2026 John Mamish
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# Peephole optimizer for i2c controller programs. It works on a SimpleAsmParser after parse_file()
+# and before emit(), and shrinks the program without changing what it does on the bus:
+#
+#   - back-to-back delays are replaced by the fewest delay words that wait exactly as long
+#   - set_read_tag is dropped when the tag already has that value from auto-increment
+#   - jumps to a label that just jumps somewhere else go straight to the final target
+#   - code that can't be reached from address 0 is removed, as are jumps to the next instruction
+#
+# Instructions are recognized by mnemonic rather than by class so that this works with whichever
+# copy of assemble.py's instruction classes the parser was built from.
+
+import delay_planner
+import machine_code as mc
+
+def _jump_targets(p) -> set:
+    targets = set()
+    for instr in p.firstpass:
+        if (hasattr(instr, "jump_target")):
+            targets.add(_label(p, instr).index)
+    return targets
+
+# Returns the label that 'instr' jumps to, or the label called 'name' if it's given
+def _label(p, instr, name=None):
+    name = instr.jump_target if (name is None) else name
+    try:
+        return p.label_positions[name]
+    except KeyError as e:
+        raise ValueError(f"line {instr.line_number}: unknown label {name}")
+
+# What the controller's arg register holds after 'instr' has run, or None if it doesn't touch it
+def _arg_after(p, instr):
+    return mc.arg_after(instr.emit_words(p))
+
+# Whether arg might be 0 when instruction i starts. It isn't known at reset or where a jump lands.
+def _arg_may_be_zero(p, i, targets) -> bool:
+    for k in range(i - 1, -1, -1):
+        if ((k + 1) in targets): return True
+        arg = _arg_after(p, p.firstpass[k])
+        if (arg is not None): return (arg == 0)
+    return True
+
+# Replaces runs of delays that can't be jumped into halfway with the fewest delay words that take
+# exactly as long, so nothing after them moves.
+#
+# A delay that starts while arg is 0 finishes after one cycle (see simulate.py), whatever it
+# encodes. The first delay of a run that might start that way is left alone: it's swallowed or not
+# just as before, and leaves a non-zero arg for the ones after it, which are merged.
+def merge_delays(p) -> bool:
+    targets = _jump_targets(p)
+    fp = p.firstpass
+    remove = set()
+
+    i = 0
+    while (i < len(fp)):
+        a = fp[i]
+        j = i + 1
+        if ((a.MNEMONIC == "delay") and (not _arg_may_be_zero(p, i, targets))):
+            while ((j < len(fp)) and (fp[j].MNEMONIC == "delay") and (j not in targets)):
+                j += 1
+
+            total = sum(a.actual_delay(fp[k].arg) + mc.WAIT_OVERHEAD_CYCLES for k in range(i, j))
+            plan = delay_planner.plan_delay(total) if (j > (i + 1)) else ()
+            if (0 < len(plan) < (j - i)):
+                for k, v in enumerate(plan):
+                    merged = type(a)(str(v), fp[i + k].line_number, fp[i + k].offset)
+                    merged.parse()
+                    fp[i + k] = merged
+                remove.update(range(i + len(plan), j))
+        i = j
+
+    if (len(remove) == 0): return False
+    p.remove_instructions(remove)
+    return True
+
+# set_read_tag waits for the transmitter to go idle, so dropping one can move whatever comes after
+# it earlier. That only can't be seen if the next thing that could be seen is another transfer or
+# set_read_tag, which waits for the transmitter itself; a trigger, a delay, a jump or the end of the
+# program on the way there means the wait has to stay.
+def _tag_wait_unobservable(fp, i) -> bool:
+    for instr in fp[i + 1:]:
+        if (instr.MNEMONIC.startswith("i2c_") or (instr.MNEMONIC == "set_read_tag")):
+            return True
+        if (instr.MNEMONIC in ("write_trigger", "wait_trigger", "delay", "delay_exact", "jmp",
+                               "jmp_mask_unsatisfied")):
+            return False
+    return False
+
+# Removes set_read_tag instructions that set the tag to the value that it would already have, as
+# long as the wait for the transmitter that they do can't be seen. Labels that are jumped to are
+# join points where the tag isn't known.
+def drop_redundant_read_tags(p) -> bool:
+    targets = _jump_targets(p)
+    remove = set()
+    tag = None
+    for i, instr in enumerate(p.firstpass):
+        if (i in targets): tag = None
+
+        if (instr.MNEMONIC == "set_read_tag"):
+            if ((tag == instr.tag) and _tag_wait_unobservable(p.firstpass, i)):
+                remove.add(i)
+            tag = instr.tag
+        elif (hasattr(instr, "read_length")):
+            if (tag is not None):
+                tag = (tag + instr.read_length) & 0xfff
+        elif (instr.MNEMONIC == "jmp"):
+            tag = None
+
+    if (len(remove) == 0): return False
+    p.remove_instructions(remove)
+    return True
+
+# Points every jump at the end of any chain of unconditional jumps that it lands on.
+def thread_jumps(p) -> bool:
+    changed = False
+    for instr in p.firstpass:
+        if (not hasattr(instr, "jump_target")): continue
+
+        target = instr.jump_target
+        seen = {target}
+        while True:
+            idx = _label(p, instr, target).index
+            if ((idx >= len(p.firstpass)) or (p.firstpass[idx].MNEMONIC != "jmp")): break
+            nxt = p.firstpass[idx].jump_target
+            if (nxt in seen): break
+            seen.add(nxt)
+            target = nxt
+
+        if (target != instr.jump_target):
+            instr.jump_target = target
+            changed = True
+    return changed
+
+# Removes instructions that can't be reached from address 0, and unconditional jumps to the
+# instruction right after them.
+def remove_unreachable(p) -> bool:
+    fp = p.firstpass
+    reachable = set()
+    worklist = [0]
+    while (len(worklist) != 0):
+        i = worklist.pop()
+        if ((i in reachable) or (i >= len(fp))): continue
+        reachable.add(i)
+
+        instr = fp[i]
+        if (hasattr(instr, "jump_target")):
+            worklist.append(_label(p, instr).index)
+        if (instr.MNEMONIC != "jmp"):
+            worklist.append(i + 1)
+
+    remove = set(range(len(fp))) - reachable
+    for i in reachable:
+        if ((fp[i].MNEMONIC == "jmp") and (_label(p, fp[i]).index == (i + 1))):
+            remove.add(i)
+
+    if (len(remove) == 0): return False
+    p.remove_instructions(remove)
+    return True
+
+PASSES = [thread_jumps, remove_unreachable, drop_redundant_read_tags, merge_delays]
+
+# Runs every pass until none of them can shrink the program any further.
+# Returns how many words were saved.
+def optimize(p, passes=PASSES) -> int:
+    before = p.size_words()
+    changed = True
+    while (changed):
+        changed = False
+        for optimization_pass in passes:
+            changed |= optimization_pass(p)
+    return before - p.size_words()
@@ -0,0 +1,484 @@
+#!/usr/bin/python3
+
+# Copyright 2026 John Mamish
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the “Software”), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED “AS IS”, WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+helpstr = \
+""" Runs a program for the i2c controller without an RTL simulator.
+
+The program can be given as a .hex file (as emitted by assemble.py) or as .i2casm source, which is
+assembled first. A trace of everything the controller does on the i2c bus and its trigger outputs
+is printed along with the clock cycle it happens on.
+"""
+
+# This is an instruction-set simulator for 'i2c_transmitter_controller' and 'i2c_transmitter' in
+# i2c_controller.sv. It's cycle accurate: it reproduces the RTL's state machines edge for edge,
+# including the free-running scl divider, but instead of stepping one clock at a time it jumps
+# straight from one interesting edge to the next. A program that spends seconds of bus time in
+# delays and transfers simulates in well under a millisecond.
+#
+# Cycle 0 is the first rising clock edge after reset is deasserted.
+#
+# Quirks of the RTL that are reproduced on purpose:
+#   - 'const delay' compares against the *previous* value of the arg register on its first cycle,
+#     so a delay that follows something that left 'arg' at 0 finishes after one cycle.
+#   - every i2c frame waits for a falling and then a rising edge of the divided scl clock before it
+#     starts, whether or not it needs a start condition.
+#   - the read tag isn't reset, so it's unknown (None) until the first set_read_tag.
+
+import bisect
+import collections
+
+import machine_code as mc
+
+# One thing that the controller did.
+#     cycle - clock edge at which the controller's outputs reflect it
+#     kind  - 'start', 'write', 'read', 'stop', 'nak', 'trigger_out' or 'set_read_tag'
+#     data  - dict with details that depend on the kind
+SimEvent = collections.namedtuple("SimEvent", "cycle kind data")
+
+class SimulationError(Exception):
+    pass
+
+# raised internally to end a run when the program halts or blocks
+class _Stop(Exception):
+    pass
+
+# Base class for i2c devices attached to the simulated bus. Subclasses override whichever hooks
+# they care about. Hooks that return a bool return True to ack.
+class I2CDevice:
+    def __init__(self, address: int):
+        # 7-bit address the device answers to
+        self.address = address
+
+    # called when the device is addressed after a start or repeated start
+    def start(self, read: bool) -> bool:
+        return True
+
+    # called for every byte written to the device after its address
+    def write(self, byte: int) -> bool:
+        return True
+
+    # called for every byte read from the device
+    def read(self) -> int:
+        return 0xff
+
+    # called on a stop condition
+    def stop(self) -> None:
+        pass
+
+# A typical register-mapped device. The first 'reg_addr_bytes' bytes of each write select a
+# register (msb first), and the remaining bytes are written to consecutive registers. Reads
+# return consecutive registers starting from the selected one. Unwritten registers read as 0.
+class RegisterI2CDevice(I2CDevice):
+    def __init__(self, address: int, reg_addr_bytes: int = 1, registers: dict = None):
+        super().__init__(address)
+        self.reg_addr_bytes = reg_addr_bytes
+        self.registers = {} if (registers is None) else dict(registers)
+        self.pointer = 0
+        self.addr_bytes_seen = 0
+
+    def start(self, read):
+        self.addr_bytes_seen = 0
+        return True
+
+    def write(self, byte):
+        if (self.addr_bytes_seen < self.reg_addr_bytes):
+            if (self.addr_bytes_seen == 0): self.pointer = 0
+            self.pointer = (self.pointer << 8) | byte
+            self.addr_bytes_seen += 1
+        else:
+            self.registers[self.pointer] = byte
+            self.pointer += 1
+        return True
+
+    def read(self):
+        byte = self.registers.get(self.pointer, 0)
+        self.pointer += 1
+        return byte
+
+# A device that answers reads from a canned list of bytes (or any iterable), and can be told to
+# nak its address or every write. Once the read data runs out it reads as 0xff.
+class ScriptedI2CDevice(I2CDevice):
+    def __init__(self, address: int, read_data=(), nak_address: bool = False,
+                 nak_writes: bool = False):
+        super().__init__(address)
+        self.read_data = iter(read_data)
+        self.nak_address = nak_address
+        self.nak_writes = nak_writes
+        self.written = []
+
+    def start(self, read):
+        return not self.nak_address
+
+    def write(self, byte):
+        self.written.append(byte)
+        return not self.nak_writes
+
+    def read(self):
+        return next(self.read_data, 0xff)
+
+# Everything that came out of a simulation run
+class SimulationResult:
+    def __init__(self):
+        self.events: list = []
+
+        # why the simulation stopped and the cycle it stopped on
+        self.stop_reason: str = None
+        self.cycles: int = 0
+
+        # controller state when the simulation stopped
+        self.pc: int = 0
+        self.trigger_o: int = 0
+        self.instructions_executed: int = 0
+
+    # (cycle, tag, data) for every byte the controller presented on read_data_o
+    @property
+    def reads(self) -> list:
+        return [(e.cycle, e.data["tag"], e.data["data"]) for e in self.events if (e.kind == "read")]
+
+    # Groups bus events into transactions, one per start condition. Each transaction is a dict
+    # with the cycle it started on, the 7-bit address, whether it was a read, whether the address
+    # was acked, and the bytes that were transferred.
+    @property
+    def transactions(self) -> list:
+        r = []
+        for e in self.events:
+            if (e.kind == "start"):
+                r.append({"cycle": e.cycle, "address": e.data["address"], "read": e.data["read"],
+                          "ack": e.data["ack"], "data": []})
+            elif ((e.kind in ("write", "read")) and (len(r) != 0)):
+                r[-1]["data"].append(e.data["data"])
+        return r
+
+class I2CControllerSimulator:
+    def __init__(self, words, scl_div: int = 60, devices=(), triggers=(),
+                 mem_num_words: int = mc.MEM_NUM_WORDS):
+        if (scl_div < 2):
+            raise ValueError(f"SCL_DIV must be at least 2, got {scl_div}")
+        if (len(words) > mem_num_words):
+            raise ValueError(f"program is {len(words)} words but memory is only {mem_num_words}")
+
+        self.mem = list(words)
+        self.scl_div = scl_div
+        self.devices = {d.address: d for d in devices}
+
+        # trigger_i is given as a list of (cycle, value) pairs. trigger_i takes on 'value' from
+        # 'cycle' onwards, and is 0 before the first change.
+        t = sorted(triggers)
+        self.trigger_cycles = [c for (c, v) in t]
+        self.trigger_values = [v & 0x3f for (c, v) in t]
+
+    ################################################################
+    # i2c transmitter timing
+
+    # first edge at or after 't' where the edge number is 'phase' mod SCL_DIV
+    def _next_edge(self, t, phase):
+        return t + ((phase - t) % self.scl_div)
+
+    def _fell_phase(self):
+        return 1 % self.scl_div
+
+    def _rose_phase(self):
+        return (1 + (self.scl_div >> 1)) % self.scl_div
+
+    # Works out when the transmitter does everything for a frame that the controller strobes on
+    # edge 's'. Returns the edge where the controller's nak_o updates, the edge where its
+    # read_data_o updates and the first edge where the controller sees the transmitter as ready.
+    def _frame_timing(self, s, end_condition):
+        fell, rose = self._fell_phase(), self._rose_phase()
+
+        # the transmitter sees the strobe on s + 1 and is in PRE_START_COND from s + 2.
+        f1 = self._next_edge(s + 2, fell)
+        r0 = self._next_edge(f1 + 1, rose)
+
+        # 10 rising edges in TXRX_FRAME; the ack bit is sampled on the 9th.
+        rise9 = r0 + (9 * self.scl_div)
+        nak_cycle = rise9 + 1
+        read_cycle = self._next_edge(rise9 + 1, fell) + 1
+        tt = r0 + (10 * self.scl_div)
+
+        if (end_condition == mc.END_CONDITION_NONE):
+            # ready_o is only re-asserted from IDLE
+            ready = (tt + self.scl_div) + 2
+        else:
+            ready = (tt + (2 * self.scl_div)) + 1
+        return nak_cycle, read_cycle, ready
+
+    # Runs one frame on the bus, talking to whichever device is addressed.
+    def _frame(self, s, is_read, end_condition, do_ack, byte):
+        nak_cycle, read_cycle, ready = self._frame_timing(s, end_condition)
+        self.tx_ready_at = ready
+
+        if (not is_read):
+            if (self.start_cond_needed):
+                address, rd = byte >> 1, bool(byte & 1)
+                self.bus_device = self.devices.get(address)
+                self.bus_reading = rd
+                ack = self.bus_device.start(rd) if (self.bus_device is not None) else False
+                self._event(s, "start", address=address, read=rd, ack=ack)
+            else:
+                if ((self.bus_device is not None) and (not self.bus_reading)):
+                    ack = self.bus_device.write(byte)
+                else:
+                    ack = False
+                self._event(s, "write", data=byte, ack=ack)
+            self._event(nak_cycle, "nak", nak=(not ack))
+        else:
+            if ((self.bus_device is not None) and self.bus_reading and (not self.start_cond_needed)):
+                data = self.bus_device.read() & 0xff
+            else:
+                data = 0xff
+            self._event(read_cycle, "read", tag=self.read_tag, data=data, ack=do_ack)
+            self.read_data = data
+            if (self.read_tag is not None):
+                self.read_tag = (self.read_tag + 1) & 0xfff
+
+        if (end_condition == mc.END_CONDITION_STOP):
+            if (self.bus_device is not None):
+                self.bus_device.stop()
+            self._event(ready, "stop")
+            self.bus_device = None
+        self.start_cond_needed = (end_condition != mc.END_CONDITION_NONE)
+
+    ################################################################
+    # trigger inputs
+
+    def _trigger_at(self, cycle):
+        i = bisect.bisect_right(self.trigger_cycles, cycle) - 1
+        return 0 if (i < 0) else self.trigger_values[i]
+
+    # Returns the first edge at or after 'e' where the latched trigger signals satisfy the masks,
+    # or None if that never happens.
+    def _wait_trigger(self, e, low, high):
+        def ok(v):
+            return ((v & high) != 0) or ((~v & low & 0x3f) != 0)
+
+        # trigger_signals at edge e is whatever trigger_i was on edge e - 1
+        if (ok(self._trigger_at(e - 1))):
+            return e
+        i = bisect.bisect_right(self.trigger_cycles, e - 1)
+        for c, v in zip(self.trigger_cycles[i:], self.trigger_values[i:]):
+            if (ok(v)):
+                return c + 1
+        return None
+
+    ################################################################
+
+    def _event(self, cycle, kind, **data):
+        self.result.events.append(SimEvent(cycle, kind, data))
+
+    def _fetch(self, pc):
+        pc &= 0xfff
+        if ((pc >= len(self.mem)) or (self.mem[pc] is None)):
+            raise _Stop(f"executed unprogrammed word at address {pc}")
+        return self.mem[pc]
+
+    # Runs the program until it halts, blocks forever, or 'max_cycles' goes by.
+    # A program is considered to have halted if it jumps to itself.
+    def run(self, max_cycles: int = 10_000_000) -> SimulationResult:
+        self.result = SimulationResult()
+        self.pc = 0
+        self.arg = None
+        self.read_tag = None
+        self.read_data = None
+        self.trigger_o = 0
+        self.tx_ready_at = 0
+        self.start_cond_needed = True
+        self.bus_device = None
+        self.bus_reading = False
+
+        t = 0
+        try:
+            while (t < max_cycles):
+                # FETCH
+                ir = self._fetch(self.pc)
+                instr_pc = self.pc & 0xfff
+                self.pc = (self.pc + 1) & 0xfff
+                self.result.instructions_executed += 1
+                t = self._execute(ir, instr_pc, t + 1)
+            self.result.stop_reason = "cycle limit reached"
+        except _Stop as e:
+            self.result.stop_reason = str(e)
+
+        self.result.cycles = t
+        self.result.pc = self.pc
+        self.result.trigger_o = self.trigger_o
+        return self.result
+
+    # Executes the fetched instruction 'ir' whose DECODE happens on edge 'd'. Returns the edge on
+    # which the next FETCH happens.
+    def _execute(self, ir, instr_pc, d):
+        op = mc.opcode(ir)
+
+        if (op == mc.OPCODE_XFER):
+            nak_last, is_read, end_condition, length = mc.xfer_fields(ir)
+            if (length == 0):
+                raise SimulationError(f"address {instr_pc}: xfer of length 0 never finishes")
+
+            f = d + 1
+            for arg_count in range(length):
+                # XFER_FETCH
+                if (((arg_count & 1) == 0) and (not is_read)):
+                    self.arg = self._fetch(self.pc)
+                    self.pc = (self.pc + 1) & 0xfff
+
+                # XFER_EX waits for the transmitter
+                s = max(f + 1, self.tx_ready_at)
+                last = ((arg_count + 1) == length)
+                byte = None
+                if (not is_read):
+                    byte = (self.arg & 0xff) if (arg_count & 1) else ((self.arg >> 8) & 0xff)
+                if (last):
+                    self._frame(s, is_read, end_condition, not nak_last, byte)
+                else:
+                    self._frame(s, is_read, mc.END_CONDITION_NONE, True, byte)
+                f = s + 1
+            return f
+
+        elif (op == mc.OPCODE_SET_READ_TAG):
+            e = max(d, self.tx_ready_at)
+            self.read_tag = ir & 0xfff
+            self._event(e + 1, "set_read_tag", tag=self.read_tag)
+            return e + 1
+
+        elif (op == mc.OPCODE_WAIT):
+            value = mc.wait_cycles(ir)
+            if (self.arg == 0):
+                n = 1
+            elif (value == 0):
+                n = 2
+            else:
+                n = value + 1
+            self.arg = value
+            return d + n
+
+        elif (op == mc.OPCODE_TRIG):
+            e = self._wait_trigger(d, (ir >> 6) & 0x3f, ir & 0x3f)
+            if (e is None):
+                raise _Stop(f"waiting forever on wait_trigger at address {instr_pc}")
+            return e + 1
+
+        elif (op == mc.OPCODE_OUTPUT_TRIG):
+            self.trigger_o = ir & 0x3f
+            self._event(d, "trigger_out", value=self.trigger_o)
+            return d + 1
+
+        elif (op == mc.OPCODE_JMP):
+            self.pc = ir & 0xfff
+            if (self.pc == instr_pc):
+                raise _Stop(f"halted in jmp-to-self at address {instr_pc}")
+            return d + 1
+
+        elif (op == mc.OPCODE_JMP_RELATIVE):
+            offset = ir & 0xfff
+            if (offset & 0x800): offset -= 0x1000
+            self.pc = (self.pc + offset) & 0xfff
+            if (self.pc == instr_pc):
+                raise _Stop(f"halted in jmp-to-self at address {instr_pc}")
+            return d + 1
+
+        elif (op == mc.OPCODE_JMP_COND):
+            e = max(d, self.tx_ready_at)
+            self.arg = self._fetch(self.pc)
+            self.pc = (self.pc + 1) & 0xfff
+
+            # COND_BRANCH_EX
+            low, high = (self.arg >> 8) & 0xff, self.arg & 0xff
+            rd = self.read_data
+            if ((rd is None) or ((rd & high) != high) or ((~rd & low) != low)):
+                self.pc = ir & 0xfff
+            return e + 2
+
+        else:
+            # unused opcodes fall through to FETCH
+            return d + 1
+
+# Convenience function for simulating a list of words.
+def simulate(words, max_cycles: int = 10_000_000, **kwargs) -> SimulationResult:
+    return I2CControllerSimulator(words, **kwargs).run(max_cycles)
+
+# Loads a program from a .hex file, or assembles it first if it's .i2casm source
+def load_program(filename: str) -> list:
+    if (filename.endswith(".i2casm") or filename.endswith(".asm")):
+        from assemble import make_parser
+        p = make_parser()
+        with open(filename, 'r') as infile:
+            p.parse_file(infile)
+        return list(p.emit_words())
+
+    return mc.read_image(filename)
+
+def format_event(e: SimEvent) -> str:
+    d = e.data
+    if (e.kind == "start"):
+        rw = "read" if d["read"] else "write"
+        return f"start  addr 0x{d['address']:02x} ({rw}) {'ack' if d['ack'] else 'NAK'}"
+    if (e.kind == "write"):
+        return f"write  0x{d['data']:02x} {'ack' if d['ack'] else 'NAK'}"
+    if (e.kind == "read"):
+        tag = "xxx" if (d["tag"] is None) else f"{d['tag']:03x}"
+        return f"read   0x{d['data']:02x} tag {tag}"
+    if (e.kind == "trigger_out"):
+        return f"trigger_o <= {d['value']:06b}"
+    if (e.kind == "set_read_tag"):
+        return f"read tag <= 0x{d['tag']:03x}"
+    if (e.kind == "nak"):
+        return f"nak_o <= {int(d['nak'])}"
+    return e.kind
+
+# parses 'cycle:value' where value may be any python integer literal
+def parse_trigger(s: str):
+    c, v = s.split(":", maxsplit=1)
+    return (int(c, 0), int(v, 0))
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=helpstr)
+    parser.add_argument("-i", "--input-file", type=str, required=True,
+                        help=".hex, .bin or .i2casm program to simulate")
+    parser.add_argument("--scl-div", type=int, default=60,
+                        help="SCL_DIV parameter of the i2c controller")
+    parser.add_argument("--max-cycles", type=int, default=10_000_000,
+                        help="stop after this many clock cycles")
+    parser.add_argument("--device", type=lambda s: int(s, 0), action="append", default=[],
+                        help="attach a register-mapped device at this 7-bit address")
+    parser.add_argument("--trigger", type=parse_trigger, action="append", default=[],
+                        help="set trigger_i to VALUE from CYCLE onwards, as CYCLE:VALUE")
+    parser.add_argument("--show-naks", action="store_true",
+                        help="also print every update to nak_o")
+    args = parser.parse_args()
+
+    words = load_program(args.input_file)
+    devices = [RegisterI2CDevice(a) for a in args.device]
+    result = simulate(words, max_cycles=args.max_cycles, scl_div=args.scl_div, devices=devices,
+                      triggers=args.trigger)
+
+    for e in result.events:
+        if ((e.kind == "nak") and not args.show_naks): continue
+        print(f"{e.cycle:12d}  {format_event(e)}")
+
+    print(f"stopped after {result.cycles} cycles and {result.instructions_executed} instructions: "
+          f"{result.stop_reason}")
+    for d in devices:
+        if (len(d.registers) != 0):
+            regs = " ".join(f"{a:02x}={v:02x}" for a, v in sorted(d.registers.items()))
+            print(f"device 0x{d.address:02x} registers: {regs}")
@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+
+# Checks against the simulator that delay_exact waits as long as it's asked to, whatever ran before
+# it. A delay word that starts while arg is 0 finishes after one cycle, so this depends on what
+# left arg behind: the last data word of a write, a delay, or nothing that's known after a label.
+
+import io
+import sys
+
+from assemble import make_parser
+from simulate import simulate
+
+# (what runs before, whether it's exact, delays to ask for)
+CASES = {
+    "after a zero data word": ("i2c_write 0x10 0x01 0x00", True, [2, 5, 300, 1000001]),
+    "after a non-zero data word": ("i2c_write 0x10 0x00 0x01", True, [3, 5, 300, 1000001]),
+    "after a set_read_tag": ("i2c_write 0x10 0x01 0x00\n set_read_tag 0x020", True, [2, 300]),
+    "after a read": ("i2c_write 0x10 0x01 0x00\n i2c_read 1b 0x10", True, [3, 300]),
+    "after a delay": ("i2c_write 0x10 0x01 0x00\n delay 5", True, [3, 300]),
+    "at reset": ("", True, [3, 300, 1000001]),
+    "after a label, with arg at 0": ("i2c_write 0x10 0x01 0x00\n_here:", False, [300, 1000001]),
+}
+
+# Cycles between the write_trigger before 'delay' and the one after it
+def trigger_gap(before: str, delay: str) -> int:
+    p = make_parser()
+    p.parse_file(io.StringIO(f"{before}\n write_trigger 000001\n {delay}\n write_trigger 000010\n"
+                             f"_stay:\n jmp _stay"), "test.i2casm")
+    result = simulate(list(p.emit_words()), max_cycles=2_000_000)
+    cycles = [e.cycle for e in result.events if (e.kind == "trigger_out")]
+    assert len(cycles) == 2, f"{before!r} {delay}: triggers at {cycles}"
+    return cycles[1] - cycles[0]
+
+def test_delay_exact_timing():
+    for name, (before, exact, delays) in CASES.items():
+        nothing = trigger_gap(before, "")
+        for cycles in delays:
+            tolerance = 0 if (exact) else 1
+            took = trigger_gap(before, f"delay_exact {cycles} {tolerance}") - nothing
+            assert abs(took - cycles) <= tolerance, f"{name}: delay_exact {cycles} took {took} cycles"
+
+if __name__ == "__main__":
+    test_delay_exact_timing()
+    print(f"delay_exact takes as long as it should in {len(CASES)} places")
+    sys.exit(0)
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+# Checks that images padded out with unused memory disassemble to assembly that reassembles to the
+# same words, including programs whose last words are zero data.
+
+import io
+import os
+import sys
+
+from assemble import make_parser
+from disassemble import trim, disassemble, verify
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+CASES = {
+    "write ending in a zero byte": "i2c_write 0x10 0x00 0x00",
+    "write of zero bytes after a trigger": "write_trigger 000001\n i2c_write 0x10 0x00 0x00 0x00",
+    "jump past the program": "jmp _end\n i2c_write 0x10 0x00 0x00\n_end:\n jmp _end",
+    "read": "i2c_read 2b 0x30",
+}
+
+FILES = ["test.i2casm", os.path.join("testbench", "i2c_initializer.i2casm")]
+
+# the words a program assembles to, padded out like a memory image
+def image(source: str, size: int = 256) -> list:
+    p = make_parser()
+    p.parse_file(io.StringIO(source), "test.i2casm")
+    words = list(p.emit_words())
+    return words + [0] * (size - len(words))
+
+def check(name: str, source: str) -> None:
+    padded = image(source)
+    words = trim(padded)
+    assert words == padded[:len(words)], f"{name}: trim changed words"
+    assert words == image(source, 0)[:len(words)], f"{name}: trim cut the program short"
+    mismatches = verify(words, disassemble(words))
+    assert len(mismatches) == 0, f"{name}: doesn't round-trip at {mismatches}"
+
+def test_padded_images_round_trip():
+    for name, source in CASES.items():
+        check(name, source)
+    for filename in FILES:
+        with open(os.path.join(HERE, filename)) as f:
+            check(filename, f.read())
+
+def test_trailing_zero_data_kept():
+    assert len(trim(image("i2c_write 0x10 0x00 0x00"))) == 3
+
+if __name__ == "__main__":
+    test_padded_images_round_trip()
+    test_trailing_zero_data_kept()
+    print(f"{len(CASES) + len(FILES)} padded images round-trip")
+    sys.exit(0)
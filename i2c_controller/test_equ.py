@@ -0,0 +1,55 @@
+#!/usr/bin/env python3
+
+# Checks that '.equ' constants assemble to the same words as writing their values in place, in
+# particular for the binary trigger masks of write_trigger and wait_trigger.
+
+import io
+import sys
+
+from assemble import make_parser
+
+def assemble_source(source: str) -> list:
+    p = make_parser()
+    p.parse_file(io.StringIO(source), "test.i2casm")
+    return list(p.emit_words())
+
+# (with constants, written out)
+CASES = {
+    "binary write_trigger": (".equ TRIG 0b1010\n write_trigger TRIG", "write_trigger 001010"),
+    "hex write_trigger": (".equ TRIG 0x0a\n write_trigger TRIG", "write_trigger 001010"),
+    "bare binary write_trigger": (".equ TRIG 1010\n write_trigger TRIG", "write_trigger 001010"),
+    "expression write_trigger": (".equ TRIG (1 << 3) | 2\n write_trigger TRIG",
+                                 "write_trigger 001010"),
+    "binary wait_trigger": (".equ MASK 0b001000\n wait_trigger MASK 000000",
+                            "wait_trigger 001000 000000"),
+    "hex wait_trigger": (".equ LOW 0x08\n.equ HIGH 0x1\n wait_trigger LOW HIGH",
+                         "wait_trigger 001000 000001"),
+    "constant from a constant": (".equ A 0b1010\n.equ B A\n.equ C A | 0b100\n"
+                                 " write_trigger B\n write_trigger C",
+                                 "write_trigger 001010\n write_trigger 001110"),
+    "i2c operands": (".equ CAM 0x30\n.equ REG 12\n i2c_write CAM 0x00 REG",
+                     "i2c_write 0x30 0x00 12"),
+    "mnemonic named like a constant": (".equ delay 7\n delay delay", "delay 7"),
+}
+
+def test_equ_matches_literals():
+    for name, (with_equ, written_out) in CASES.items():
+        a = assemble_source(with_equ)
+        b = assemble_source(written_out)
+        assert a == b, f"{name}: {[hex(w) for w in a]} != {[hex(w) for w in b]}"
+
+def test_equ_trigger_words():
+    assert assemble_source(".equ TRIG 0b1010\n write_trigger TRIG") == [0x600a]
+
+def test_equ_leaves_labels_alone():
+    p = make_parser()
+    p.parse_file(io.StringIO(".equ here 3\nhere:\n delay here"), "test.i2casm")
+    assert "here" in p.label_positions
+    assert list(p.emit_words()) == assemble_source("delay 3")
+
+if __name__ == "__main__":
+    test_equ_matches_literals()
+    test_equ_trigger_words()
+    test_equ_leaves_labels_alone()
+    print(f"{len(CASES) + 2} uses of .equ assemble like their values")
+    sys.exit(0)
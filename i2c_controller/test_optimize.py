@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+
+# Checks against the simulator that -O doesn't change what a program does. Bus traffic and
+# trigger_o have to be the same with and without it. Merging delays and dropping set_read_tags
+# mustn't move anything by even a cycle. Threading jumps and dropping jumps to the next instruction
+# take out instructions that took cycles, so there things may only happen earlier.
+
+import io
+import os
+import sys
+
+from assemble import make_parser
+from optimize import optimize
+from simulate import simulate, ScriptedI2CDevice
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# one case per thing the optimizer does (see README.md), plus the cases that it used to get wrong
+CASES = {
+    "delays after a zero data word": """
+        i2c_write 0x10 0x00 0x00
+        delay 1000
+        delay 1000
+        write_trigger 000001
+    _stay:
+        jmp _stay
+    """,
+    "delays after a non-zero data word": """
+        i2c_write 0x10 0x00 0x01
+        delay 1000
+        delay 1000
+        delay 300
+        write_trigger 000001
+    _stay:
+        jmp _stay
+    """,
+    "delays at reset and where a jump lands": """
+        delay 100
+        delay 100
+        write_trigger 000001
+    _loop:
+        delay 5
+        delay 100
+        delay 100
+        write_trigger 000010
+        i2c_write 0x10 0x00 0x00
+        write_trigger 000000
+        jmp _loop
+    """,
+    "redundant set_read_tag before a trigger": """
+        set_read_tag 0x010
+        i2c_read 2Bytes 0x30
+        set_read_tag 0x012
+        write_trigger 000001
+    _stay:
+        jmp _stay
+    """,
+    "redundant set_read_tag before a read": """
+        set_read_tag 0x010
+        i2c_read 2Bytes 0x30
+        set_read_tag 0x012
+        i2c_read 2Bytes 0x30
+        write_trigger 000001
+    _stay:
+        jmp _stay
+    """,
+}
+
+# these take out jumps, so things may happen earlier
+JUMP_CASES = {
+    "jump to a jump, and unreachable code": """
+        write_trigger 000001
+        jmp _a
+        delay 50
+    _a:
+        jmp _b
+        i2c_write 0x10 0x01
+    _b:
+        i2c_write 0x10 0x02 0x00
+        write_trigger 000010
+        jmp _c
+    _c:
+        write_trigger 000100
+    _stay:
+        jmp _stay
+    """,
+}
+
+FILES = ["test.i2casm", os.path.join("testbench", "i2c_initializer.i2casm")]
+TRIGGERS = [(5000, 0b001000), (9000, 0)]
+
+def assemble_source(source: str, optimized: bool) -> list:
+    p = make_parser()
+    p.parse_file(io.StringIO(source), "test.i2casm")
+    if (optimized): optimize(p)
+    return list(p.emit_words())
+
+# (cycle, kind, data) for everything on the bus and every change of trigger_o. The simulator puts
+# start and write events on the cycle the controller hands the frame over, which can change without
+# the bus changing (the frame waits for the scl divider either way); what's on the wire is timed
+# by the frame's ack bit, its 'nak' event.
+def observable(words) -> list:
+    devices = [ScriptedI2CDevice(a, [0x5a, 0xa5] * 64) for a in range(0x80)]
+    result = simulate(words, max_cycles=200_000, devices=devices, triggers=TRIGGERS)
+    return [(None if (e.kind in ("start", "write")) else e.cycle, e.kind, sorted(e.data.items()))
+            for e in result.events
+            if (e.kind in ("start", "write", "nak", "read", "stop", "trigger_out"))]
+
+def check(name: str, source: str, exact: bool) -> None:
+    plain = observable(assemble_source(source, False))
+    optimized = observable(assemble_source(source, True))
+    assert len(plain) != 0, f"{name}: nothing happened"
+    assert [e[1:] for e in plain] == [e[1:] for e in optimized], f"{name}: -O changed what happens"
+    for a, b in zip(plain, optimized):
+        if (a[0] is None): continue
+        if (exact):
+            assert a[0] == b[0], f"{name}: -O moved {a[1]} from cycle {a[0]} to {b[0]}"
+        else:
+            assert b[0] <= a[0], f"{name}: -O delayed {a[1]} from cycle {a[0]} to {b[0]}"
+
+def test_optimizer_keeps_timing():
+    for name, source in CASES.items():
+        check(name, source, True)
+    for filename in FILES:
+        with open(os.path.join(HERE, filename)) as f:
+            check(filename, f.read(), True)
+
+def test_optimizer_only_makes_jumps_faster():
+    for name, source in JUMP_CASES.items():
+        check(name, source, False)
+
+if __name__ == "__main__":
+    test_optimizer_keeps_timing()
+    test_optimizer_only_makes_jumps_faster()
+    print(f"{len(CASES) + len(FILES) + len(JUMP_CASES)} programs do the same thing with -O")
+    sys.exit(0)
@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+
+# Framebuffers for color_sharp_memory_display_driver.
+#
+# The driver reads pixels two at a time as 16-bit words:
+#     msb   0 0 r1.1 r1.0 g1.1 g1.0 b1.1 b1.0 | 0 0 r0.1 r0.0 g0.1 g0.0 b0.1 b0.0   lsb
+# where pixel 0 is the even (left) pixel of the pair. Each line is scanned out twice, once for the
+# colors' high bits and once for their low bits, and for scan s (line s / 2) it reads the words at
+#     addr = x_pair + 256 * s
+# for every x_pair in the padded line, (WIDTH + HPADDING) / 2 of them. So a line's words are needed
+# at two rows of 256 words, and a frame spans 2 * HEIGHT * 256 words. addr_o is only 16 bits wide,
+# so with the default 320-line frame the later rows wrap around onto the earlier ones; memory_image()
+# warns when that happens.
+#
+# Conversion works on whole frames (or batches of frames) with numpy. Nothing loops over pixels.
+#
+# Animated content usually only changes some lines from one frame to the next, so line_deltas()
+# finds the lines that changed and encode_deltas() packs them as runs of consecutive lines:
+#     start line, line count, then line count * words-per-line words
+# all as little-endian 16-bit words.
+
+import warnings
+
+import numpy as np
+
+WIDTH = 240
+HEIGHT = 320
+HPADDING = 8
+ROW_STRIDE = 256
+ADDRESS_WORDS = 1 << 16
+
+# Reduces 8-bit color channels to the display's 2 bits, rounding to the nearest level
+def quantize(rgb):
+    rgb = np.asarray(rgb)
+    if (rgb.dtype != np.uint8):
+        raise ValueError(f"expected 8-bit color channels, not {rgb.dtype}")
+    return ((rgb.astype(np.uint16) * 3 + 128) >> 8).astype(np.uint16)
+
+# Packs (..., height, width, 3) 2-bit colors into (..., height, (width + hpadding) / 2) words. The
+# padding pixels are black.
+def pack_levels(levels, hpadding: int = HPADDING):
+    levels = np.asarray(levels, dtype=np.uint16)
+    if ((levels.shape[-1] != 3) or ((levels.shape[-2] % 2) != 0)):
+        raise ValueError(f"expected (..., height, even width, 3) colors, not {levels.shape}")
+    pix = (levels[..., 0] << 4) | (levels[..., 1] << 2) | levels[..., 2]
+    words = pix[..., 0::2] | (pix[..., 1::2] << 8)
+    if (hpadding != 0):
+        pad = [(0, 0)] * (words.ndim - 1) + [(0, hpadding // 2)]
+        words = np.pad(words, pad)
+    return words
+
+# Packs one RGB frame (height, width, 3) or a batch (n, height, width, 3) of 8-bit colors
+def pack_frames(rgb, hpadding: int = HPADDING):
+    return pack_levels(quantize(rgb), hpadding)
+
+# The inverse of pack_levels(), without the padding: returns (..., height, width, 3) 2-bit colors
+def unpack_words(words, width: int = WIDTH):
+    words = np.asarray(words, dtype=np.uint16)[..., :width // 2]
+    pix = np.stack((words & 0x3f, words >> 8), axis=-1).reshape(words.shape[:-1] + (width,))
+    return np.stack(((pix >> 4) & 3, (pix >> 2) & 3, pix & 3), axis=-1)
+
+# Lays one frame's words out the way the driver addresses them: line y at rows 2y and 2y + 1.
+# Returns a flat array of words.
+def memory_image(words):
+    words = np.asarray(words, dtype=np.uint16)
+    height, per_line = words.shape
+    image = np.zeros((2 * height, ROW_STRIDE), dtype=np.uint16)
+    image[:, :per_line] = np.repeat(words, 2, axis=0)
+    image = image.flatten()
+    if (len(image) > ADDRESS_WORDS):
+        warnings.warn(f"{height} lines need {len(image)} words, more than the driver's 16-bit "
+                      f"address reaches; the last {len(image) - ADDRESS_WORDS} alias earlier rows")
+    return image
+
+# For a batch of packed frames, which lines differ from the frame before. The first frame counts
+# as entirely changed unless 'previous' (the frame already on the display) is given.
+def line_deltas(words, previous=None):
+    words = np.asarray(words)
+    if (previous is None):
+        first = np.ones((1, words.shape[1]), dtype=bool)
+    else:
+        first = np.any(words[:1] != np.asarray(previous)[np.newaxis], axis=2)
+    return np.concatenate((first, np.any(words[1:] != words[:-1], axis=2)))
+
+# Returns (start line, line count) for each run of changed lines in one frame's 'changed'
+def changed_runs(changed):
+    edges = np.diff(np.concatenate(([0], changed.astype(np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    ends = np.flatnonzero(edges == -1)
+    return starts, ends - starts
+
+# Encodes the changed lines of one frame as runs. Returns the encoded words.
+def encode_delta(words, changed):
+    starts, counts = changed_runs(changed)
+    per_line = words.shape[1]
+    out = np.zeros(2 * len(starts) + int(counts.sum()) * per_line, dtype=np.uint16)
+    pos = 0
+    for s, c in zip(starts.tolist(), counts.tolist()):
+        out[pos] = s
+        out[pos + 1] = c
+        out[pos + 2:pos + 2 + c * per_line] = words[s:s + c].flatten()
+        pos += 2 + c * per_line
+    return out
+
+# Applies an encoded delta to 'words' (one packed frame), in place
+def apply_delta(words, delta) -> None:
+    delta = np.asarray(delta, dtype=np.uint16)
+    per_line = words.shape[1]
+    pos = 0
+    while (pos < len(delta)):
+        s, c = int(delta[pos]), int(delta[pos + 1])
+        words[s:s + c] = delta[pos + 2:pos + 2 + c * per_line].reshape(c, per_line)
+        pos += 2 + c * per_line
+
+def encode_deltas(words, previous=None) -> list:
+    changed = line_deltas(words, previous)
+    return [encode_delta(w, c) for w, c in zip(words, changed)]
+
+# Writes words one per line for $readmemh
+def write_hex(path: str, words) -> None:
+    with open(path, 'w') as f:
+        f.write("\n".join(f"{w:04x}" for w in np.asarray(words).flatten().tolist()))
+        f.write("\n")
+
+def write_bin(path: str, words) -> None:
+    np.asarray(words, dtype="<u2").tofile(path)
+
+# Loads frames from a .npy file of (n, height, width, 3) or (height, width, 3) uint8, or from
+# image files if Pillow is installed
+def load_frames(paths: list):
+    if ((len(paths) == 1) and paths[0].endswith(".npy")):
+        frames = np.load(paths[0])
+        return frames[np.newaxis] if (frames.ndim == 3) else frames
+    try:
+        from PIL import Image
+    except ImportError:
+        raise ImportError("reading images needs Pillow (pip install pillow); .npy files work "
+                          "without it")
+    return np.stack([np.asarray(Image.open(p).convert("RGB")) for p in paths])
+
+# Frames of colored bars scrolling down, for trying things out without any images
+def test_pattern(count: int, width: int = WIDTH, height: int = HEIGHT):
+    y = np.arange(height)[:, None]
+    x = np.arange(width)[None, :]
+    frames = np.zeros((count, height, width, 3), dtype=np.uint8)
+    for i in range(count):
+        band = ((y + 4 * i) // 16) % 8
+        frames[i, ..., 0] = np.where(band & 1, 255, 0) * np.ones_like(x)
+        frames[i, ..., 1] = np.where(band & 2, 170, 0) * np.ones_like(x)
+        frames[i, ..., 2] = (x * 255 // (width - 1)) * np.ones_like(y)
+    return frames.astype(np.uint8)
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Converts RGB frames into framebuffers for "
+                                                 "color_sharp_memory_display_driver, and into "
+                                                 "line deltas between consecutive frames.")
+    parser.add_argument("inputs", type=str, nargs="*",
+                        help="a .npy file of frames, or image files (needs Pillow)")
+    parser.add_argument("--test-pattern", type=int, default=None, metavar="FRAMES",
+                        help="use this many frames of a scrolling test pattern instead")
+    parser.add_argument("--hpadding", type=int, default=HPADDING, help="HPADDING")
+    parser.add_argument("-o", "--output", type=str, default=None, metavar="PREFIX",
+                        help="write each frame's framebuffer to PREFIX_NNNN.hex (or .bin)")
+    parser.add_argument("--bin", action="store_true", help="write .bin files instead of .hex")
+    parser.add_argument("--memory-image", action="store_true",
+                        help="write framebuffers laid out at the driver's addresses rather than "
+                             "one row per line")
+    parser.add_argument("--deltas", type=str, default=None, metavar="FILE",
+                        help="write every frame's line delta, one after another, to FILE")
+    args = parser.parse_args()
+
+    from time import monotonic
+    if (args.test_pattern is not None):
+        frames = test_pattern(args.test_pattern)
+    elif (len(args.inputs) != 0):
+        frames = load_frames(args.inputs)
+    else:
+        parser.error("give input frames or --test-pattern")
+
+    start = monotonic()
+    words = pack_frames(frames, args.hpadding)
+    deltas = encode_deltas(words)
+    elapsed = monotonic() - start
+
+    n = len(words)
+    full_bytes = words.size * 2
+    delta_bytes = sum(len(d) for d in deltas) * 2
+    print(f"packed {n} {frames.shape[2]}x{frames.shape[1]} frames in {elapsed:.3f} s "
+          f"({n / elapsed:.01f} frames/s)")
+    print(f"full frames: {full_bytes} bytes; line deltas: {delta_bytes} bytes "
+          f"({100 * delta_bytes / full_bytes:.01f}%)")
+
+    if (args.output is not None):
+        for i, w in enumerate(words):
+            image = memory_image(w) if (args.memory_image) else w
+            if (args.bin):
+                write_bin(f"{args.output}_{i:04d}.bin", image)
+            else:
+                write_hex(f"{args.output}_{i:04d}.hex", image)
+
+    if (args.deltas is not None):
+        write_bin(args.deltas, np.concatenate(deltas))
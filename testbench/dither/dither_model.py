@@ -0,0 +1,226 @@
+#!/usr/bin/env python3
+
+# Golden model for image_dither (hdl/dither.v), and a generator for its testbench stimulus.
+#
+# Fixed-point error diffusion with the module's parameters:
+#   PIXWIDTH_IN / PIXWIDTH_OUT   input and output pixel widths
+#   INTERNAL_PRECISION           bits per kernel weight; a weight w means w / 2^INTERNAL_PRECISION
+#   DITHER_KERNEL                DITHER_KERNEL_HEIGHT rows of DITHER_KERNEL_WIDTH weights, packed the
+#                                way the Verilog parameter is written: the first weight listed (top
+#                                left) in the most significant bits
+#
+# Row 0 of the kernel is the current row, and the current pixel is in column
+# (DITHER_KERNEL_WIDTH - 1) / 2, so in row 0 only the weights right of it may be non-zero. For each
+# pixel, in raster order:
+#   v      = pix_in + error accumulated at this pixel
+#   vc     = v clamped to [0, 2^PIXWIDTH_IN - 1]
+#   out    = vc >> (PIXWIDTH_IN - PIXWIDTH_OUT)
+#   recon  = out bit-replicated back up to PIXWIDTH_IN bits
+#   err    = vc - recon
+# and every kernel tap adds (err * w) >>> INTERNAL_PRECISION (an arithmetic shift, so it rounds
+# towards -infinity) to the pixel it points at. Taps that land outside the frame are dropped, and
+# the accumulated error is cleared at the start of each frame.
+#
+# Each pixel only depends on pixels to its left in the same row and on earlier rows, so the
+# pixels on a skewed diagonal (x + skew * y constant) can all be done at once. The model steps
+# along those diagonals, doing every pixel on one for every frame in the batch with a handful of
+# numpy operations, so a batch of frames takes about width + skew * height steps no matter how
+# many frames are in it. Integer sums don't depend on order, so this matches a raster-order
+# implementation bit for bit; dither_raster() is one, for checking.
+
+import sys
+
+import numpy as np
+
+# Floyd-Steinberg, as in dither.v's default parameters
+FLOYD_STEINBERG = [[0, 0, 112],
+                   [48, 80, 16]]
+
+# Turns a packed DITHER_KERNEL value into a (height, width) array of weights
+def unpack_kernel(packed: int, width: int, height: int, precision: int):
+    n = width * height
+    mask = (1 << precision) - 1
+    weights = [(packed >> ((n - 1 - i) * precision)) & mask for i in range(n)]
+    return np.array(weights, dtype=np.int64).reshape(height, width)
+
+# The inverse of unpack_kernel(), for passing a kernel to the Verilog module
+def pack_kernel(kernel, precision: int) -> int:
+    packed = 0
+    for w in np.asarray(kernel).flatten():
+        packed = (packed << precision) | int(w)
+    return packed
+
+class DitherModel:
+    def __init__(self, pixwidth_in=8, pixwidth_out=1, internal_precision=8, kernel=FLOYD_STEINBERG):
+        if (not (0 < pixwidth_out <= pixwidth_in)):
+            raise ValueError(f"PIXWIDTH_OUT must be 1 to PIXWIDTH_IN ({pixwidth_in}), "
+                             f"not {pixwidth_out}")
+        self.pixwidth_in = pixwidth_in
+        self.pixwidth_out = pixwidth_out
+        self.precision = internal_precision
+        self.kernel = np.array(kernel, dtype=np.int64)
+        if (self.kernel.ndim != 2):
+            raise ValueError("kernel must be a 2-d array of weights")
+        if (np.any(self.kernel < 0) or np.any(self.kernel >= (1 << internal_precision))):
+            raise ValueError(f"kernel weights must fit in INTERNAL_PRECISION ({internal_precision}) "
+                             "bits")
+
+        height, width = self.kernel.shape
+        self.center = (width - 1) // 2
+        if (np.any(self.kernel[0, :self.center + 1] != 0)):
+            raise ValueError("kernel row 0 can only have weights to the right of the current pixel")
+
+        # (rows down, columns right, weight) for every non-zero weight
+        self.taps = [(int(r), int(c) - self.center, int(self.kernel[r, c]))
+                     for r, c in zip(*np.nonzero(self.kernel))]
+
+        # the smallest skew that puts every tap's target on a later diagonal than its source
+        self.skew = 1
+        for dr, dc, w in self.taps:
+            if (dr > 0):
+                self.skew = max(self.skew, (-dc) // dr + 1)
+
+    # PIXWIDTH_OUT-bit values bit-replicated out to PIXWIDTH_IN bits
+    def reconstruct(self, q):
+        r = np.zeros_like(q)
+        pos = self.pixwidth_in
+        while (pos > 0):
+            pos -= self.pixwidth_out
+            r |= (q << pos) if (pos >= 0) else (q >> -pos)
+        return r
+
+    # One step of the arithmetic for an array of pixel values plus their accumulated error.
+    # Returns (output pixels, error to diffuse).
+    def quantize(self, v):
+        vc = np.clip(v, 0, (1 << self.pixwidth_in) - 1)
+        q = vc >> (self.pixwidth_in - self.pixwidth_out)
+        return q, vc - self.reconstruct(q)
+
+    # Dithers one frame (height, width) or a batch of frames (n, height, width). Returns the
+    # output pixels in the same shape.
+    def dither(self, frames):
+        frames = np.asarray(frames)
+        single = (frames.ndim == 2)
+        pix = frames[np.newaxis].astype(np.int64) if (single) else frames.astype(np.int64)
+        if (np.any(pix < 0) or np.any(pix >= (1 << self.pixwidth_in))):
+            raise ValueError(f"input pixels must fit in PIXWIDTH_IN ({self.pixwidth_in}) bits")
+
+        # frames go on the last axis so that each pixel's values for the whole batch are contiguous
+        n, height, width = pix.shape
+        pix = np.ascontiguousarray(pix.transpose(1, 2, 0))
+        acc = np.zeros_like(pix)
+        out = np.zeros_like(pix)
+        s = self.skew
+        for t in range(width + s * (height - 1)):
+            y_lo = max(0, -((width - 1 - t) // s))
+            y_hi = min(height - 1, t // s)
+            ys = np.arange(y_lo, y_hi + 1)
+            xs = t - s * ys
+
+            q, err = self.quantize(pix[ys, xs] + acc[ys, xs])
+            out[ys, xs] = q
+            for dr, dc, w in self.taps:
+                ty, tx = ys + dr, xs + dc
+                inside = (ty < height) & (tx >= 0) & (tx < width)
+                acc[ty[inside], tx[inside]] += (err[inside] * w) >> self.precision
+
+        out = out.transpose(2, 0, 1)
+        return out[0] if (single) else np.ascontiguousarray(out)
+
+    # The same thing one pixel at a time in raster order. Slow; it's here to check dither().
+    def dither_raster(self, frame):
+        pix = np.asarray(frame, dtype=np.int64)
+        height, width = pix.shape
+        acc = np.zeros_like(pix)
+        out = np.zeros_like(pix)
+        for y in range(height):
+            for x in range(width):
+                q, err = self.quantize(pix[y, x] + acc[y, x])
+                out[y, x] = q
+                for dr, dc, w in self.taps:
+                    if ((y + dr < height) and (0 <= x + dc < width)):
+                        acc[y + dr, x + dc] += (int(err) * w) >> self.precision
+        return out
+
+# Writes pixels in raster order, one per line, for $readmemh
+def write_hex(path: str, pixels, bits: int) -> None:
+    digits = (bits + 3) // 4
+    with open(path, 'w') as f:
+        for p in np.asarray(pixels).flatten().tolist():
+            f.write(f"{p:0{digits}x}\n")
+
+def read_hex(path: str):
+    with open(path) as f:
+        return np.array([int(l, 16) for l in f if l.strip()], dtype=np.int64)
+
+# Test frames: random noise, or horizontal / vertical ramps, which show dithering artifacts well
+def make_frames(kind: str, count: int, width: int, height: int, bits: int, seed: int = 0):
+    top = (1 << bits) - 1
+    if (kind == "random"):
+        rng = np.random.default_rng(seed)
+        return rng.integers(0, top + 1, (count, height, width), dtype=np.int64)
+    if (kind == "ramp"):
+        h = np.linspace(0, top, width).round().astype(np.int64)
+        v = np.linspace(0, top, height).round().astype(np.int64)
+        frames = [np.tile(h, (height, 1)) if ((i % 2) == 0) else np.tile(v[:, None], (1, width))
+                  for i in range(count)]
+        return np.array(frames)
+    raise ValueError(f"unknown stimulus {kind}")
+
+def parse_kernel(s: str, width: int):
+    weights = [int(w, 0) for w in s.split(",")]
+    if ((len(weights) % width) != 0):
+        raise ValueError(f"{len(weights)} weights don't make rows of {width}")
+    return np.array(weights).reshape(-1, width)
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Golden model for image_dither. Dithers test "
+                                                 "frames and writes them and the expected output "
+                                                 "as $readmemh files.")
+    parser.add_argument("--pixwidth-in", type=int, default=8)
+    parser.add_argument("--pixwidth-out", type=int, default=1)
+    parser.add_argument("--precision", type=int, default=8, help="INTERNAL_PRECISION")
+    parser.add_argument("--kernel", type=str, default=None,
+                        help="comma-separated weights in the order DITHER_KERNEL lists them "
+                             "(default: Floyd-Steinberg)")
+    parser.add_argument("--kernel-width", type=int, default=3, help="DITHER_KERNEL_WIDTH")
+    parser.add_argument("--width", type=int, default=320, help="IMAGE_WIDTH")
+    parser.add_argument("--height", type=int, default=240, help="IMAGE_HEIGHT")
+    parser.add_argument("--frames", type=int, default=4)
+    parser.add_argument("--stimulus", type=str, default="random", choices=("random", "ramp"))
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("-o", "--output", type=str, default=None, metavar="PREFIX",
+                        help="write PREFIX_in.hex and PREFIX_expected.hex")
+    parser.add_argument("--check", type=int, default=0, metavar="N",
+                        help="check the first N frames against the slow raster-order model")
+    args = parser.parse_args()
+
+    kernel = FLOYD_STEINBERG if (args.kernel is None) else parse_kernel(args.kernel, args.kernel_width)
+    model = DitherModel(args.pixwidth_in, args.pixwidth_out, args.precision, kernel)
+    frames = make_frames(args.stimulus, args.frames, args.width, args.height, args.pixwidth_in,
+                         args.seed)
+
+    from time import monotonic
+    start = monotonic()
+    out = model.dither(frames)
+    elapsed = monotonic() - start
+    print(f"dithered {args.frames} {args.width}x{args.height} frames in {elapsed:.3f} s "
+          f"({args.frames / elapsed:.01f} frames/s)")
+    print(f"DITHER_KERNEL = {args.precision * model.kernel.size}'h"
+          f"{pack_kernel(model.kernel, args.precision):0{(args.precision * model.kernel.size + 3) // 4}x}")
+
+    failed = False
+    for i in range(min(args.check, args.frames)):
+        if (not np.array_equal(out[i], model.dither_raster(frames[i]))):
+            print(f"frame {i} doesn't match the raster-order model")
+            failed = True
+    if ((args.check != 0) and (not failed)):
+        print(f"{min(args.check, args.frames)} frames match the raster-order model")
+
+    if (args.output is not None):
+        write_hex(args.output + "_in.hex", frames, args.pixwidth_in)
+        write_hex(args.output + "_expected.hex", out, args.pixwidth_out)
+        print(f"wrote {args.output}_in.hex and {args.output}_expected.hex")
+    sys.exit(1 if failed else 0)
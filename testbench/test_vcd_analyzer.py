@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+
+# Checks that vcd_analyzer.py puts out what its decoders find in order of time, even when a long i2c
+# transaction finishes after uart bytes that started later, and when a uart byte ends while its
+# own line stays idle.
+
+import io
+import sys
+
+from vcd_analyzer import VCDReader, I2CDecoder, UARTDecoder, analyze
+
+BIT = 10
+
+# An i2c write of one byte to 0x30 starting at 'start', with each scl period 'period' long, and a
+# uart byte 0xa5 starting at 'uart_start'
+def dump(start: int, period: int, uart_start: int) -> bytes:
+    changes = [(0, "c", "1"), (0, "d", "1"), (0, "u", "1"), (start, "d", "0")]
+    t = start + period
+    address, data = [[(byte >> k) & 1 for k in range(7, -1, -1)] for byte in (0x60, 0x5a)]
+    for b in address + [0] + data + [0]:
+        changes += [(t, "c", "0"), (t + period // 4, "d", str(b)), (t + period // 2, "c", "1")]
+        t += period
+    changes += [(t, "c", "0"), (t + period // 4, "d", "0"), (t + period // 2, "c", "1"),
+                (t + 3 * period // 4, "d", "1")]
+    for k, b in enumerate([0] + [(0xa5 >> k) & 1 for k in range(8)] + [1]):
+        changes.append((uart_start + k * BIT, "u", str(b)))
+    changes.append((max(t, uart_start + 10 * BIT) + 10 * period, "c", "1"))
+
+    text = ("$timescale 1ns $end\n$scope module tb $end\n$var wire 1 c scl $end\n"
+            "$var wire 1 d sda $end\n$var wire 1 u uart_tx $end\n$upscope $end\n"
+            "$enddefinitions $end\n")
+    last = None
+    for time, v, value in sorted(changes, key=lambda c: c[0]):
+        if (time != last):
+            text += f"#{time}\n"
+            last = time
+        text += f"{value}{v}\n"
+    return text.encode()
+
+def decode(data: bytes) -> list:
+    reader = VCDReader(io.BytesIO(data))
+    decoders = [I2CDecoder(reader.find("scl"), reader.find("sda")),
+                UARTDecoder(reader.find("uart_tx"), BIT)]
+    out = []
+    analyze(reader, decoders, lambda d, item: out.append(item))
+    return out
+
+def test_output_is_in_time_order():
+    # uart byte during the i2c transaction, before it and after it
+    for uart_start in (500, 10, 3000):
+        items = decode(dump(100, 100, uart_start))
+        kinds = sorted(type(i).__name__ for i in items)
+        assert kinds == ["I2CTransaction", "UARTByte"], f"uart at {uart_start}: decoded {kinds}"
+        times = [i.time for i in items]
+        assert times == sorted(times), f"uart at {uart_start}: out of order {times}"
+        assert [i.value for i in items if hasattr(i, "value")] == [0xa5]
+
+if __name__ == "__main__":
+    test_output_is_in_time_order()
+    print("decoded items come out in time order")
+    sys.exit(0)
@@ -0,0 +1,602 @@
+#!/usr/bin/env python3
+
+# Decodes bus traffic out of testbench VCD dumps: i2c transactions from scl / sda (as in
+# i2c_controller_tb.sv), bytes from a uart_tx_kiss output, and samples from an i2s_controller's
+# bck / lrck / data. i2c traffic can also be checked against the program that assemble.py built for
+# the controller.
+#
+# Dumps can be much bigger than memory, so nothing holds on to the file. The header is parsed once,
+# and then the value changes are read in large blocks in a single pass. Most of a dump is changes
+# of signals nobody asked about (clocks, mostly), so each block is searched with regular expressions
+# that only match changes of the watched signals, and the time each one happened at is found by
+# searching back for the last '#' line. Only the matches are handled in Python, so the cost
+# is a scan of the file plus a little work per change of a watched signal.
+#
+# Changes that happen at the same time are handed to the decoders together. Decoders sample the
+# way a flip-flop would: a value that changes at the same time as the clock edge that samples it
+# counts as its old value.
+#
+# Only what's decoded is kept, and only when it's needed for the comparison; the decoders
+# themselves keep a few values of state each.
+
+import heapq
+import itertools
+import json
+import os
+import re
+import sys
+
+CHUNK_BYTES = 16 * 1024 * 1024
+
+class VCDVariable:
+    def __init__(self, name: str, id_code: str, width: int, kind: str):
+        self.name = name
+        self.id_code = id_code
+        self.width = width
+        self.kind = kind
+
+        # filled in while scanning, for watched variables only
+        self.changes = 0
+        self.first_time = None
+        self.last_time = None
+
+class VCDReader:
+    def __init__(self, f, chunk_bytes: int = CHUNK_BYTES):
+        self.f = f
+        self.chunk_bytes = chunk_bytes
+        self.variables = {}
+        self.by_id = {}
+        self.timescale = "1s"
+        self.end_time = 0
+        self._read_header()
+
+    # Reads declarations up to $enddefinitions, and remembers where the value changes start
+    def _read_header(self) -> None:
+        scope = []
+        tokens = []
+        for line in self.f:
+            tokens.extend(line.decode(errors="replace").split())
+            if ((len(tokens) == 0) or (tokens[-1] != "$end")):
+                continue
+
+            kind = tokens[0]
+            if (kind == "$scope"):
+                scope.append(tokens[2])
+            elif (kind == "$upscope"):
+                scope.pop()
+            elif (kind == "$timescale"):
+                self.timescale = "".join(tokens[1:-1])
+            elif (kind == "$var"):
+                # $var wire 1 ! name [range] $end
+                name = ".".join(scope + [tokens[4]])
+                v = VCDVariable(name, tokens[3], int(tokens[2]), tokens[1])
+                self.variables[name] = v
+                self.by_id.setdefault(v.id_code, v)
+            tokens = []
+            if (kind == "$enddefinitions"):
+                break
+        self._data_start = self.f.tell()
+
+    # Finds a variable by its full hierarchical name, or by the end of it ('scl', 'dut.scl_io'). If
+    # several match, the one nearest the top of the hierarchy wins.
+    def find(self, name: str) -> VCDVariable:
+        if (name in self.variables):
+            return self.variables[name]
+        matches = [v for n, v in self.variables.items() if (n.endswith("." + name))]
+        if (len(matches) == 0):
+            raise ValueError(f"no signal called {name} in the dump")
+        return min(matches, key=lambda v: (v.name.count("."), v.name))
+
+    # Yields (time, variable, value) for every change of the given variables, in file order. Values
+    # are the text of the change: '0', '1', 'x' or 'z' for scalars and the bits for vectors.
+    def changes(self, variables):
+        ids = {v.id_code: v for v in variables}
+        if (len(ids) == 0):
+            return
+
+        # one pattern for the scalars and one for the vectors; a single pattern with both is
+        # several times slower to search with
+        def pattern(prefix, vs):
+            names = sorted((re.escape(v.id_code.encode()) for v in vs), key=len, reverse=True)
+            return re.compile(b"\n" + prefix + b"(" + b"|".join(names) + rb")[ \t\r]*(?=\n)")
+        patterns = []
+        scalars = [v for v in ids.values() if (v.width == 1)]
+        vectors = [v for v in ids.values() if (v.width != 1)]
+        if (len(scalars) != 0): patterns.append(pattern(rb"([01xzXZ])", scalars))
+        if (len(vectors) != 0): patterns.append(pattern(rb"[bB]([01xzXZ]+) ", vectors))
+        time_line = re.compile(rb"#(\d+)")
+
+        # Every chunk starts and ends with a newline, so every line in it has one on each side.
+        self.f.seek(self._data_start)
+        carry = b"\n"
+        time = 0
+        while True:
+            block = self.f.read(self.chunk_bytes)
+            final = (len(block) == 0)
+            data = carry + block + (b"\n" if (final) else b"")
+            cut = data.rfind(b"\n")
+            chunk, carry = data[:cut + 1], data[cut:]
+
+            # The time of a change is on the last '#' line before it. Only the stretch since the
+            # last change is searched, so each byte is searched at most once.
+            matches = patterns[0].finditer(chunk) if (len(patterns) == 1) else \
+                      heapq.merge(*(p.finditer(chunk) for p in patterns), key=lambda m: m.start())
+            searched = 0
+            for m in matches:
+                t = chunk.rfind(b"\n#", searched, m.start())
+                if (t >= 0):
+                    time = int(time_line.match(chunk, t + 1).group(1))
+                searched = m.start()
+                v = ids[m.group(2).decode()]
+                value = m.group(1).decode().lower()
+                v.changes += 1
+                if (v.first_time is None): v.first_time = time
+                v.last_time = time
+                yield (time, v, value)
+
+            t = chunk.rfind(b"\n#", searched)
+            if (t >= 0):
+                time = int(time_line.match(chunk, t + 1).group(1))
+            self.end_time = max(self.end_time, time)
+            if (final): break
+
+    # The period of a clock, from the first few of its rising edges
+    def clock_period(self, clock: VCDVariable, edges: int = 4) -> tuple:
+        rises = []
+        level = None
+        for time, v, value in self.changes([clock]):
+            if ((value == "1") and (level == "0")):
+                rises.append(time)
+                if (len(rises) == edges): break
+            level = value
+        if (len(rises) < 2):
+            raise ValueError(f"{clock.name} doesn't toggle enough to measure its period")
+        return ((rises[-1] - rises[0]) // (len(rises) - 1), rises[0])
+
+# The level of a bus wire: pulled up when nothing drives it, and unchanged when it's unknown
+def _level(value: str, old: int) -> int:
+    if (value == "1"): return 1
+    if (value == "0"): return 0
+    if (value == "z"): return 1
+    return old
+
+class I2CTransaction:
+    def __init__(self, time: int):
+        self.time = time
+        self.address = None
+        self.read = None
+        self.ack = None
+        self.data = []
+        self.acks = []
+        self.end = None
+
+    def as_dict(self) -> dict:
+        return {"time": self.time, "address": self.address, "read": self.read, "ack": self.ack,
+                "data": self.data, "acks": self.acks, "end": self.end}
+
+    def __str__(self):
+        if (self.address is None):
+            return f"{self.time:>14}  i2c  start with no address"
+        rw = "read " if (self.read) else "write"
+        data = " ".join(f"{b:02x}{'' if a else '!'}" for b, a in zip(self.data, self.acks))
+        return (f"{self.time:>14}  i2c  {rw} 0x{self.address:02x}{'' if self.ack else ' NAK'}: "
+                f"{data}  ({self.end or 'unfinished'})")
+
+# Decodes start and stop conditions and 9-bit frames. Data bytes are followed by '!' where they
+# were nak'd.
+class I2CDecoder:
+    def __init__(self, scl: VCDVariable, sda: VCDVariable):
+        self.scl = scl
+        self.sda = sda
+        self.signals = (scl, sda)
+        self.scl_level = 1
+        self.sda_level = 1
+        self.current = None
+        self.bits = 0
+        self.nbits = 0
+        self.transactions = 0
+        self.naks = 0
+
+    # Takes every change at one time ({variable: value}). Returns finished transactions.
+    def update(self, time: int, values: dict) -> list:
+        scl = _level(values[self.scl], self.scl_level) if (self.scl in values) else self.scl_level
+        sda = _level(values[self.sda], self.sda_level) if (self.sda in values) else self.sda_level
+        out = []
+        if ((self.scl_level == 1) and (scl == 1) and (sda != self.sda_level)):
+            if (self.current is not None):
+                self.current.end = "repeated start" if (sda == 0) else "stop"
+                out.append(self._finish())
+            if (sda == 0):
+                self.current = I2CTransaction(time)
+                self.bits = 0
+                self.nbits = 0
+        elif ((self.scl_level == 0) and (scl == 1) and (self.current is not None)):
+            self._bit(self.sda_level)
+        self.scl_level = scl
+        self.sda_level = sda
+        return out
+
+    def _bit(self, bit: int) -> None:
+        t = self.current
+        if (self.nbits < 8):
+            self.bits = (self.bits << 1) | bit
+            self.nbits += 1
+            return
+
+        ack = (bit == 0)
+        if (t.address is None):
+            t.address, t.read, t.ack = self.bits >> 1, bool(self.bits & 1), ack
+        else:
+            t.data.append(self.bits)
+            t.acks.append(ack)
+        # the controller naks the last byte it reads; only count naks from devices
+        if ((not ack) and (not (t.read and (len(t.data) != 0)))): self.naks += 1
+        self.bits = 0
+        self.nbits = 0
+
+    def _finish(self) -> I2CTransaction:
+        t, self.current = self.current, None
+        self.transactions += 1
+        return t
+
+    def flush(self) -> list:
+        return [self._finish()] if (self.current is not None) else []
+
+    # When the transaction that's being decoded started, or None
+    def pending(self) -> int:
+        return None if (self.current is None) else self.current.time
+
+    def summary(self) -> str:
+        return f"i2c: {self.transactions} transactions, {self.naks} naks from devices"
+
+class UARTByte:
+    def __init__(self, time: int, value: int, framing_error: bool):
+        self.time = time
+        self.value = value
+        self.framing_error = framing_error
+
+    def as_dict(self) -> dict:
+        return {"time": self.time, "value": self.value, "framing_error": self.framing_error}
+
+    def __str__(self):
+        err = "  framing error" if (self.framing_error) else ""
+        return f"{self.time:>14}  uart 0x{self.value:02x}{err}"
+
+# Decodes uart_tx_kiss frames (a start bit, 8 data bits lsb first, a stop bit), each bit lasting
+# 'bit_time' (baud_divisor clock periods). Bits are sampled in the middle.
+class UARTDecoder:
+    def __init__(self, tx: VCDVariable, bit_time: float):
+        self.tx = tx
+        self.signals = (tx,)
+        self.bit_time = bit_time
+        self.level = 1
+        self.start = None
+        self.bit = 0
+        self.value = 0
+        self.error = False
+        self.count = 0
+        self.framing_errors = 0
+
+    # Samples the line at every mid-bit point before 'time'. Returns the bytes whose stop bits that
+    # sampled.
+    def advance(self, time: float) -> list:
+        out = []
+        while (self.start is not None):
+            t = self.start + (self.bit + 0.5) * self.bit_time
+            if (t >= time): break
+            if (self.bit == 0):
+                self.error = (self.level != 0)
+            elif (self.bit <= 8):
+                self.value |= (self.level << (self.bit - 1))
+            else:
+                self.error |= (self.level != 1)
+                out.append(UARTByte(self.start, self.value, self.error))
+                self.count += 1
+                self.framing_errors += int(self.error)
+                self.start = None
+                break
+            self.bit += 1
+        return out
+
+    def update(self, time: int, values: dict) -> list:
+        out = self.advance(time)
+        level = _level(values[self.tx], self.level)
+        if ((self.start is None) and (self.level == 1) and (level == 0)):
+            self.start, self.bit, self.value, self.error = time, 0, 0, False
+        self.level = level
+        return out
+
+    def flush(self, time: int = None) -> list:
+        return self.advance(float("inf") if (time is None) else time + 1)
+
+    def pending(self) -> int:
+        return self.start
+
+    def summary(self) -> str:
+        return f"uart: {self.count} bytes, {self.framing_errors} framing errors"
+
+class I2SSample:
+    def __init__(self, time: int, channel: int, value: int, defined: bool):
+        self.time = time
+        self.channel = channel
+        self.value = value
+        self.defined = defined
+
+    def as_dict(self) -> dict:
+        return {"time": self.time, "channel": self.channel, "value": self.value,
+                "defined": self.defined}
+
+    def __str__(self):
+        return (f"{self.time:>14}  i2s  ch{self.channel} 0x{self.value:08x}"
+                f"{'' if self.defined else ' (has x/z bits)'}")
+
+# Decodes i2s as i2s_controller reads it: data is sampled on rising edges of bck, msb first, and a
+# word belongs to the channel that lrck selected one bit earlier. Words shorter than
+# 'bits_per_word' (the first one, usually) are counted but not reported.
+class I2SDecoder:
+    def __init__(self, bck: VCDVariable, lrck: VCDVariable, data: VCDVariable,
+                 bits_per_word: int = 32):
+        self.bck = bck
+        self.lrck = lrck
+        self.data = data
+        self.signals = (bck, lrck, data)
+        self.bits_per_word = bits_per_word
+        self.levels = {bck: "0", lrck: "0", data: "0"}
+        self.lrck_at_last_rise = None
+        self.channel = None
+        self.word = 0
+        self.nbits = 0
+        self.defined = True
+        self.word_time = None
+        self.samples = [0, 0]
+        self.partial = 0
+
+    def update(self, time: int, values: dict) -> list:
+        out = []
+        old = self.levels
+        if ((old[self.bck] == "0") and (values.get(self.bck) == "1")):
+            channel = self.lrck_at_last_rise
+            if ((channel != self.channel) and (self.nbits != 0)):
+                out.extend(self._finish())
+            if (self.nbits == 0):
+                self.word_time = time
+            self.channel = channel
+            bit = old[self.data]
+            self.word = (self.word << 1) | (bit == "1")
+            self.defined &= (bit in "01")
+            self.nbits += 1
+            self.lrck_at_last_rise = int(old[self.lrck] == "1")
+        self.levels = {v: values.get(v, old[v]) for v in self.signals}
+        return out
+
+    def _finish(self) -> list:
+        out = []
+        if ((self.nbits == self.bits_per_word) and (self.channel is not None)):
+            out.append(I2SSample(self.word_time, self.channel, self.word, self.defined))
+            self.samples[self.channel] += 1
+        else:
+            self.partial += 1
+        self.word, self.nbits, self.defined = 0, 0, True
+        return out
+
+    def flush(self) -> list:
+        return self._finish() if (self.nbits != 0) else []
+
+    def pending(self) -> int:
+        return self.word_time if (self.nbits != 0) else None
+
+    def summary(self) -> str:
+        return (f"i2s: {self.samples[0]} channel 0 and {self.samples[1]} channel 1 words, "
+                f"{self.partial} partial")
+
+# Runs decoders over a dump in one pass. 'emit' is called with everything each decoder produces, in
+# order of time. Decoders only produce things once they're finished, by when another decoder may
+# have finished something that started later, so what's produced is held back until nothing that's
+# still being decoded (each decoder's pending()) could have started before it.
+def analyze(reader: VCDReader, decoders: list, emit, extra=()) -> None:
+    watched = {v for d in decoders for v in d.signals} | set(extra)
+    uarts = [d for d in decoders if isinstance(d, UARTDecoder)]
+    held = []
+    count = itertools.count()
+
+    def hold(d, items):
+        for item in items:
+            heapq.heappush(held, (item.time, next(count), d, item))
+
+    def release(now):
+        pending = [t for t in (d.pending() for d in decoders) if (t is not None)]
+        until = min([now] + pending)
+        while ((len(held) != 0) and (held[0][0] <= until)):
+            time, n, d, item = heapq.heappop(held)
+            emit(d, item)
+
+    def dispatch(time, group):
+        n = len(held)
+        for d in decoders:
+            if (any((v in group) for v in d.signals)):
+                hold(d, d.update(time, group))
+        if (len(held) != n): release(time)
+
+    group = {}
+    group_time = None
+    for time, v, value in reader.changes(watched):
+        if (time != group_time):
+            if (len(group) != 0):
+                dispatch(group_time, group)
+                group = {}
+
+            # a uart byte ends at a mid-bit sample rather than at an edge, so uart decoders are
+            # brought up to every time there's a change, not just changes on their own line
+            for d in uarts:
+                if (d.start is not None):
+                    n = len(held)
+                    hold(d, d.advance(time))
+                    if (len(held) != n): release(time)
+        group_time = time
+        group[v] = value
+        if (v in extra):
+            emit(None, (time, v, value))
+    if (len(group) != 0):
+        dispatch(group_time, group)
+
+    for d in decoders:
+        hold(d, d.flush(reader.end_time) if isinstance(d, UARTDecoder) else d.flush())
+    release(float("inf"))
+
+# Checks decoded i2c transactions against the program the controller was running, by simulating it
+# with simulate.py. Devices in the simulation answer reads with the bytes read in the dump, so the
+# program takes the same branches, and 'triggers' is trigger_i as (cycle, value) pairs. Returns a
+# list of (index, expected, decoded) mismatches, where either side may be None.
+def compare_program(program: str, transactions: list, triggers=(), scl_div: int = 60,
+                    max_cycles: int = 10_000_000) -> list:
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "i2c_controller"))
+    from simulate import simulate, load_program, ScriptedI2CDevice
+
+    reads = {}
+    naks = set()
+    for t in transactions:
+        if (t.address is None): continue
+        if (t.read): reads.setdefault(t.address, []).extend(t.data)
+        if (not t.ack): naks.add(t.address)
+    devices = [ScriptedI2CDevice(a, reads.get(a, ()), nak_address=(a in naks))
+               for a in {t.address for t in transactions if (t.address is not None)}]
+
+    result = simulate(load_program(program), max_cycles=max_cycles, scl_div=scl_div,
+                      devices=devices, triggers=triggers)
+    expected = result.transactions
+
+    mismatches = []
+    decoded = [t for t in transactions if ((t.address is not None) and (t.end is not None))]
+    for i in range(max(len(expected), len(decoded))):
+        e = expected[i] if (i < len(expected)) else None
+        d = decoded[i] if (i < len(decoded)) else None
+        if ((e is None) or (d is None) or
+            ((e["address"], e["read"], e["ack"], e["data"]) != (d.address, d.read, d.ack, d.data))):
+            mismatches.append((i, e, d))
+    return mismatches
+
+def _names(s: str, count: int) -> list:
+    names = s.split(",")
+    if (len(names) != count):
+        raise argparse.ArgumentTypeError(f"expected {count} comma-separated signal names")
+    return names
+
+import argparse
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Decodes i2c, uart and i2s traffic from a VCD dump "
+                                                 "in one pass, and checks i2c traffic against an "
+                                                 "i2c controller program.")
+    parser.add_argument("vcd", type=str)
+    parser.add_argument("--list", action="store_true", help="list the signals in the dump and exit")
+    parser.add_argument("--i2c", type=lambda s: _names(s, 2), default=None, metavar="SCL,SDA")
+    parser.add_argument("--uart", type=str, default=None, metavar="TX",
+                        help="uart_tx output of a uart_tx_kiss")
+    parser.add_argument("--baud-divisor", type=int, default=104, help="baud_divisor of the uart")
+    parser.add_argument("--i2s", type=lambda s: _names(s, 3), default=None, metavar="BCK,LRCK,DATA")
+    parser.add_argument("--bits-per-word", type=int, default=32, help="bits_per_word of the i2s")
+    parser.add_argument("--clock", type=str, default=None,
+                        help="clock that baud_divisor divides, and that the i2c controller runs on")
+    parser.add_argument("--program", type=str, default=None,
+                        help="check the i2c traffic against this .i2casm or .hex program (needs "
+                             "--clock and --reset)")
+    parser.add_argument("--reset", type=str, default=None, help="the i2c controller's reset")
+    parser.add_argument("--trigger", type=str, default=None,
+                        help="the i2c controller's trigger_i, for --program")
+    parser.add_argument("--scl-div", type=int, default=60, help="SCL_DIV of the i2c controller")
+    parser.add_argument("-q", "--quiet", action="store_true",
+                        help="only print the summary, not everything decoded")
+    parser.add_argument("--json", type=str, default=None,
+                        help="also write everything decoded to this file, one JSON object per line")
+    args = parser.parse_args()
+
+    from time import monotonic
+    start = monotonic()
+    f = open(args.vcd, 'rb')
+    reader = VCDReader(f)
+
+    if (args.list):
+        for v in reader.variables.values():
+            print(f"{v.id_code:>6} {v.width:4d}  {v.kind:8} {v.name}")
+        sys.exit(0)
+
+    period = None
+    if (args.clock is not None):
+        clock = reader.find(args.clock)
+        period, first_rise = reader.clock_period(clock)
+        print(f"{clock.name}: period {period} x {reader.timescale}")
+
+    decoders = []
+    if (args.i2c is not None):
+        decoders.append(I2CDecoder(reader.find(args.i2c[0]), reader.find(args.i2c[1])))
+    if (args.uart is not None):
+        if (period is None):
+            parser.error("--uart needs --clock to know how long a bit is")
+        decoders.append(UARTDecoder(reader.find(args.uart), args.baud_divisor * period))
+    if (args.i2s is not None):
+        decoders.append(I2SDecoder(*[reader.find(n) for n in args.i2s], args.bits_per_word))
+    if (len(decoders) == 0):
+        parser.error("nothing to decode; give --i2c, --uart or --i2s")
+
+    extra = []
+    if (args.program is not None):
+        if ((period is None) or (args.reset is None) or (args.i2c is None)):
+            parser.error("--program needs --i2c, --clock and --reset")
+        reset = reader.find(args.reset)
+        extra.append(reset)
+        trigger = reader.find(args.trigger) if (args.trigger is not None) else None
+        if (trigger is not None): extra.append(trigger)
+
+    transactions = []
+    reset_changes = []
+    trigger_changes = []
+    out = open(args.json, 'w') if (args.json is not None) else None
+    def emit(decoder, item):
+        if (decoder is None):
+            time, v, value = item
+            (reset_changes if (v is reset) else trigger_changes).append((time, value))
+            return
+        if (isinstance(item, I2CTransaction) and (args.program is not None)):
+            transactions.append(item)
+        if (not args.quiet):
+            print(item)
+        if (out is not None):
+            out.write(json.dumps(dict(item.as_dict(), kind=type(item).__name__)) + "\n")
+
+    analyze(reader, decoders, emit, extra)
+    if (out is not None): out.close()
+    elapsed = monotonic() - start
+
+    print()
+    for d in decoders:
+        print(d.summary())
+    for v in sorted({v for d in decoders for v in d.signals} | set(extra), key=lambda v: v.name):
+        print(f"    {v.name}: {v.changes} changes, from {v.first_time} to {v.last_time}")
+    size = f.tell()
+    print(f"read {size / (1024 * 1024):.01f} MiB in {elapsed:.2f} s "
+          f"({size / (1024 * 1024) / elapsed:.01f} MiB/s)")
+
+    failed = False
+    if (args.program is not None):
+        # cycle 0 is the first rising clock edge after reset goes low
+        released = [t for t, value in reset_changes if (value == "0")]
+        if (len(released) == 0):
+            sys.exit(f"{reset.name} never goes low")
+        t0 = first_rise + -(-(released[0] - first_rise) // period) * period
+        to_cycle = lambda t: max(0, (t - t0) // period)
+        triggers = [(to_cycle(t), int(value, 2)) for t, value in trigger_changes if ("x" not in value)
+                    and ("z" not in value)]
+        mismatches = compare_program(args.program, transactions, triggers, args.scl_div,
+                                     to_cycle(reader.end_time) + 1)
+        checked = sum(1 for t in transactions if ((t.address is not None) and (t.end is not None)))
+        print(f"{checked - len(mismatches)} of {checked} i2c transactions match {args.program}")
+        describe = lambda address, read, ack, data: (f"{'read' if read else 'write'} 0x{address:02x}"
+                                                     f"{'' if ack else ' NAK'}: "
+                                                     f"{' '.join(f'{b:02x}' for b in data)}")
+        for i, e, d in mismatches[:10]:
+            expected = "nothing" if (e is None) else describe(e["address"], e["read"], e["ack"], e["data"])
+            decoded = "nothing" if (d is None) else describe(d.address, d.read, d.ack, d.data)
+            at = f" at {d.time}" if (d is not None) else ""
+            print(f"    #{i}{at}: expected {expected}, decoded {decoded}")
+        failed = (len(mismatches) != 0)
+    sys.exit(1 if failed else 0)
@@ -37,6 +37,19 @@
 
 from typing import Type
 from types import SimpleNamespace
+from array import array
+import ast
+import functools
+import hashlib
+import json
+import operator
+import os
+import re
+import sys
+import tempfile
+
+# Bump this whenever a change to the framework could change the output for the same source.
+SIMPLEASMPARSER_VERSION = "1.3"
 
 class SimpleAsmInstruction:
     # Takes an array of args and constructs a new instruction.
@@ -56,6 +69,11 @@ class SimpleAsmInstruction:
         # What position does this instruction have in the program in machine words?
         self.offset = offset
 
+        # The instruction that runs straight into this one, or None if there's a label in between
+        # or nothing before it falls through. The parser sets it before calling parse(), for
+        # instructions whose encoding depends on what ran before them.
+        self.previous = None
+
     # This function should parse the arguments and validate them.
     # It must also set self.size_words to the final size of the instruction in machine words.
     # it can raise an error if there was an issue parsing the instruction's argument test.
@@ -63,15 +81,35 @@ class SimpleAsmInstruction:
         self.size_words = 0
         raise ValueError("This class shouldn't be instantiated.")
 
+    # Does execution carry on to the next instruction after this one? Unconditional jumps should
+    # set this to False. The linker uses it to find blocks of code that can be shared.
+    falls_through: bool = True
+
     def get_size_words(self) -> int:
         return self.size_words
 
+    # Returns the labels that this instruction's words refer to as a list of
+    # (word index, label name, mask) tuples, where the label's address goes in the bits set in
+    # 'mask'. Instructions that refer to labels need to override this for relocatable output.
+    def label_references(self) -> list:
+        return []
+
     # Returns a string containing hex to append to an output file.
     # the string may contain verilog-style '//' comments or vhdl-style '#' comments
     # (e.g. "// my_instr \n01_02")
     def emit(self, parent) -> str:
         pass
 
+    # Returns the machine words for this instruction as a list of ints.
+    # By default this reads the words back out of the text from emit(), so instructions only have
+    # to implement emit(). Instructions can override this to skip formatting and re-parsing text.
+    def emit_words(self, parent) -> list:
+        words = []
+        for line in self.emit(parent).split("\n"):
+            line = line.split("//", maxsplit=1)[0].split("#", maxsplit=1)[0]
+            words.extend(int(tok.replace("_", ""), 16) for tok in line.split())
+        return words
+
 # Example instruction declaration
 class __AddInstruction(SimpleAsmInstruction):
     MNEMONIC: str = "add"
@@ -123,12 +161,101 @@ class SimpleAsmLabel:
     # What is the address in machine words?
     address: int = None
 
+    # How many instructions come before this label? This is what keeps labels in the right place
+    # when instructions are added or removed after parsing.
+    index: int = None
+
     # Takes a string containing the label and a line number and strips it to
     def __init__(self, s, line_number):
         self.name = s.split(":", maxsplit=1)[0]
         self.line_number = line_number
 
 
+# Where a line of source came from. Lines produced by expanding a macro have the location of the
+# macro's use as their 'parent', and 'context' describes it.
+class SimpleAsmLocation:
+    def __init__(self, filename, line_number, parent=None, context=None):
+        self.filename = filename
+        self.line_number = line_number
+        self.parent = parent
+        self.context = context
+
+# A '.macro name param1 param2 ...' definition. Each use replaces the params in the body with the
+# arguments it's given, and '\@' with a number that's unique to the use, which makes it possible
+# to define labels inside macros.
+class SimpleAsmMacro:
+    def __init__(self, name: str, params: list, body: list, loc):
+        self.name = name
+        self.params = params
+        self.body = body
+        self.loc = loc
+
+    def expand(self, args: list, loc, use_number: int, parser):
+        if (len(args) != len(self.params)):
+            raise parser._error(loc, f"macro {self.name} takes {len(self.params)} args "
+                                     f"({' '.join(self.params)}) but got {len(args)}")
+
+        params = dict(zip(self.params, args))
+        use = SimpleAsmLocation(loc.filename, loc.line_number, loc.parent, f"macro {self.name}")
+        for l, text in self.body:
+            text = _IDENTIFIER.sub(lambda m: params.get(m.group(0), m.group(0)), text)
+            text = text.replace("\\@", str(use_number))
+            yield (SimpleAsmLocation(l.filename, l.line_number, use), text)
+
+# How deeply can includes, macros and repeats nest inside each other?
+MAX_EXPANSION_DEPTH = 64
+
+_IDENTIFIER = re.compile(r"\b[A-Za-z_]\w*\b")
+
+# Evaluates an integer expression made of literals, parentheses and + - * / % << >> & | ^ ~.
+# Raises ValueError if 'text' is anything else.
+def _evaluate(text: str) -> int:
+    try:
+        return _evaluate_node(ast.parse(text.strip(), mode="eval").body)
+    except SyntaxError as e:
+        raise ValueError(f"couldn't evaluate {text}")
+
+_BINARY_OPS = {
+    ast.Add: operator.add, ast.Sub: operator.sub, ast.Mult: operator.mul,
+    ast.FloorDiv: operator.floordiv, ast.Div: operator.floordiv, ast.Mod: operator.mod,
+    ast.LShift: operator.lshift, ast.RShift: operator.rshift,
+    ast.BitAnd: operator.and_, ast.BitOr: operator.or_, ast.BitXor: operator.xor,
+}
+_UNARY_OPS = {ast.USub: operator.neg, ast.UAdd: operator.pos, ast.Invert: operator.invert}
+
+def _evaluate_node(node) -> int:
+    if (isinstance(node, ast.Constant) and (type(node.value) is int)):
+        return node.value
+    if (isinstance(node, ast.BinOp) and (type(node.op) in _BINARY_OPS)):
+        return _BINARY_OPS[type(node.op)](_evaluate_node(node.left), _evaluate_node(node.right))
+    if (isinstance(node, ast.UnaryOp) and (type(node.op) in _UNARY_OPS)):
+        return _UNARY_OPS[type(node.op)](_evaluate_node(node.operand))
+    raise ValueError("not an integer expression")
+
+# What a '.equ' constant is replaced with. Instructions parse their operands in their own base
+# (write_trigger's are binary), so a plain literal is kept as it was written, and an expression is
+# evaluated and written in hex with a '0x' prefix, which says what base it's in. Anything that
+# isn't an integer expression is kept as text.
+def _constant_text(text: str) -> str:
+    text = text.strip()
+    try:
+        node = ast.parse(text, mode="eval").body
+        if (isinstance(node, ast.Constant)): return text
+        value = _evaluate_node(node)
+    except (SyntaxError, ValueError) as e:
+        return text
+    return f"-0x{-value:x}" if (value < 0) else f"0x{value:x}"
+
+# sha256 of a file's contents. Files are only read again when they change.
+@functools.lru_cache(maxsize=256)
+def _file_digest(path: str, mtime_ns: int, size: int) -> str:
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+def _source_digest(path: str) -> str:
+    st = os.stat(path)
+    return _file_digest(path, st.st_mtime_ns, st.st_size)
+
 # This class iterates over all of the lines in an input file and parses them as instructions,
 # then emits them to a file
 # You should provide it with an instruction factory that maps instruction names to instruction
@@ -144,6 +271,34 @@ class SimpleAsmParser:
         # This dict maps label names to SimpleAsmLabel objects
         self.label_positions: dict = {}
 
+        # How chatty should emitting be? 0 is silent, 1 or more logs each instruction as it's
+        # emitted.
+        self.verbosity: int = 0
+
+        # How wide is a machine word in bits? This is used by the binary output formats.
+        self.word_bits: int = 16
+
+        # This dict maps output format names to (function, is_binary) pairs. Each function takes
+        # this parser and an opened file object and writes the program to the file.
+        self.output_formats: dict = dict(DEFAULT_OUTPUT_FORMATS)
+
+        # '.equ' constants and '.macro' definitions seen so far, by name
+        self.symbols: dict = {}
+        self.macros: dict = {}
+        self.macro_uses: int = 0
+
+        # Every file pulled in by '.include', so that cached output can be checked against them
+        self.included_files: list = []
+        self.top_filename: str = None
+
+        # Version of the assembly language built on top of this parser. Assemblers should bump it
+        # whenever their output changes so that cached output isn't reused.
+        self.version: str = ""
+
+        # Source files, beyond this one and the ones the instruction classes are in, that the
+        # output depends on (an optimizer, say). cache_key() hashes what's in them.
+        self.cache_sources: list = []
+
     # This method should be called to register new instructions. Example usage:
     #     .register_instruction("add", AddInstruction)
     # Any instruction added should inherit from Instruction.
@@ -153,40 +308,671 @@ class SimpleAsmParser:
 
     # This method performs a first pass on assembly file parsing (reads all instructions and
     # arguments in and constructs a list of instructions)
-    # You should pass in an opened file object
-    def parse_file(self, f) -> None:
-        address = 0
-        for line_number, line in enumerate(f, start=1):
-            # Trim comment from end and whitespace
-            line = line.split("#", maxsplit=1)[0]
-            line = line.strip()
-
-            # If the line was just a comment, then split and strip should reduce it to ""
-            if (line == ""): continue
+    # You should pass in an opened file object. 'filename' is used to find files named by
+    # '.include'; it defaults to the file object's name.
+    def parse_file(self, f, filename: str = None) -> None:
+        filename = getattr(f, "name", None) if (filename is None) else filename
+        if (not isinstance(filename, str)): filename = None
 
+        self.top_filename = filename
+        address = 0
+        previous = None
+        lines = self._source_lines(f, filename)
+        for loc, line in self._expand(lines, [filename], 0):
             # Check if it's a label, otherwise try to make it an instruction
             if (line.endswith(":")):
-                label = SimpleAsmLabel(line, line_number)
+                label = SimpleAsmLabel(line, loc.line_number)
                 label.address = address
+                label.index = len(self.firstpass)
                 self.label_positions[label.name] = label
+                previous = None
             else:
+                spl = line.split(maxsplit=1)
+                mnem = spl[0]
+                argtext = "" if (len(spl) <= 1) else spl[1]
+                if (mnem not in self.known_instructions):
+                    raise self._error(loc, f"Unknown instruction {mnem}", "Line")
+
                 try:
-                    spl = line.split(maxsplit=1)
-                    mnem = spl[0]
-                    argtext = "" if (len(spl) <= 1) else spl[1]
-                    instr = self.known_instructions[mnem](argtext, line_number, address)
-                except KeyError as e:
-                    raise ValueError(f"Line {line_number}: Unknown instruction {mnem}")
-
-                instr.parse()
+                    instr = self.known_instructions[mnem](argtext, loc.line_number, address)
+                    instr.previous = previous
+                    instr.parse()
+                except ValueError as e:
+                    raise ValueError(self._annotate(loc, str(e))) from None
                 self.firstpass.append(instr)
                 address += instr.get_size_words()
+                previous = instr if (instr.falls_through) else None
+
+    # Yields (location, text) for every non-blank line of a file, with comments and surrounding
+    # whitespace removed.
+    def _source_lines(self, f, filename, parent=None):
+        for line_number, line in enumerate(f, start=1):
+            # Trim comment from end and whitespace
+            line = line.split("#", maxsplit=1)[0]
+            line = line.strip()
+
+            # If the line was just a comment, then split and strip should reduce it to ""
+            if (line == ""): continue
+            yield (SimpleAsmLocation(filename, line_number, parent), line)
+
+    # Adds the file and macro uses that led to 'loc' to an error message, unless it's a line of the
+    # top-level file.
+    def _annotate(self, loc, msg: str) -> str:
+        if (loc.filename != self.top_filename):
+            msg = f"{loc.filename}: {msg}"
+        while (loc.parent is not None):
+            loc = loc.parent
+            msg += f" (in {loc.context} used at {loc.filename or '<input>'} line {loc.line_number})"
+        return msg
+
+    def _error(self, loc, msg: str, prefix: str = "line") -> ValueError:
+        return ValueError(self._annotate(loc, f"{prefix} {loc.line_number}: {msg}"))
+
+    # Replaces every '.equ' constant in 'text' with its value
+    def _substitute(self, text: str, symbols: dict) -> str:
+        if (len(symbols) == 0): return text
+        return _IDENTIFIER.sub(lambda m: symbols.get(m.group(0), m.group(0)), text)
+
+    # Substitutes constants in the operands of a line only, so that mnemonics and labels that
+    # happen to share a name with a constant are left alone
+    def _substitute_operands(self, line: str, symbols: dict) -> str:
+        spl = line.split(maxsplit=1)
+        if (len(spl) == 1): return line
+        return spl[0] + " " + self._substitute(spl[1], symbols)
+
+    # Collects lines up to the 'closer' that matches an 'opener' that's already been read,
+    # allowing for nested opener/closer pairs. The closer itself is consumed.
+    def _collect_block(self, loc, lines, opener: str, closer: str) -> list:
+        body = []
+        depth = 0
+        for l, text in lines:
+            word = text.split(maxsplit=1)[0]
+            if (word == opener):
+                depth += 1
+            elif (word == closer):
+                if (depth == 0): return body
+                depth -= 1
+            body.append((l, text))
+        raise self._error(loc, f"{opener} without a matching {closer}")
+
+    # Expands directives in a stream of (location, text) lines and yields the labels and
+    # instructions that are left. This is done lazily, so expansion and parsing happen in the same
+    # pass over the source. 'files' is the stack of files being included, used to catch cycles.
+    def _expand(self, lines, files: list, depth: int):
+        if (depth > MAX_EXPANSION_DEPTH):
+            raise ValueError(f"directives nested more than {MAX_EXPANSION_DEPTH} deep; "
+                             "is a macro using itself?")
+
+        for loc, line in lines:
+            word = line.split(maxsplit=1)[0]
+
+            if (word == ".macro"):
+                args = line.split()[1:]
+                if (len(args) == 0):
+                    raise self._error(loc, ".macro needs a name")
+                body = self._collect_block(loc, lines, ".macro", ".endm")
+                if (any(text.split(maxsplit=1)[0] == ".macro" for (l, text) in body)):
+                    raise self._error(loc, "macros can't be defined inside other macros")
+                self.macros[args[0]] = SimpleAsmMacro(args[0], args[1:], body, loc)
+                continue
+
+            line = self._substitute_operands(line, self.symbols) if (word != ".equ") else line
+            args = line.split()
+
+            if (word == ".equ"):
+                args = line.replace(",", " ").split(maxsplit=2)
+                if (len(args) != 3):
+                    raise self._error(loc, "expected '.equ NAME value'")
+                self.symbols[args[1]] = _constant_text(self._substitute(args[2], self.symbols))
+            elif (word == ".include"):
+                if (len(args) != 2):
+                    raise self._error(loc, "expected '.include \"filename\"'")
+                path = args[1].strip("\"'")
+                if ((not os.path.isabs(path)) and (loc.filename is not None)):
+                    path = os.path.join(os.path.dirname(loc.filename), path)
+                if (os.path.abspath(path) in (os.path.abspath(p) for p in files if p)):
+                    raise self._error(loc, f"{path} includes itself")
+                try:
+                    incfile = open(path, 'r')
+                except OSError as e:
+                    raise self._error(loc, f"couldn't include {path}: {e.strerror}")
+
+                with incfile:
+                    self.included_files.append(os.path.abspath(path))
+                    yield from self._expand(self._source_lines(incfile, path, loc.parent),
+                                            files + [path], depth + 1)
+            elif (word == ".rept"):
+                if (len(args) != 2):
+                    raise self._error(loc, "expected '.rept count'")
+                try:
+                    count = _evaluate(args[1])
+                except ValueError as e:
+                    raise self._error(loc, f"couldn't evaluate repeat count {args[1]}")
+                body = self._collect_block(loc, lines, ".rept", ".endr")
+                for i in range(count):
+                    yield from self._expand(iter(body), files, depth + 1)
+            elif (word in (".endm", ".endr")):
+                raise self._error(loc, f"{word} without a matching opening directive")
+            elif (word in self.macros):
+                macro = self.macros[word]
+                self.macro_uses += 1
+                yield from self._expand(macro.expand(args[1:], loc, self.macro_uses, self),
+                                        files, depth + 1)
+            elif (word.startswith(".")):
+                raise self._error(loc, f"Unknown directive {word}")
+            else:
+                yield (loc, line)
+
+    # Recomputes the offset of every instruction and the address of every label. This should be
+    # called after instructions in 'firstpass' are replaced, added or removed.
+    def relocate(self) -> None:
+        offsets = []
+        address = 0
+        for instr in self.firstpass:
+            instr.offset = address
+            offsets.append(address)
+            address += instr.get_size_words()
+        offsets.append(address)
+
+        for label in self.label_positions.values():
+            label.address = offsets[label.index]
+
+    # Removes the instructions at the given indices in 'firstpass'. Labels that pointed at a
+    # removed instruction move to the next instruction that's kept.
+    def remove_instructions(self, indices) -> None:
+        indices = set(indices)
+        kept_before = []
+        kept = []
+        for i, instr in enumerate(self.firstpass):
+            kept_before.append(len(kept))
+            if (i not in indices):
+                kept.append(instr)
+        kept_before.append(len(kept))
+
+        self.firstpass = kept
+        for label in self.label_positions.values():
+            label.index = kept_before[label.index]
+        self.relocate()
+
+    # Returns a hash that identifies the output of assembling 'source' with this parser. It covers
+    # the source text, every registered instruction class, the parser and assembler versions, any
+    # extra options (e.g. output format) that change the output, and the code behind all of it:
+    # this file, the files the instruction classes are in and 'cache_sources'. Editing any of
+    # those changes the key even if nobody remembers to bump a version.
+    def cache_key(self, source: str, *options) -> str:
+        h = hashlib.sha256()
+        h.update(f"{SIMPLEASMPARSER_VERSION}\0{self.version}\0".encode())
+        for mnem, instr in sorted(self.known_instructions.items()):
+            h.update(f"{mnem}={instr.__module__}.{instr.__qualname__}\0".encode())
+        for digest in sorted(_source_digest(path) for path in self._code_files()):
+            h.update(f"{digest}\0".encode())
+        for option in options:
+            h.update(f"{option!r}\0".encode())
+        h.update(source.encode())
+        return h.hexdigest()
+
+    def _code_files(self) -> set:
+        files = {os.path.abspath(__file__)}
+        for instr in self.known_instructions.values():
+            module = sys.modules.get(instr.__module__)
+            if (getattr(module, "__file__", None) is not None):
+                files.add(os.path.abspath(module.__file__))
+        files.update(os.path.abspath(path) for path in self.cache_sources)
+        return files
+
+    # Returns the total size of the program in machine words
+    def size_words(self) -> int:
+        return sum(instr.get_size_words() for instr in self.firstpass)
+
+    # This generator takes the fully parsed instructions and fully resolved label positions and
+    # yields the text for each instruction one at a time. Nothing is accumulated, so memory and
+    # time both stay linear in the size of the program.
+    def emit_iter(self):
+        for instr in self.firstpass:
+            if (self.verbosity >= 1):
+                print(f"emitting instruction {instr.MNEMONIC}")
+            yield instr.emit(self)
+
+    # This method streams the emitted program straight into an opened file object.
+    def emit_to(self, f) -> None:
+        for chunk in self.emit_iter():
+            f.write(chunk)
 
     # This method takes the fully parsed instructions and fully resolved label positions and emits
     # everything that is to be written to the output file as a string
     def emit(self) -> str:
-        outputstr = ""
+        return "".join(self.emit_iter())
+
+    # Returns the whole program as an array of machine words, with no text formatting involved.
+    # The array supports the buffer protocol, so e.g. numpy.frombuffer() can wrap it without a copy.
+    def emit_words(self) -> array:
+        words = array(self.word_typecode())
         for instr in self.firstpass:
-            print(f"emitting instruction {instr.MNEMONIC}")
-            outputstr += instr.emit(self)
-        return outputstr
+            if (self.verbosity >= 1):
+                print(f"emitting instruction {instr.MNEMONIC}")
+            words.extend(instr.emit_words(self))
+        return words
+
+    # Returns the program as a relocatable SimpleAsmObject: every instruction's words with the
+    # label addresses left out, along with where they go. Labels that are used but not defined
+    # here are left for the linker to find in another module.
+    def emit_object(self, name: str = None) -> "SimpleAsmObject":
+        labels = dict(self.label_positions)
+        for instr in self.firstpass:
+            for i, label, mask in instr.label_references():
+                if (label not in labels):
+                    labels[label] = SimpleAsmLabel(label + ":", instr.line_number)
+                    labels[label].address = 0
+
+        # emit with the placeholder labels in place, then put the real ones back
+        saved, self.label_positions = self.label_positions, labels
+        try:
+            instructions = []
+            for instr in self.firstpass:
+                words = instr.emit_words(self)
+                refs = instr.label_references()
+                for i, label, mask in refs:
+                    words[i] &= ~mask
+                instructions.append(SimpleAsmObjectInstruction(
+                    words, refs, instr.falls_through, instr.MNEMONIC, instr.line_number))
+        finally:
+            self.label_positions = saved
+
+        if (name is None):
+            name = os.path.splitext(os.path.basename(self.top_filename or "module"))[0]
+        return SimpleAsmObject(name, instructions,
+                               {l.name: l.index for l in self.label_positions.values()},
+                               self.word_bits)
+
+    # Returns the whole program as a raw image with each word in the given byte order
+    def emit_bytes(self, byteorder: str = "little") -> bytes:
+        nbytes = (self.word_bits + 7) // 8
+        words = self.emit_words()
+        if (words.itemsize == nbytes):
+            if (byteorder != sys.byteorder):
+                words.byteswap()
+            return words.tobytes()
+        return b"".join(w.to_bytes(nbytes, byteorder) for w in words)
+
+    # Returns the typecode of the smallest array type that can hold a machine word
+    def word_typecode(self) -> str:
+        for t in "BHIL":
+            if ((array(t).itemsize * 8) >= self.word_bits):
+                return t
+        return "Q"
+
+    # This method should be called to register new output formats. Example usage:
+    #     .register_output_format("intel_hex", write_intel_hex, binary=False)
+    # 'fn' is called with this parser and an opened file object.
+    def register_output_format(self, name: str, fn, binary: bool = False) -> None:
+        self.output_formats[name] = (fn, binary)
+
+    # Is the given output format binary? If it is, its file needs to be opened with 'wb'.
+    def output_format_is_binary(self, name: str) -> bool:
+        return self.output_formats[name][1]
+
+    # Writes the program to an opened file object in the named output format
+    def emit_format(self, name: str, f) -> None:
+        try:
+            fn, binary = self.output_formats[name]
+        except KeyError as e:
+            raise ValueError(f"Unknown output format {name}. "
+                             f"Known formats are {', '.join(self.output_formats)}")
+        fn(self, f)
+
+# Output formats that every parser knows about
+
+# Commented hex for $readmemh, exactly as the instructions emit it
+def _write_hex(p, f):
+    p.emit_to(f)
+
+# One word per line with no comments. $readmemh reads this just as well as the commented hex, and
+# it's the usual layout of a .mem file.
+def _write_hex_compact(p, f):
+    ndigits = (p.word_bits + 3) // 4
+    f.write("".join(f"{w:0{ndigits}x}\n" for w in p.emit_words()))
+
+def _write_bin_le(p, f):
+    f.write(p.emit_bytes("little"))
+
+def _write_bin_be(p, f):
+    f.write(p.emit_bytes("big"))
+
+# Xilinx memory coefficient file
+def _write_coe(p, f):
+    ndigits = (p.word_bits + 3) // 4
+    f.write("memory_initialization_radix=16;\n")
+    f.write("memory_initialization_vector=\n")
+    f.write(",\n".join(f"{w:0{ndigits}x}" for w in p.emit_words()))
+    f.write(";\n")
+
+# Relocatable object module for SimpleAsmLinker
+def _write_obj(p, f):
+    p.emit_object().save(f)
+
+DEFAULT_OUTPUT_FORMATS = {
+    "hex": (_write_hex, False),
+    "hex_compact": (_write_hex_compact, False),
+    "bin_le": (_write_bin_le, True),
+    "bin_be": (_write_bin_be, True),
+    "coe": (_write_coe, False),
+    "obj": (_write_obj, False),
+}
+
+
+# One instruction of a relocatable object: its machine words with the label addresses zeroed,
+# and the label references that fill them in. It emits like any other instruction, so a linked
+# program is just a parser full of these.
+class SimpleAsmObjectInstruction(SimpleAsmInstruction):
+    def __init__(self, words: list, refs: list, falls_through: bool, mnemonic: str,
+                 line_number: int, source: str = None):
+        super().__init__("", line_number, 0)
+        self.words = list(words)
+        self.refs = [tuple(r) for r in refs]
+        self.falls_through = falls_through
+        self.MNEMONIC = mnemonic
+        self.source = source
+        self.size_words = len(self.words)
+
+    def parse(self) -> None:
+        self.size_words = len(self.words)
+
+    def label_references(self) -> list:
+        return self.refs
+
+    def emit_words(self, parent) -> list:
+        words = list(self.words)
+        for i, label, mask in self.refs:
+            try:
+                address = parent.label_positions[label].address
+            except KeyError as e:
+                raise ValueError(f"{self.source or ''} line {self.line_number}: unknown label {label}")
+            shift = (mask & -mask).bit_length() - 1
+            if (((address << shift) & ~mask) != 0):
+                raise ValueError(f"{self.source or ''} line {self.line_number}: address {address} "
+                                 f"of {label} doesn't fit in the instruction")
+            words[i] |= (address << shift)
+        return words
+
+    def emit(self, parent) -> str:
+        ndigits = (parent.word_bits + 3) // 4
+        where = f"{self.source} line" if (self.source is not None) else "line"
+        words = " ".join(f"{w:0{ndigits}x}" for w in self.emit_words(parent))
+        return f"// {self.MNEMONIC:16} ({where} {self.line_number}, addr {self.offset})\n{words}\n\n"
+
+    def _as_list(self) -> list:
+        return [self.MNEMONIC, self.line_number, self.words, [list(r) for r in self.refs],
+                self.falls_through]
+
+# A relocatable module: a list of SimpleAsmObjectInstructions and the index of the instruction that
+# each label is at. Saved as JSON.
+class SimpleAsmObject:
+    FORMAT = "simpleasm-object"
+    FORMAT_VERSION = 1
+
+    def __init__(self, name: str, instructions: list, labels: dict, word_bits: int = 16):
+        self.name = name
+        self.instructions = instructions
+        self.labels = labels
+        self.word_bits = word_bits
+        for instr in instructions:
+            instr.source = name
+
+    def size_words(self) -> int:
+        return sum(instr.get_size_words() for instr in self.instructions)
+
+    # Labels that are used here but defined in some other module
+    def externals(self) -> set:
+        return {label for instr in self.instructions for (i, label, mask) in instr.refs
+                if (label not in self.labels)}
+
+    def save(self, f) -> None:
+        json.dump({
+            "format": self.FORMAT,
+            "version": self.FORMAT_VERSION,
+            "name": self.name,
+            "word_bits": self.word_bits,
+            "labels": self.labels,
+            "instructions": [instr._as_list() for instr in self.instructions],
+        }, f)
+        f.write("\n")
+
+    @classmethod
+    def load(cls, f, name: str = None) -> "SimpleAsmObject":
+        d = json.load(f)
+        if ((d.get("format") != cls.FORMAT) or (d.get("version") != cls.FORMAT_VERSION)):
+            raise ValueError(f"{getattr(f, 'name', 'input')} isn't a version {cls.FORMAT_VERSION} "
+                             "object module")
+        instructions = [SimpleAsmObjectInstruction(words, refs, falls_through, mnem, line_number)
+                        for (mnem, line_number, words, refs, falls_through) in d["instructions"]]
+        return cls(d["name"] if (name is None) else name, instructions, d["labels"], d["word_bits"])
+
+
+# Combines object modules into one program. The first module added goes first and so holds the
+# entry point at address 0; the others follow in the order they were added.
+#
+# Labels are local to their module. A label that a module uses but doesn't define is looked up in
+# the other modules, and has to be defined in exactly one of them. In the linked program every
+# label is available as 'module.label', and labels that only one module defines also keep their
+# plain name.
+#
+# With 'dedup', blocks of code that are the same in more than one place are only kept once. There's
+# no call and return, so a block has to be self-contained to be shared: it runs from an instruction
+# that nothing falls through into, up to an instruction that doesn't fall through (an unconditional
+# jump), and its label references have to land in the same places. A block like that can be
+# replaced by an identical copy elsewhere, or by the tail end of a longer block that it matches;
+# labels and jumps into it are pointed at the copy. That's repeated until nothing changes, since
+# merging some blocks can make the jumps in others identical.
+class SimpleAsmLinker:
+    def __init__(self):
+        self.modules: list = []
+        self.words_before: int = 0
+        self.words_after: int = 0
+        self.shared_blocks: int = 0
+
+    def add(self, obj: SimpleAsmObject) -> None:
+        if (obj.name in (m.name for m in self.modules)):
+            raise ValueError(f"there's already a module called {obj.name}")
+        if (len(self.modules) and (obj.word_bits != self.modules[0].word_bits)):
+            raise ValueError(f"{obj.name} has {obj.word_bits}-bit words, but "
+                             f"{self.modules[0].name} has {self.modules[0].word_bits}-bit words")
+        self.modules.append(obj)
+
+    # Returns the global index of the instruction each module's labels are at, and each
+    # instruction's label references as (word index, global index, mask)
+    def _resolve(self):
+        bases = []
+        n = 0
+        for m in self.modules:
+            bases.append(n)
+            n += len(m.instructions)
+
+        owners = {}
+        for m, base in zip(self.modules, bases):
+            for label in m.labels:
+                owners.setdefault(label, []).append(m.name)
+
+        positions = {}
+        for m, base in zip(self.modules, bases):
+            for label, index in m.labels.items():
+                positions[f"{m.name}.{label}"] = base + index
+
+        refs = []
+        names = []
+        for m in self.modules:
+            for instr in m.instructions:
+                r = []
+                for i, label, mask in instr.refs:
+                    if (label in m.labels):
+                        name = f"{m.name}.{label}"
+                    elif (len(owners.get(label, ())) == 1):
+                        name = f"{owners[label][0]}.{label}"
+                    elif (label in owners):
+                        raise ValueError(f"{m.name} line {instr.line_number}: label {label} is "
+                                         f"defined in more than one module ({', '.join(owners[label])})")
+                    else:
+                        raise ValueError(f"{m.name} line {instr.line_number}: label {label} isn't "
+                                         "defined in any module")
+                    r.append((i, positions[name], mask, name))
+                refs.append(r)
+        return positions, refs, owners
+
+    # Returns a SimpleAsmParser holding the linked program, ready to emit in any output format
+    def link(self, dedup: bool = True) -> SimpleAsmParser:
+        if (len(self.modules) == 0):
+            raise ValueError("nothing to link")
+        positions, refs, owners = self._resolve()
+        instrs = [instr for m in self.modules for instr in m.instructions]
+        n = len(instrs)
+
+        forward = list(range(n + 1))
+        def canon(i):
+            while (forward[i] != i):
+                forward[i] = forward[forward[i]]
+                i = forward[i]
+            return i
+
+        if (dedup):
+            self._dedup(instrs, refs, forward, canon)
+
+        kept = [i for i in range(n) if (canon(i) == i)]
+        new_index = {i: k for k, i in enumerate(kept)}
+        new_index[n] = len(kept)
+
+        p = SimpleAsmParser()
+        p.word_bits = self.modules[0].word_bits
+        for i in kept:
+            old = instrs[i]
+            new = SimpleAsmObjectInstruction(old.words, [(w, name, mask) for (w, t, mask, name) in refs[i]],
+                                             old.falls_through, old.MNEMONIC, old.line_number)
+            new.source = old.source
+            p.firstpass.append(new)
+
+        for name, position in positions.items():
+            module, label = name.rsplit(".", maxsplit=1)
+            aliases = [name] + ([label] if (len(owners[label]) == 1) else [])
+            for alias in aliases:
+                l = SimpleAsmLabel(alias + ":", 0)
+                l.index = new_index[canon(position)]
+                p.label_positions[alias] = l
+        p.relocate()
+
+        self.words_before = sum(instr.get_size_words() for instr in instrs)
+        self.words_after = p.size_words()
+        return p
+
+    def _dedup(self, instrs, refs, forward, canon) -> None:
+        n = len(instrs)
+
+        # instructions that something falls through into can't be dropped
+        entered = [False] * (n + 1)
+        entered[0] = True
+        for i, instr in enumerate(instrs):
+            entered[i + 1] = instr.falls_through
+
+        blocks = []
+        start = 0
+        for i, instr in enumerate(instrs):
+            if (not instr.falls_through):
+                blocks.append((start, i + 1))
+                start = i + 1
+
+        # The signature of instrs[a:b], with references inside it relative to 'a'
+        def signature(a, b):
+            sig = []
+            for i in range(a, b):
+                r = []
+                for (w, t, mask, name) in refs[i]:
+                    t = canon(t)
+                    r.append((w, mask, ("in", t - a) if (a <= t < b) else ("at", t)))
+                sig.append((tuple(instrs[i].words), tuple(r)))
+            return tuple(sig)
+
+        changed = True
+        while (changed):
+            changed = False
+            live = sorted((blk for blk in blocks if (canon(blk[0]) == blk[0])),
+                          key=lambda blk: (blk[0] - blk[1], blk[0]))
+            tails = {}
+            for a, b in live:
+                sig = signature(a, b)
+                if ((not entered[a]) and (sig in tails)):
+                    where = tails[sig]
+                    for i in range(a, b):
+                        forward[i] = where + (i - a)
+                    self.shared_blocks += 1
+                    changed = True
+                    continue
+                for s in range(a, b):
+                    tails.setdefault(signature(s, b), s)
+
+
+# An on-disk cache of assembler output, keyed by SimpleAsmParser.cache_key(). Each entry can list
+# files that it depends on (e.g. included files); if any of them has changed since the entry was
+# stored, the entry is treated as a miss. The cache holds at most 'max_entries' entries and evicts
+# the least recently used ones first.
+class SimpleAsmCache:
+    def __init__(self, directory: str, max_entries: int = 1024):
+        self.directory = directory
+        self.max_entries = max_entries
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key: str, ext: str) -> str:
+        return os.path.join(self.directory, key + ext)
+
+    @staticmethod
+    def _hash_file(path: str) -> str:
+        try:
+            with open(path, 'rb') as f:
+                return hashlib.sha256(f.read()).hexdigest()
+        except OSError as e:
+            return None
+
+    def _write_atomic(self, path: str, data: bytes) -> None:
+        fd, tmp = tempfile.mkstemp(dir=self.directory)
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+
+    # Returns the cached output for 'key' as bytes, or None if there isn't any.
+    def get(self, key: str) -> bytes:
+        try:
+            with open(self._path(key, ".deps"), 'r') as f:
+                deps = [line.rstrip("\n").split(" ", maxsplit=1) for line in f if line.strip()]
+            with open(self._path(key, ".out"), 'rb') as f:
+                data = f.read()
+        except OSError as e:
+            return None
+
+        for digest, path in deps:
+            if (self._hash_file(path) != digest):
+                return None
+
+        # mark the entry as recently used
+        os.utime(self._path(key, ".out"))
+        return data
+
+    # Stores 'data' under 'key', noting the current contents of every file in 'deps'.
+    def put(self, key: str, data: bytes, deps=()) -> None:
+        lines = [f"{self._hash_file(path)} {path}\n" for path in deps]
+        self._write_atomic(self._path(key, ".out"), data)
+        self._write_atomic(self._path(key, ".deps"), "".join(lines).encode())
+        self.evict()
+
+    # Removes the least recently used entries until there are at most 'max_entries' left.
+    def evict(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if (name.endswith(".out")):
+                try:
+                    entries.append((os.stat(os.path.join(self.directory, name)).st_mtime, name[:-4]))
+                except OSError as e:
+                    pass
+
+        entries.sort()
+        for mtime, key in entries[:max(0, len(entries) - self.max_entries)]:
+            for ext in (".out", ".deps"):
+                try:
+                    os.remove(self._path(key, ext))
+                except OSError as e:
+                    pass